@@ -1,7 +1,9 @@
 import threading
 import queue
+import time
 from src.config import load_config
 from src.sounds import SoundPlayer
+from src.audio_bus import AudioBus
 from src.wake import WakeController
 from src.stt import SpeechToText
 from src.llm import LlmEngine
@@ -9,25 +11,55 @@ from src.tts import TextToSpeech
 from src.actions import ActionRouter
 from src.pipeline import Pipeline
 from src.model_downloader import ensure_models
+from src.startup import EngineLoader
+from src.residency import ResidencyManager
+from src.hot_reload import HotReloader
+from src import tracing
 
 
 def main() -> None:
+    started = time.perf_counter()
     config = load_config()
     ensure_models(config)
+    tracing.configure(config)
 
     events: queue.Queue = queue.Queue()
     sound_player = SoundPlayer(config)
+    bus = AudioBus(config)
+    bus.start()
 
-    wake = WakeController(config, events, sound_player)
-    stt = SpeechToText(config, sound_player)
-    llm = LlmEngine(config)
-    tts = TextToSpeech(config)
-    actions = ActionRouter(config)
-    pipeline = Pipeline(config, events, stt, llm, tts, actions, sound_player)
+    # Los modelos se cargan en paralelo; el wake escucha desde ya y los wakes
+    # que lleguen antes quedan en la cola de eventos
+    loader = EngineLoader()
+    loader.add("STT", lambda: SpeechToText(config, sound_player, bus))
+    loader.add("LLM", lambda: LlmEngine(config))
+    loader.add("TTS", lambda: TextToSpeech(config))
+    loader.add("Acciones", lambda: ActionRouter(config))
+    loader.start()
+
+    wake = WakeController(config, events, sound_player, bus, ready=loader.ready)
+
+    def run_pipeline():
+        try:
+            stt, llm, tts = loader.get("STT"), loader.get("LLM"), loader.get("TTS")
+            residency = ResidencyManager(config)
+            for engine in (stt, llm, tts):
+                residency.register(engine.residency)
+            residency.start()
+            pipeline = Pipeline(
+                config, events, stt, llm, tts, loader.get("Acciones"), sound_player, residency=residency,
+            )
+        except Exception as e:
+            print(f"[Inicio] No se pudo arrancar el asistente: {e}")
+            wake.stop_event.set()
+            return
+        print(f"[Inicio] Asistente listo en {time.perf_counter() - started:.2f} s")
+        HotReloader(config, pipeline).start()
+        pipeline.run()
 
     threads = [
         threading.Thread(target=wake.run, daemon=True),
-        threading.Thread(target=pipeline.run, daemon=True),
+        threading.Thread(target=run_pipeline, daemon=True),
     ]
 
     for t in threads:
@@ -39,6 +71,7 @@ def main() -> None:
             t.join()
     except KeyboardInterrupt:
         print("\nCerrando asistente...")
+        bus.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+"""Prueba de carga del modo servidor: N clientes simultáneos hablando al asistente.
+
+Uso (con el servidor arrancado: python -m src.server):
+    python -m bench.load_test --sessions 4 --turns 3
+    python -m bench.load_test --url ws://192.168.1.10:8765 --wav bench/fixtures/audio
+
+Cada sesión envía WAV de los fixtures a ritmo real (en bloques de `--chunk-ms`),
+seguidos de silencio para que el VAD del servidor cierre la frase (o de un
+{"type": "end"} con --send-end), y espera al "done" antes del siguiente turno.
+Al final se muestran p50/p95 de los tiempos del servidor y del cliente, y
+cuántos turnos se respondieron desde la caché de respuestas.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+import numpy as np
+
+from bench.run import read_wav
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def _session(url: str, index: int, clips: list[np.ndarray], args, results: dict):
+    import websockets
+
+    async with websockets.connect(url, max_size=1 << 24) as ws:
+        await ws.send(json.dumps({"type": "hello", "session": f"carga-{index}"}))
+        ready = json.loads(await ws.recv())
+        sample_rate = ready.get("sample_rate", 16000)
+        chunk = int(sample_rate * args.chunk_ms / 1000)
+        silence = np.zeros(int(sample_rate * args.silence_s), dtype=np.int16)
+
+        for turn in range(args.turns):
+            audio = clips[(turn + index) % len(clips)]
+            tail = np.zeros(0, dtype=np.int16) if args.send_end else silence
+            stream = np.concatenate([audio, tail])
+            started = time.perf_counter()
+            for pos in range(0, len(stream), chunk):
+                await ws.send(stream[pos:pos + chunk].tobytes())
+                # Ritmo real: el cliente es un micrófono, no un fichero
+                await asyncio.sleep(max(0.0, started + (pos + chunk) / sample_rate - time.perf_counter()))
+            if args.send_end:
+                await ws.send(json.dumps({"type": "end"}))
+            spoken = time.perf_counter()
+
+            first_audio = None
+            audio_s = 0.0
+            while True:
+                message = await asyncio.wait_for(ws.recv(), args.timeout)
+                if isinstance(message, bytes):
+                    if first_audio is None:
+                        first_audio = time.perf_counter()
+                    continue
+                event = json.loads(message)
+                if event["type"] == "audio":
+                    audio_s += event["samples"] / event["sample_rate"]
+                if event["type"] == "busy":
+                    results["busy"] += 1
+                    break
+                if event["type"] == "done":
+                    results["cached"] += bool(event.get("cached"))
+                    timings = event.get("timings", {})
+                    for key, value in timings.items():
+                        results["server"].setdefault(key, []).append(value)
+                    if first_audio is not None:
+                        results["client"].setdefault("first_audio_ms", []).append((first_audio - spoken) * 1000)
+                    results["client"].setdefault("turn_ms", []).append((time.perf_counter() - spoken) * 1000)
+                    results["turns"] += 1
+                    results["audio_s"] += audio_s
+                    break
+
+
+async def _run(args) -> dict:
+    fixtures = Path(args.wav)
+    paths = sorted(fixtures.glob("*.wav")) if fixtures.is_dir() else [fixtures]
+    if not paths:
+        raise SystemExit(f"[Carga] Sin WAV en {fixtures}")
+    clips = [read_wav(p, args.sample_rate) for p in paths]
+    results = {"server": {}, "client": {}, "turns": 0, "busy": 0, "cached": 0, "audio_s": 0.0}
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(_session(args.url, i, clips, args, results) for i in range(args.sessions)),
+        return_exceptions=True,
+    )
+    results["wall_s"] = time.perf_counter() - started
+    results["errors"] = [str(o) for o in outcomes if isinstance(o, Exception)]
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.load_test", description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="ws://127.0.0.1:8765")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--wav", default="bench/fixtures/audio", help="WAV o carpeta de WAV")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--chunk-ms", type=int, default=30)
+    parser.add_argument("--silence-s", type=float, default=2.0, help="silencio tras cada frase")
+    parser.add_argument("--send-end", action="store_true", help="cerrar la frase con 'end' en vez de silencio")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(_run(args))
+    print(f"[Carga] {args.sessions} sesiones, {results['turns']} turnos en {results['wall_s']:.1f} s "
+          f"({results['turns'] / results['wall_s']:.2f} turnos/s, {results['audio_s']:.1f} s de voz generada), "
+          f"{results['busy']} rechazados por cola llena, {results['cached']} respondidos desde la caché")
+    for origin in ("server", "client"):
+        for key, values in sorted(results[origin].items()):
+            print(f"  {origin}.{key:<16} p50 {_percentile(values, 50):8.1f} ms   "
+                  f"p95 {_percentile(values, 95):8.1f} ms   (n={len(values)})")
+    for error in results["errors"]:
+        print(f"[Carga] Error en una sesión: {error}")
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
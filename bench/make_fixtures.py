@@ -0,0 +1,74 @@
+"""Regenera los WAV de prueba de bench/fixtures/audio con espeak-ng.
+
+Uso (desde la raíz del repo):
+    pip install espeakng-loader
+    python -m bench.make_fixtures
+
+Cada frase de FRASES se sintetiza con la voz española de espeak-ng (sin
+modelos que descargar), se remuestrea a 16 kHz mono PCM16 y se guarda junto a
+un .txt con su transcripción. La voz es sintética y siempre la misma: sirve
+para comparar ejecuciones entre sí, no para medir el WER real del asistente.
+"""
+import ctypes
+import sys
+import wave
+from pathlib import Path
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+SAMPLE_RATE = 16000
+FRASES = {
+    "abre_spotify": "Abre Spotify.",
+    "tiempo_madrid": "¿Qué tiempo hace hoy en Madrid?",
+    "musica_navegador": "Pon algo de música en el navegador.",
+    "gatos": "Cuéntame algo sobre los gatos.",
+}
+
+
+def synthesize(text: str, voice: str = "es", rate: int = 150) -> tuple[np.ndarray, int]:
+    """PCM int16 mono de espeak-ng y su frecuencia de muestreo."""
+    import espeakng_loader
+
+    lib = ctypes.cdll.LoadLibrary(espeakng_loader.get_library_path())
+    callback_type = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(ctypes.c_short), ctypes.c_int, ctypes.c_void_p)
+    chunks = []
+
+    def on_audio(wav, samples, _events):
+        if samples > 0:
+            chunks.append(np.ctypeslib.as_array(wav, shape=(samples,)).copy())
+        return 0
+
+    keep_alive = callback_type(on_audio)
+    # AUDIO_OUTPUT_SYNCHRONOUS (2): la síntesis vuelve cuando ha entregado todo el audio
+    rate_hz = lib.espeak_Initialize(2, 0, espeakng_loader.get_data_path().encode("utf-8"), 0)
+    lib.espeak_SetSynthCallback(keep_alive)
+    lib.espeak_SetVoiceByName(voice.encode("utf-8"))
+    lib.espeak_SetParameter(1, rate, 0)  # espeakRATE, palabras por minuto
+    data = text.encode("utf-8")
+    lib.espeak_Synth(data, len(data) + 1, 0, 0, 0, 0, None, None)  # espeakCHARS_AUTO
+    lib.espeak_Synchronize()
+    return (np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)), rate_hz
+
+
+def main(argv=None) -> int:
+    out = BENCH_DIR / "fixtures" / "audio"
+    out.mkdir(parents=True, exist_ok=True)
+    for name, text in FRASES.items():
+        pcm, rate = synthesize(text)
+        if rate != SAMPLE_RATE:
+            n = int(len(pcm) * SAMPLE_RATE / rate)
+            pcm = np.interp(np.linspace(0, len(pcm) - 1, n), np.arange(len(pcm)), pcm).astype(np.int16)
+        # Un poco de silencio delante: el VAD necesita tramas para arrancar
+        pcm = np.concatenate([np.zeros(SAMPLE_RATE // 4, dtype=np.int16), pcm])
+        with wave.open(str(out / f"{name}.wav"), "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(SAMPLE_RATE)
+            wf.writeframes(pcm.tobytes())
+        (out / f"{name}.txt").write_text(text + "\n", encoding="utf-8")
+        print(f"[Bench] {name}.wav: {len(pcm) / SAMPLE_RATE:.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+"""Micro-benchmarks de los motores del asistente con modelos de prueba.
+
+Uso (desde la raíz del repo):
+    python -m bench.run                       # todos los componentes
+    python -m bench.run --only stt,actions    # solo algunos
+    python -m bench.run --update-baseline     # guarda el resultado como referencia
+    python -m bench.make_fixtures             # regenera los WAV de prueba
+
+Los resultados se escriben en bench/results/ y se comparan con
+bench/baseline.json; el proceso sale con código 1 si alguna métrica empeora
+más que la tolerancia.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import wave
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+
+from src.config import AppConfig, load_config
+
+BENCH_DIR = Path(__file__).resolve().parent
+COMPONENTS = ("stt", "llm", "tts", "actions")
+
+
+class NullSink:
+    """Salida de audio que descarta el PCM sin esperar al ritmo real.
+
+    Imita el stream de PortAudio: un hilo llama al callback una y otra vez, así
+    la reproducción nunca frena a la síntesis y se mide solo la velocidad del TTS.
+    """
+
+    def __init__(self, sample_rate: int, blocksize: int, callback):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.callback = callback
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._pump, daemon=True, name="null-sink").start()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self._stop.set()
+
+    def _pump(self):
+        out = np.zeros((self.blocksize, 1), dtype=np.int16)
+        while not self._stop.is_set():
+            self.callback(out, self.blocksize, None, None)
+            time.sleep(0.0005)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks de STT, LLM, TTS y ActionRouter")
+    parser.add_argument("--config", default=str(BENCH_DIR / "bench.json"))
+    parser.add_argument("--only", default=",".join(COMPONENTS), help="componentes separados por comas")
+    parser.add_argument("--out", default=str(BENCH_DIR / "results" / "latest.json"))
+    parser.add_argument("--baseline", default=str(BENCH_DIR / "baseline.json"))
+    parser.add_argument("--tolerance", type=float, default=0.15, help="empeoramiento relativo permitido")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    bench = json.loads(Path(args.config).read_text(encoding="utf-8"))
+    base_config = load_config()
+    selected = [c.strip() for c in args.only.split(",") if c.strip()]
+
+    metrics = {}
+    for component in selected:
+        if component not in COMPONENTS:
+            print(f"[Bench] Componente desconocido: {component}")
+            return 2
+        print(f"[Bench] === {component} ===")
+        runner = globals()[f"bench_{component}"]
+        metrics.update(runner(base_config, bench.get(component, {})))
+
+    result = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "components": selected,
+        },
+        "metrics": metrics,
+    }
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"[Bench] Resultados en {out}")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        # Solo se sustituyen las métricas medidas: con --only se completa el baseline por partes
+        if baseline_path.exists():
+            previous = json.loads(baseline_path.read_text(encoding="utf-8"))
+            result["metrics"] = {**previous.get("metrics", {}), **metrics}
+            result["meta"]["components"] = sorted(set(previous["meta"].get("components", [])) | set(selected))
+        baseline_path.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"[Bench] Baseline actualizado: {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print("[Bench] Sin baseline; ejecuta con --update-baseline para crearlo")
+        return 0
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["metrics"]
+    regressions = compare(metrics, baseline, args.tolerance)
+    return 1 if regressions else 0
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Imprime la comparación y devuelve las métricas que han empeorado."""
+    regressions = []
+    for name in sorted(metrics):
+        value = metrics[name]
+        old = baseline.get(name)
+        if old is None or not old:
+            print(f"  {name:45s} {value:12.3f}   (nuevo)")
+            continue
+        change = (value - old) / abs(old)
+        worse = -change if name.endswith(("_per_s", "_speedup")) else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  << REGRESIÓN"
+            regressions.append(name)
+        print(f"  {name:45s} {value:12.3f}   baseline {old:12.3f}   {change:+7.1%}{flag}")
+    if regressions:
+        print(f"[Bench] {len(regressions)} métricas empeoran más de un {tolerance:.0%}")
+    return regressions
+
+
+def _config_with(base: AppConfig, section: str, overrides: dict) -> AppConfig:
+    data = copy.deepcopy(dict(base))
+    data.setdefault(section, {}).update(overrides)
+    return AppConfig(data)
+
+
+def _ensure_stand_in(section: str, cfg: dict):
+    """Descarga el modelo de prueba si no está (mismo mecanismo que model_downloader)."""
+    from src.model_downloader import _hf_download_file, _hf_snapshot
+
+    path = Path(cfg["model_path"])
+    if path.exists() or not cfg.get("hf_repo"):
+        return
+    if cfg.get("hf_file"):
+        _hf_download_file(cfg["hf_repo"], cfg["hf_file"], path, revision=None, label=f"bench {section}")
+    else:
+        _hf_snapshot(cfg["hf_repo"], path, revision=None, label=f"bench {section}")
+
+
+def read_wav(path: Path, sample_rate: int) -> np.ndarray:
+    """WAV PCM16 a int16 mono, remuestreado linealmente si hace falta."""
+    with wave.open(str(path), "rb") as wf:
+        channels = wf.getnchannels()
+        rate = wf.getframerate()
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path.name}: solo WAV de 16 bits")
+        audio = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    if rate != sample_rate:
+        n = int(len(audio) * sample_rate / rate)
+        audio = np.interp(np.linspace(0, len(audio) - 1, n), np.arange(len(audio)), audio).astype(np.int16)
+    return audio
+
+
+def _wer(reference: str, hypothesis: str) -> float:
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    if not ref:
+        return 0.0
+    dist = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, dist[0] = dist[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, dist[j] = dist[j], min(dist[j] + 1, dist[j - 1] + 1, prev + (r != h))
+    return dist[-1] / len(ref)
+
+
+def bench_stt(base: AppConfig, cfg: dict) -> dict:
+    from src.audio_bus import ArraySource
+    from src.stt import SpeechToText
+
+    _ensure_stand_in("stt", cfg)
+    sample_rate = base.app.get("sample_rate", 16000)
+    fixtures = sorted(Path(cfg.get("fixtures", "bench/fixtures/audio")).glob("*.wav"))
+    if not fixtures:
+        print("[Bench] Sin WAV en fixtures de STT; se omite")
+        return {}
+    clips = [(p, read_wav(p, sample_rate)) for p in fixtures]
+
+    metrics = {}
+    for variant in cfg.get("variants", [{"beam_size": 5, "compute_type": "int8"}]):
+        name = f"stt_beam{variant['beam_size']}_{variant['compute_type']}"
+        if variant.get("cascade"):
+            name += "_cascade"
+        # Sin cascada salvo que la variante la pida: se mide el modelo configurado, no el rápido
+        overrides = {"model_path": cfg["model_path"], "streaming": False, "cascade": False, **variant}
+        stt = SpeechToText(_config_with(base, "stt", overrides))
+
+        stt.bus = ArraySource(clips[0][1], sample_rate)
+        stt.transcribe()  # calentamiento
+
+        decode_s = 0.0
+        audio_s = 0.0
+        wers = []
+        for path, audio in clips:
+            stt.bus = ArraySource(audio, sample_rate)
+            started = time.perf_counter()
+            text = stt.transcribe()
+            decode_s += time.perf_counter() - started
+            audio_s += len(audio) / sample_rate
+            reference = path.with_suffix(".txt")
+            if reference.exists():
+                wers.append(_wer(reference.read_text(encoding="utf-8").strip(), text))
+        metrics[f"{name}_rtf"] = decode_s / audio_s
+        if wers:
+            metrics[f"{name}_wer"] = statistics.mean(wers)
+
+        if cfg.get("measure_latency", True):
+            # Latencia desde el fin de habla, con audio a ritmo real y transcripción incremental
+            stt.streaming = True
+            latencies = []
+            for _, audio in clips:
+                source = ArraySource(audio, sample_rate, realtime=True)
+                stt.bus = source
+                stt.transcribe()
+                latencies.append((time.perf_counter() - source.speech_ended_at) * 1000)
+            metrics[f"{name}_latency_ms"] = statistics.median(latencies)
+        print(f"[Bench] {name}: " + ", ".join(f"{k}={v:.3f}" for k, v in metrics.items() if k.startswith(name)))
+    return metrics
+
+
+def bench_llm(base: AppConfig, cfg: dict) -> dict:
+    from src.llm import LlmEngine
+
+    _ensure_stand_in("llm", cfg)
+    overrides = {
+        "provider": "local",
+        "model_path": cfg["model_path"],
+        "context_length": cfg.get("context_length", 512),
+        "n_threads": cfg.get("n_threads", 4),
+        "max_tokens": cfg.get("max_tokens", 64),
+        "vram_min_free_gb": 10 ** 6,  # siempre CPU: resultados comparables
+        "web_search": False,
+        "prompt_cache": False,
+    }
+    engine = LlmEngine(_config_with(base, "llm", overrides))
+    system_prompt = cfg.get("system_prompt", "Responde breve.")
+    prompts = cfg.get("prompts", ["Hola"])
+    list(engine.generate_stream(prompts[0], system_prompt=system_prompt))  # calentamiento
+
+    ttfts, prefill, decode = [], [], []
+    for prompt in prompts:
+        # Tokens reales del prompt (con la plantilla de chat), según los cuenta llama.cpp
+        messages = engine._messages(engine._with_search_hint(system_prompt), prompt)
+        usage = engine.llm.create_chat_completion(messages=messages, max_tokens=1).get("usage") or {}
+        n_prompt = usage.get("prompt_tokens") or len(engine.llm.tokenize(f"{system_prompt}\n{prompt}".encode("utf-8")))
+        engine.llm.reset()  # prefill completo en cada medida
+        started = time.perf_counter()
+        first = None
+        chunks = 0
+        for _ in engine.generate_stream(prompt, system_prompt=system_prompt):
+            if first is None:
+                first = time.perf_counter()
+            chunks += 1  # llama.cpp emite ~1 token por fragmento
+        ended = time.perf_counter()
+        if first is None:
+            continue
+        ttfts.append((first - started) * 1000)
+        prefill.append(n_prompt / (first - started))
+        if chunks > 1:
+            decode.append((chunks - 1) / (ended - first))
+
+    metrics = {
+        "llm_ttft_ms": statistics.median(ttfts),
+        "llm_prefill_tokens_per_s": statistics.median(prefill),
+    }
+    if decode:
+        metrics["llm_decode_tokens_per_s"] = statistics.median(decode)
+    print("[Bench] llm: " + ", ".join(f"{k}={v:.2f}" for k, v in metrics.items()))
+    return metrics
+
+
+def bench_tts(base: AppConfig, cfg: dict) -> dict:
+    from src.tts import TextToSpeech
+
+    tts = TextToSpeech(_config_with(base, "tts", {"cache": False, **cfg.get("overrides", {})}), sink=NullSink)
+    sentences = cfg.get("sentences", ["Hola, esto es una prueba de voz."])
+    tts.speak(sentences[0])  # calentamiento
+
+    first_chunk, rtfs = [], []
+    for text in sentences:
+        started = time.perf_counter()
+        utterance = tts.enqueue(text)
+        utterance.wait()
+        ended = time.perf_counter()
+        if utterance.started_at is None or not utterance.samples:
+            continue
+        first_chunk.append((utterance.started_at - started) * 1000)
+        rtfs.append((ended - started) / (utterance.samples / tts.output_rate))
+
+    metrics = {
+        "tts_first_chunk_ms": statistics.median(first_chunk),
+        "tts_rtf": statistics.median(rtfs),
+    }
+
+    # Respuesta larga: todas las frases seguidas, en un proceso y con el pool
+    workers = cfg.get("workers", min(4, os.cpu_count() or 1))
+    if workers > 1:
+        serial = _tts_reply_seconds(tts, sentences)
+        pooled = TextToSpeech(
+            _config_with(base, "tts", {"cache": False, **cfg.get("overrides", {}), "workers": workers}), sink=NullSink
+        )
+        _tts_reply_seconds(pooled, sentences)  # calentamiento
+        parallel = _tts_reply_seconds(pooled, sentences)
+        pooled.residency.unload("bench")
+        metrics["tts_reply_serial_ms"] = serial * 1000
+        metrics["tts_reply_parallel_ms"] = parallel * 1000
+        metrics["tts_parallel_speedup"] = serial / parallel
+    print("[Bench] tts: " + ", ".join(f"{k}={v:.3f}" for k, v in metrics.items()))
+    return metrics
+
+
+def _tts_reply_seconds(tts, sentences, repeat: int = 3) -> float:
+    reply = list(sentences) * repeat
+    started = time.perf_counter()
+    utterances = [tts.enqueue(text) for text in reply]
+    for utterance in utterances:
+        utterance.wait()
+    return time.perf_counter() - started
+
+
+def bench_actions(base: AppConfig, cfg: dict) -> dict:
+    from src.actions import ActionRouter
+
+    router = ActionRouter(base)
+    utterances = cfg.get("utterances", ["abre spotify"])
+    iterations = cfg.get("iterations", 2000)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for text in utterances:
+            router.match(text)
+    elapsed = time.perf_counter() - started
+    total = iterations * len(utterances)
+    metrics = {
+        "actions_match_per_s": total / elapsed,
+        "actions_match_us": elapsed / total * 1e6,
+    }
+    print("[Bench] actions: " + ", ".join(f"{k}={v:.2f}" for k, v in metrics.items()))
+    return metrics
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,8 @@ import json
 import subprocess
 from pathlib import Path
 import re
+from src.command_index import CommandIndex
+from src import hardware
 
 
 class ActionRouter:
@@ -10,20 +12,73 @@ class ActionRouter:
         self.commands_path = Path("commands.json")
         # Cargar comandos desde commands.json si existe, sino usar config
         if self.commands_path.exists():
-            self.commands = json.loads(self.commands_path.read_text(encoding="utf-8"))
+            commands = json.loads(self.commands_path.read_text(encoding="utf-8"))
         else:
-            self.commands = self.cfg.get("commands", {})
+            commands = self.cfg.get("commands", {})
         self.pending = None  # (intent, command)
         self.config_path = Path("config.json") if Path("config.json").exists() else None
         self.affirmatives = ("si", "sí", "vale", "ok", "okay", "claro", "afirma")
         self.negatives = ("no", "nel", "nunca", "cancela", "cancelar")
+        self.hardware = hardware.get_provider(config)
+        self._build_index(commands)
+
+    @property
+    def commands(self) -> dict:
+        return self._table[0]
+
+    @property
+    def aliases(self) -> dict:
+        return self._table[1]
+
+    @property
+    def index(self) -> CommandIndex:
+        return self._table[2]
+
+    def _build_index(self, commands: dict):
         # Alias: "abre discord" -> "discord" para disparar por nombre directo
-        self.aliases = {}
-        for intent in self.commands:
+        aliases = {}
+        for intent in commands:
             alias = intent
             if intent.startswith("abre "):
                 alias = intent.replace("abre ", "", 1)
-            self.aliases[alias.strip()] = intent
+            aliases[alias.strip()] = intent
+        index = CommandIndex()
+        for intent in commands:
+            index.add(intent, intent)
+        for alias, intent in aliases.items():
+            if alias:
+                index.add(alias, intent, label=alias, is_alias=True)
+        # Una sola asignación: quien lea a la vez ve la tabla vieja o la nueva, nunca mezcladas
+        self._table = (commands, aliases, index)
+
+    def reload_commands(self) -> bool:
+        """Relee commands.json y cambia la tabla si es distinta. Lanza ValueError si está mal formado."""
+        commands = json.loads(self.commands_path.read_text(encoding="utf-8"))
+        if not isinstance(commands, dict) or not all(
+            isinstance(k, str) and k.strip() and isinstance(v, str) for k, v in commands.items()
+        ):
+            raise ValueError("commands.json debe ser un objeto {\"nombre\": \"comando\"}")
+        if commands == self.commands:
+            return False
+        self._build_index(commands)
+        return True
+
+    def match(self, text: str):
+        """Comando más específico mencionado en `text` (o None)."""
+        found = self.index.best(text)
+        if found is None or found.intent not in self.commands:
+            return None
+        return found
+
+    def exact_match(self, text: str):
+        """Comando si la frase entera es un intent o alias ("steam", "configuración de sonido")."""
+        found = self.index.exact(text)
+        if found is None or found.intent not in self.commands:
+            return None
+        return found
+
+    def match_all(self, text: str, after: set[str] | None = None):
+        return [m for m in self.index.find_all(text, after) if m.intent in self.commands]
 
     def handle(self, text: str) -> str | None:
         low = text.lower()
@@ -37,21 +92,17 @@ class ActionRouter:
         if url:
             return self._run_command(f'start "" "{url}"', label=url)
 
-        # Coincide intents contra un allowlist de comandos
-        for intent, command in self.commands.items():
-            if intent in low:
-                return self._run_command(command, label=intent)
-
-        # Coincide por alias (solo nombre de la app)
-        for alias, intent in self.aliases.items():
-            if alias and alias in low and intent in self.commands:
-                return self._run_command(self.commands[intent], label=alias)
+        # Coincide intents y alias contra un allowlist de comandos
+        found = self.match(low)
+        command = self.commands.get(found.intent) if found is not None else None
+        if command is not None:
+            return self._run_command(command, label=found.label)
 
         # Confirmaciones pendientes
         if self.pending:
             if any(word in low for word in self.affirmatives):
                 intent, command = self.pending
-                self.commands[intent] = command
+                self._build_index({**self.commands, intent: command})
                 self._persist_command(intent, command)
                 self.pending = None
                 return self._run_command(command)
@@ -71,26 +122,22 @@ class ActionRouter:
         hints.extend(self.aliases.keys())
         return sorted(set(hints))
 
+    def confirmations(self) -> list[str]:
+        """Frases fijas que puede devolver el router (para pre-renderizar el TTS)."""
+        labels = list(self.commands.keys()) + [alias for alias in self.aliases if alias]
+        phrases = [f"Se ha abierto {label}" for label in labels]
+        phrases += ["No pude ejecutar el comando autorizado.", "No guardo el comando.", "Confirma con sí o no."]
+        if self.cfg.get("enable_shutdown"):
+            phrases.append("Apagando el equipo en 3 segundos.")
+        return phrases
+
     def _shutdown(self) -> str:
         subprocess.Popen(["shutdown", "/s", "/t", "3"], shell=True)
         return "Apagando el equipo en 3 segundos."
 
     def _inventory(self) -> str:
         try:
-            script = (
-                "Get-CimInstance Win32_ComputerSystem | Select-Object Manufacturer,Model;"
-                "Get-CimInstance Win32_Processor | Select-Object Name,NumberOfCores,NumberOfLogicalProcessors;"
-                "Get-CimInstance Win32_VideoController | Select-Object Name,AdapterRAM;"
-                "Get-CimInstance Win32_PhysicalMemory | Group-Object -Property Manufacturer,Capacity |"
-                " Select-Object @{Name='DIMMs';Expression={$_.Count}}, @{Name='CapacityGB';Expression={[math]::Round(($_.Group | Measure-Object -Property Capacity -Sum).Sum/1GB,2)}};"
-                "Get-Volume | Where-Object {$_.DriveLetter} | Select-Object DriveLetter,SizeRemaining,Size"
-            )
-            result = subprocess.check_output([
-                "powershell",
-                "-Command",
-                script,
-            ], text=True, timeout=10)
-            return "Resumen del PC:\n" + result.strip()
+            return self.hardware.inventory()
         except Exception:
             return "No pude leer el inventario ahora."
 
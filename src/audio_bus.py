@@ -0,0 +1,136 @@
+import time
+import numpy as np
+import sounddevice as sd
+from src.ring_buffer import RingBuffer
+
+
+class AudioBus:
+    """Captura única y permanente del micrófono.
+
+    El callback de PortAudio solo copia el audio a un `RingBuffer` de int16;
+    wake-word, VAD y STT se suscriben con su propio cursor. Así el dispositivo
+    se abre una sola vez y el STT puede empezar unos milisegundos antes del
+    wake (pre-roll) sin perder las primeras sílabas.
+    """
+
+    def __init__(self, config):
+        app = config.app
+        self.sample_rate = app.get("sample_rate", 16000)
+        self.blocksize = int(self.sample_rate * app.get("chunk_ms", 30) / 1000)
+        self.preroll = int(app.get("preroll_ms", 300) * self.sample_rate / 1000)
+        seconds = app.get("capture_buffer_seconds", 30)
+        self.ring = RingBuffer(self.sample_rate * seconds)
+        self._stream = None
+        self._stats = {
+            "callback_calls": 0,
+            "callback_total_ms": 0.0,
+            "callback_max_ms": 0.0,
+            "status_errors": 0,
+        }
+
+    def start(self):
+        if self._stream is not None:
+            return
+        self._stream = sd.RawInputStream(
+            samplerate=self.sample_rate,
+            blocksize=self.blocksize,
+            dtype="int16",
+            channels=1,
+            callback=self._callback,
+        )
+        self._stream.start()
+        print(f"[Audio] Captura compartida activa ({self.sample_rate} Hz, bloques de {self.blocksize})")
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    @property
+    def position(self) -> int:
+        """Posición absoluta (en muestras) de lo último capturado."""
+        return self.ring.written
+
+    def subscribe(self, position: int | None = None):
+        """Lector desde `position` (por defecto, desde ahora)."""
+        return self.ring.reader(position)
+
+    def subscribe_with_preroll(self, position: int | None = None):
+        """Lector que empieza `preroll_ms` antes de `position` (o de ahora)."""
+        if position is None:
+            position = self.position
+        oldest = max(0, self.ring.written - self.ring.capacity)
+        return self.ring.reader(max(oldest, position - self.preroll))
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        calls = stats.pop("callback_calls")
+        stats["callback_avg_ms"] = stats.pop("callback_total_ms") / calls if calls else 0.0
+        stats["callbacks"] = calls
+        return stats
+
+    def _callback(self, indata, frames, _time, status):
+        started = time.perf_counter()
+        if status:
+            self._stats["status_errors"] += 1
+        self.ring.write(np.frombuffer(indata, dtype=np.int16))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats["callback_calls"] += 1
+        self._stats["callback_total_ms"] += elapsed_ms
+        if elapsed_ms > self._stats["callback_max_ms"]:
+            self._stats["callback_max_ms"] = elapsed_ms
+
+
+class ArraySource:
+    """Sustituto del `AudioBus` que entrega un array int16 (p. ej. un WAV) en vez del micrófono.
+
+    Con `realtime=True` entrega el audio al ritmo real; `speech_ended_at`
+    guarda el instante (perf_counter) en que se entregó la última muestra del
+    audio original, para medir la latencia desde el fin de habla.
+    """
+
+    def __init__(self, audio: np.ndarray, sample_rate: int, realtime: bool = False, tail_seconds: float = 3.0):
+        self.sample_rate = sample_rate
+        self.preroll = 0
+        self.realtime = realtime
+        self.speech_samples = len(audio)
+        self.audio = np.concatenate([audio.astype(np.int16), np.zeros(int(tail_seconds * sample_rate), dtype=np.int16)])
+        self.speech_ended_at = None
+
+    @property
+    def position(self) -> int:
+        return 0
+
+    def subscribe(self, position: int | None = None):
+        return _ArrayReader(self)
+
+    def subscribe_with_preroll(self, position: int | None = None):
+        return _ArrayReader(self)
+
+
+class _ArrayReader:
+    def __init__(self, source: ArraySource):
+        self.source = source
+        self.position = 0
+        self.lost = 0
+        self._started = time.perf_counter()
+
+    def read(self, n: int, timeout: float | None = None) -> np.ndarray | None:
+        source = self.source
+        if self.position + n > len(source.audio):
+            time.sleep(timeout or 0)
+            return None
+        if source.realtime:
+            due = self._started + (self.position + n) / source.sample_rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        block = source.audio[self.position:self.position + n]
+        self.position += n
+        if source.speech_ended_at is None and self.position >= source.speech_samples:
+            source.speech_ended_at = time.perf_counter()
+        return block
+
+    def close(self):
+        pass
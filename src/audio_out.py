@@ -0,0 +1,107 @@
+import time
+import numpy as np
+from src.ring_buffer import RingBuffer
+
+
+class AudioOutput:
+    """Salida de audio permanente alimentada desde un `RingBuffer`.
+
+    El stream se abre una vez; su callback copia del búfer lo que haya y
+    rellena con silencio el resto. Quien sintetiza escribe por delante del
+    punto de reproducción (hasta `buffer_seconds`) y espera si se llena.
+    El callback es el único que mueve el cursor de lectura: para vaciar el
+    búfer (barge-in) solo se activan indicadores que él aplica.
+    """
+
+    def __init__(self, sample_rate: int, stream_factory, buffer_seconds: float = 10, block_ms: int = 20):
+        self.sample_rate = sample_rate
+        self.blocksize = max(1, int(sample_rate * block_ms / 1000))
+        self.ring = RingBuffer(int(sample_rate * buffer_seconds))
+        self._reader = self.ring.reader(0)
+        self._stream = stream_factory(sample_rate, self.blocksize, self._callback)
+        self._muted = False
+        self._drop_to = 0
+        # Hay una frase a medio escribir: si el búfer se vacía ahora, es un corte audible
+        self.mid_utterance = False
+        self._starved = False
+        self.underruns = 0
+        self.max_depth = 0
+        self.callbacks = 0
+
+    def start(self):
+        self._stream.start()
+
+    def close(self):
+        try:
+            self._stream.stop()
+            self._stream.close()
+        except Exception:
+            pass
+
+    @property
+    def played(self) -> int:
+        """Posición absoluta (en muestras) de lo ya entregado a la tarjeta."""
+        return self._reader.position
+
+    def depth(self) -> int:
+        """Muestras escritas que aún no se han reproducido."""
+        return max(0, self.ring.written - self._reader.position)
+
+    def write(self, pcm: np.ndarray, stopped=None) -> bool:
+        """Añade `pcm` (int16) esperando a que haya hueco; False si `stopped()` lo corta."""
+        pos = 0
+        while pos < len(pcm):
+            if stopped is not None and stopped():
+                return False
+            space = self.ring.capacity - self.depth()
+            if space <= 0:
+                time.sleep(self.blocksize / self.sample_rate)
+                continue
+            piece = pcm[pos:pos + space]
+            self.ring.write(piece)
+            pos += len(piece)
+            self.max_depth = max(self.max_depth, self.depth())
+        return True
+
+    @property
+    def muted(self) -> bool:
+        return self._muted
+
+    def interrupt(self):
+        """Descarta lo que haya en el búfer y lo que se escriba hasta `resume()`."""
+        self._muted = True
+
+    def resume(self):
+        # Lo escrito hasta ahora era de la locución cortada
+        self._drop_to = self.ring.written
+        self._muted = False
+
+    def stats(self) -> dict:
+        return {
+            "underruns": self.underruns,
+            "depth_ms": round(self.depth() * 1000 / self.sample_rate, 1),
+            "max_depth_ms": round(self.max_depth * 1000 / self.sample_rate, 1),
+            "callbacks": self.callbacks,
+        }
+
+    def _callback(self, outdata, frames, _time, status):
+        self.callbacks += 1
+        reader = self._reader
+        if self._muted:
+            # Barge-in: silencio y fuera lo pendiente (no cuenta como underrun)
+            reader.position = self.ring.written
+            outdata[:] = 0
+            return
+        if reader.position < self._drop_to:
+            reader.position = self._drop_to
+        data = reader.read_available(frames)
+        n = len(data)
+        outdata[:n, 0] = data
+        outdata[n:] = 0
+        if n < frames:
+            # Sin audio a mitad de frase: la síntesis va por detrás de la reproducción
+            if self.mid_utterance and not self._starved:
+                self.underruns += 1
+            self._starved = True
+        else:
+            self._starved = False
@@ -0,0 +1,58 @@
+import threading
+
+
+class Cancelled(Exception):
+    """El turno se ha cancelado (nuevo wake o barge-in)."""
+
+
+class CancelToken:
+    """Señal de cancelación de un turno, compartida por STT, LLM, búsquedas, acciones y TTS.
+
+    Cada componente la consulta entre unidades de trabajo (tramas de audio,
+    tokens, bloques de reproducción) y abandona en cuanto está activa.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = ""
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = ""):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[Cancel] Error en callback de cancelación: {e}")
+
+    def on_cancel(self, callback):
+        """Llama a `callback()` al cancelar (o ya mismo, si está cancelado)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Espera hasta `timeout` segundos; devuelve True si se ha cancelado."""
+        return self._event.wait(timeout)
+
+
+def check(cancel: CancelToken | None):
+    """Lanza `Cancelled` si `cancel` está activo (acepta None: sin cancelación)."""
+    if cancel is not None:
+        cancel.raise_if_cancelled()
@@ -0,0 +1,117 @@
+import unicodedata
+from dataclasses import dataclass
+
+_ARTICLES = ("el ", "la ", "los ", "las ", "al ", "del ")
+_PUNCT = ".,!?¿¡;:\"'()"
+# Palabras de relleno que no distinguen comandos ("configuración de sonido")
+_FILLER = {"de", "del", "el", "la", "los", "las", "al", "mi", "me", "un", "una"}
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin artículo inicial ni puntuación en los extremos (como Pipeline._norm)."""
+    clean = text.lower().strip()
+    for art in _ARTICLES:
+        if clean.startswith(art):
+            clean = clean[len(art):]
+            break
+    return clean.strip(".,!? ")
+
+
+def tokenize(text: str) -> list[str]:
+    """Tokens en minúsculas, sin tildes ni puntuación."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [tok for tok in (t.strip(_PUNCT) for t in text.split()) if tok]
+
+
+@dataclass(frozen=True)
+class CommandMatch:
+    intent: str
+    label: str
+    start: int
+    end: int
+    is_alias: bool
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+
+class CommandIndex:
+    """Trie de tokens sobre intents y alias.
+
+    Encuentra todos los comandos de una frase en una sola pasada, en lugar de
+    probar cada intent y cada alias con `in`.
+    """
+
+    _END = object()
+
+    def __init__(self):
+        self._root: dict = {}
+        self.size = 0
+
+    def add(self, phrase: str, intent: str, label: str | None = None, is_alias: bool = False):
+        tokens = self._keys(normalize(phrase))
+        if not tokens:
+            return
+        node = self._root
+        for tok in tokens:
+            node = node.setdefault(tok, {})
+        # Un intent tiene prioridad sobre un alias con el mismo texto
+        current = node.get(self._END)
+        if current is None:
+            self.size += 1
+        if current is None or (current[2] and not is_alias):
+            node[self._END] = (intent, label or phrase, is_alias)
+
+    def find_all(self, text: str, after: set[str] | None = None) -> list[CommandMatch]:
+        """Coincidencias más largas, de izquierda a derecha y sin solaparse.
+
+        Con `after`, solo las que van justo detrás (salvo relleno) de una de esas palabras:
+
+        >>> index = CommandIndex()
+        >>> index.add("discord", "discord")
+        >>> [m.intent for m in index.find_all("abre el discord", after={"abre", "inicia"})]
+        ['discord']
+        >>> index.find_all("inicia sesión en discord", after={"abre", "inicia"})
+        []
+        """
+        tokens = self._keys(text)
+        matches = []
+        i = 0
+        while i < len(tokens):
+            node = self._root
+            best = None
+            j = i
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if self._END in node:
+                    intent, label, is_alias = node[self._END]
+                    best = CommandMatch(intent, label, i, j, is_alias)
+            if best is not None:
+                matches.append(best)
+                i = best.end
+            else:
+                i += 1
+        if after is not None:
+            matches = [m for m in matches if m.start > 0 and tokens[m.start - 1] in after]
+        return matches
+
+    @staticmethod
+    def _keys(text: str) -> list[str]:
+        return [tok for tok in tokenize(text) if tok not in _FILLER]
+
+    def exact(self, text: str) -> CommandMatch | None:
+        """El comando si `text` entero (sin relleno) es un intent o alias, si no None."""
+        matches = self.find_all(text)
+        if len(matches) != 1:
+            return None
+        found = matches[0]
+        return found if found.start == 0 and found.end == len(self._keys(text)) else None
+
+    def best(self, text: str) -> CommandMatch | None:
+        matches = self.find_all(text)
+        if not matches:
+            return None
+        return max(matches, key=lambda m: (m.length, not m.is_alias))
@@ -26,11 +26,16 @@ class AppConfig(dict):
         return self["actions"]
 
 
+def config_path(path: str | None = None) -> Path:
+    """Fichero de configuración que usaría `load_config(path)`."""
+    if path:
+        return Path(path)
+    default_json = Path("config.json")
+    return default_json if default_json.exists() else Path("config.yaml")
+
+
 def load_config(path: str | None = None) -> AppConfig:
-    cfg_path = Path(path) if path else None
-    if cfg_path is None:
-        default_json = Path("config.json")
-        cfg_path = default_json if default_json.exists() else Path("config.yaml")
+    cfg_path = config_path(path)
 
     _load_env_file(Path(".env"))
     loader = _load_json if cfg_path.suffix.lower() == ".json" else _load_yaml
@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+class ContextPacker:
+    """Reparte un presupuesto de tokens entre sistema, memoria del usuario e historial.
+
+    Los tokens se cuentan con el tokenizador del modelo cargado y se guardan
+    en cada entrada del historial, así cada turno solo tokeniza lo nuevo. El
+    orden de prioridad es: prompt de sistema (siempre), datos del usuario
+    (línea a línea mientras quepan), resumen de lo antiguo y turnos recientes
+    empezando por el último. Los turnos que ya no caben se resumen con el LLM
+    en segundo plano, cuando lleva `summary_idle_s` sin turnos (así el resumen
+    no ocupa el modelo justo cuando llega la siguiente pregunta).
+    """
+
+    def __init__(self, config, llm):
+        cfg = config.llm
+        self.llm = llm
+        reserve = cfg.get("context_reserve_tokens", 256)
+        limit = cfg.get("context_length", 4096) - cfg.get("max_tokens", 256) - reserve
+        self.budget = min(cfg.get("context_budget_tokens") or limit, limit)
+        self.summary_max_tokens = cfg.get("summary_max_tokens", 128)
+        self.history_window = timedelta(minutes=cfg.get("history_minutes", 10))
+        self.summary_idle_s = cfg.get("summary_idle_s", 20)
+        self.summary = ""
+        self._summary_tokens = 0
+        self._pending = []
+        self._summarizing = False
+        self._timer = None
+        self._last_used = time.monotonic()
+        self._lock = threading.Lock()
+        self._counts: OrderedDict[str, int] = OrderedDict()
+        self.last_stats = {}
+
+    def count(self, text: str) -> int:
+        """Tokens de `text` (cacheado: la memoria y el sistema se repiten en cada turno)."""
+        if not text:
+            return 0
+        cached = self._counts.get(text)
+        if cached is not None:
+            self._counts.move_to_end(text)
+            return cached
+        n = self.llm.count_tokens(text)
+        self._counts[text] = n
+        if len(self._counts) > 64:
+            self._counts.popitem(last=False)
+        return n
+
+    def pack(self, system_prompt: str, user_context: str, history, prompt: str = "") -> tuple[str, str]:
+        """Devuelve (prefijo estable, contexto volátil) dentro del presupuesto."""
+        self._last_used = time.monotonic()
+        remaining = self.budget - self.count(system_prompt) - self.count(prompt)
+
+        # Datos del usuario: en el prefijo, línea a línea mientras quepan
+        memory_lines = []
+        if user_context:
+            remaining -= self.count("\n\nDatos del usuario:\n")
+            for line in user_context.splitlines():
+                cost = self.count(line) + 1
+                if cost > remaining:
+                    break
+                memory_lines.append(line)
+                remaining -= cost
+        prefix = system_prompt
+        if memory_lines:
+            prefix += "\n\nDatos del usuario:\n" + "\n".join(memory_lines)
+
+        with self._lock:
+            summary, summary_tokens = self.summary, self._summary_tokens
+        if summary and summary_tokens <= remaining:
+            remaining -= summary_tokens
+        else:
+            summary = ""
+
+        # Turnos recientes, del más nuevo al más viejo
+        cutoff = datetime.now() - self.history_window
+        entries = list(history)
+        kept = []
+        folded = []
+        for index in range(len(entries) - 1, -1, -1):
+            entry = entries[index]
+            fits = entry["time"] > cutoff and not entry.get("summarized")
+            if fits and self._entry_tokens(entry) <= remaining:
+                remaining -= entry["tokens"]
+                kept.append(entry)
+                continue
+            # Este y todos los anteriores pasan al resumen
+            folded = [e for e in entries[:index + 1] if not e.get("summarized")]
+            break
+        kept.reverse()
+        with self._lock:
+            known = {id(e) for e in self._pending}
+            self._pending += [e for e in folded if id(e) not in known]
+
+        parts = []
+        if summary:
+            parts.append(f"Resumen de la conversación anterior:\n{summary}")
+        if kept:
+            parts.append("Historial reciente:\n" + "\n".join(e["text"] for e in kept))
+        self.last_stats = {
+            "budget": self.budget,
+            "used": self.budget - remaining,
+            "turns": len(kept),
+            "pending_summary": len(self._pending),
+        }
+        return prefix, "\n\n".join(parts)
+
+    def refresh_summary_async(self):
+        """Programa el resumen de los turnos que se han quedado fuera para cuando no haya actividad."""
+        self._last_used = time.monotonic()
+        with self._lock:
+            if not self._pending:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.summary_idle_s, self._summarize_when_idle)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _summarize_when_idle(self):
+        # Un turno (pack) después de programarlo retrasa el resumen otro periodo completo
+        idle = time.monotonic() - self._last_used
+        if idle < self.summary_idle_s:
+            with self._lock:
+                self._timer = threading.Timer(self.summary_idle_s - idle, self._summarize_when_idle)
+                self._timer.daemon = True
+                self._timer.start()
+            return
+        self._summarize()
+
+    def _summarize(self):
+        with self._lock:
+            self._timer = None
+            if self._summarizing or not self._pending:
+                return
+            self._summarizing = True
+            previous = self.summary
+            # Por tandas que quepan en el contexto; lo que sobre, en la siguiente
+            batch, size = [], self._summary_tokens
+            for entry in self._pending:
+                size += self._entry_tokens(entry)
+                if batch and size > self.budget:
+                    break
+                batch.append(entry)
+
+        def work():
+            try:
+                turns = "\n".join(self._entry_text(e) for e in batch)
+                source = f"{previous}\n{turns}" if previous else turns
+                summary = self.llm.summarize(source, max_tokens=self.summary_max_tokens)
+                tokens = self.llm.count_tokens(summary)
+                with self._lock:
+                    self.summary = summary
+                    self._summary_tokens = tokens
+                    for entry in batch:
+                        entry["summarized"] = True
+                    self._pending = [e for e in self._pending if not e.get("summarized")]
+                print(f"[Contexto] Resumidos {len(batch)} turnos antiguos ({tokens} tokens)")
+            except Exception as e:
+                print(f"[Contexto] No se pudo resumir el historial: {e}")
+            finally:
+                self._summarizing = False
+
+        threading.Thread(target=work, daemon=True, name="history-summary").start()
+
+    @staticmethod
+    def _entry_text(entry: dict) -> str:
+        if "text" not in entry:
+            entry["text"] = f"Usuario: {entry['user']}\nTú: {entry['assistant']}"
+        return entry["text"]
+
+    def _entry_tokens(self, entry: dict) -> int:
+        # Cada entrada guarda su propio recuento; no pasa por el LRU de `count`
+        if "tokens" not in entry:
+            entry["tokens"] = self.llm.count_tokens(self._entry_text(entry)) + 1  # + salto de línea
+        return entry["tokens"]
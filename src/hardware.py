@@ -0,0 +1,345 @@
+"""Perfil de hardware del equipo, leído una vez y guardado en disco.
+
+En Linux se lee de /proc y /sys sin lanzar procesos; en Windows se hace una
+única consulta WMI (PowerShell devuelve JSON). El resultado se guarda en
+`cache/hardware.json` con una clave de invalidación (boot id en Linux,
+equipo + hora de arranque en Windows): al arrancar se usa el perfil guardado
+al momento y, si la clave ha cambiado o es antiguo, se vuelve a leer en
+segundo plano.
+"""
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+_VENDORS = {"0x10de": "NVIDIA", "0x1002": "AMD", "0x8086": "Intel"}
+_DISK_FS = {"ext2", "ext3", "ext4", "xfs", "btrfs", "f2fs", "vfat", "exfat", "ntfs", "ntfs3", "zfs"}
+
+_WMI_SCRIPT = (
+    "$cs = Get-CimInstance Win32_ComputerSystem;"
+    "$os = Get-CimInstance Win32_OperatingSystem;"
+    "@{"
+    "Manufacturer = $cs.Manufacturer; Model = $cs.Model;"
+    "OS = $os.Caption;"
+    "Cpu = @(Get-CimInstance Win32_Processor | Select-Object Name,NumberOfCores,NumberOfLogicalProcessors);"
+    "Gpu = @(Get-CimInstance Win32_VideoController | Select-Object Name,AdapterRAM);"
+    "Ram = @(Get-CimInstance Win32_PhysicalMemory | Select-Object Manufacturer,Capacity);"
+    "Disks = @(Get-Volume | Where-Object {$_.DriveLetter} | Select-Object DriveLetter,SizeRemaining,Size)"
+    "} | ConvertTo-Json -Depth 3 -Compress"
+)
+
+
+def _gb(value) -> float | None:
+    try:
+        return round(float(value) / (1024 ** 3), 1)
+    except (TypeError, ValueError):
+        return None
+
+
+def _read(path: str) -> str:
+    try:
+        return Path(path).read_text(encoding="utf-8", errors="replace").strip()
+    except OSError:
+        return ""
+
+
+def boot_key() -> str:
+    """Cambia al reiniciar o al cambiar de equipo: invalida el perfil guardado."""
+    host = socket.gethostname()
+    boot_id = _read("/proc/sys/kernel/random/boot_id")
+    if boot_id:
+        return f"{host}:{boot_id}"
+    if platform.system() == "Windows":
+        try:
+            import ctypes
+
+            uptime = ctypes.windll.kernel32.GetTickCount64() / 1000
+            # Redondeado al minuto: la hora de arranque calculada baila unos ms
+            return f"{host}:{int((time.time() - uptime) // 60)}"
+        except Exception:
+            pass
+    return host
+
+
+def collect() -> dict:
+    """Lee el hardware del sistema actual (sin caché)."""
+    system = platform.system()
+    try:
+        if system == "Linux":
+            profile = _collect_linux()
+        elif system == "Windows":
+            profile = _collect_windows()
+        else:
+            profile = {}
+    except Exception as e:
+        print(f"[Hardware] Lectura incompleta: {e}")
+        profile = {}
+    return _fill_generic(profile)
+
+
+def _fill_generic(profile: dict) -> dict:
+    """Completa con lo que da la biblioteca estándar lo que no se haya podido leer."""
+    uname = platform.uname()
+    profile.setdefault("os", f"{uname.system} {uname.release}".strip())
+    profile.setdefault("cpu", uname.processor or "cpu-desconocido")
+    profile.setdefault("threads", os.cpu_count() or 0)
+    profile.setdefault("gpus", [])
+    profile.setdefault("disks", [])
+    if profile.get("ram_gb") is None:
+        try:
+            import psutil  # type: ignore
+
+            profile["ram_gb"] = _gb(psutil.virtual_memory().total)
+        except Exception:
+            profile["ram_gb"] = None
+    return profile
+
+
+def _collect_linux() -> dict:
+    profile = {}
+    release = dict(
+        line.split("=", 1) for line in _read("/etc/os-release").splitlines() if "=" in line
+    )
+    if release.get("PRETTY_NAME"):
+        profile["os"] = f"{release['PRETTY_NAME'].strip(chr(34))} ({platform.release()})"
+
+    cpuinfo = _read("/proc/cpuinfo")
+    cores = set()
+    physical = None
+    for line in cpuinfo.splitlines():
+        key, _, value = line.partition(":")
+        key, value = key.strip(), value.strip()
+        if key == "model name" and "cpu" not in profile:
+            profile["cpu"] = " ".join(value.split())
+        elif key == "physical id":
+            physical = value
+        elif key == "core id":
+            cores.add((physical, value))
+    profile["threads"] = os.cpu_count() or 0
+    if cores:
+        profile["cores"] = len(cores)
+
+    for line in _read("/proc/meminfo").splitlines():
+        if line.startswith("MemTotal:"):
+            profile["ram_gb"] = _gb(int(line.split()[1]) * 1024)
+            break
+
+    vendor = _read("/sys/class/dmi/id/sys_vendor")
+    model = _read("/sys/class/dmi/id/product_name")
+    if vendor or model:
+        profile["machine"] = " ".join(p for p in (vendor, model) if p)
+
+    profile["gpus"] = _linux_gpus()
+    profile["disks"] = _linux_disks()
+    return profile
+
+
+def _linux_gpus() -> list[dict]:
+    gpus = []
+    # El driver de NVIDIA publica el nombre comercial
+    for info in sorted(Path("/proc/driver/nvidia/gpus").glob("*/information")):
+        for line in _read(str(info)).splitlines():
+            if line.startswith("Model:"):
+                gpus.append({"name": line.split(":", 1)[1].strip()})
+    if gpus:
+        return gpus
+    for card in sorted(Path("/sys/class/drm").glob("card[0-9]")):
+        device = card / "device"
+        vendor_id = _read(str(device / "vendor"))
+        if not vendor_id:
+            continue
+        name = _read(str(device / "product_name")) or (
+            f"{_VENDORS.get(vendor_id, vendor_id)} {_read(str(device / 'device'))}"
+        )
+        gpu = {"name": name}
+        vram = _read(str(device / "mem_info_vram_total"))  # amdgpu
+        if vram.isdigit():
+            gpu["vram_gb"] = _gb(int(vram))
+        gpus.append(gpu)
+    return gpus
+
+
+def _linux_disks() -> list[dict]:
+    disks = []
+    seen = set()
+    for line in _read("/proc/mounts").splitlines():
+        parts = line.split()
+        if len(parts) < 3 or parts[2] not in _DISK_FS or not parts[0].startswith("/dev/"):
+            continue
+        if parts[0] in seen:
+            continue
+        seen.add(parts[0])
+        try:
+            usage = shutil.disk_usage(parts[1])
+        except OSError:
+            continue
+        disks.append({"name": parts[1], "free_gb": _gb(usage.free), "total_gb": _gb(usage.total)})
+    return disks
+
+
+def _collect_windows() -> dict:
+    out = subprocess.check_output(
+        ["powershell", "-NoProfile", "-NonInteractive", "-Command", _WMI_SCRIPT],
+        text=True,
+        timeout=20,
+    )
+    data = json.loads(out)
+    profile = {}
+    if data.get("OS"):
+        profile["os"] = f"{data['OS']} ({platform.version()})"
+    machine = " ".join(p for p in (data.get("Manufacturer"), data.get("Model")) if p)
+    if machine:
+        profile["machine"] = machine
+
+    cpus = data.get("Cpu") or []
+    if cpus:
+        profile["cpu"] = (cpus[0].get("Name") or "").strip() or "cpu-desconocido"
+        profile["cores"] = sum(c.get("NumberOfCores") or 0 for c in cpus)
+        profile["threads"] = sum(c.get("NumberOfLogicalProcessors") or 0 for c in cpus)
+
+    ram = data.get("Ram") or []
+    if ram:
+        profile["ram_gb"] = _gb(sum(int(m.get("Capacity") or 0) for m in ram))
+        profile["dimms"] = len(ram)
+
+    profile["gpus"] = []
+    for gpu in data.get("Gpu") or []:
+        entry = {"name": (gpu.get("Name") or "").strip()}
+        # AdapterRAM es de 32 bits: a partir de 4 GB no es fiable
+        if gpu.get("AdapterRAM") and int(gpu["AdapterRAM"]) < 2 ** 32 - 1:
+            entry["vram_gb"] = _gb(gpu["AdapterRAM"])
+        profile["gpus"].append(entry)
+
+    profile["disks"] = [
+        {"name": f"{d['DriveLetter']}:", "free_gb": _gb(d.get("SizeRemaining")), "total_gb": _gb(d.get("Size"))}
+        for d in data.get("Disks") or []
+        if d.get("DriveLetter")
+    ]
+    return profile
+
+
+class HardwareProvider:
+    """Perfil de hardware cacheado en disco y refrescado en segundo plano."""
+
+    def __init__(self, cache_path="cache/hardware.json", max_age_hours: float = 24):
+        self.cache_path = Path(cache_path)
+        self.max_age = max_age_hours * 3600
+        self._profile = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def profile(self) -> dict:
+        """Perfil guardado (al instante); la primera vez en este equipo se lee en el momento."""
+        with self._lock:
+            if self._profile is not None:
+                return self._profile
+            started = time.perf_counter()
+            key = boot_key()
+            cached = self._load()
+            if cached is None:
+                self._store(collect(), key)
+                print(f"[Hardware] Perfil leído en {(time.perf_counter() - started) * 1000:.0f} ms")
+                return self._profile
+            self._profile = cached["profile"]
+            stale = cached.get("key") != key or time.time() - cached.get("time", 0) > self.max_age
+        if stale:
+            self.refresh_async()
+        return self._profile
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def work():
+            try:
+                profile = collect()
+                with self._lock:
+                    self._store(profile, boot_key())
+            except Exception as e:
+                print(f"[Hardware] No se pudo refrescar el perfil: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=work, daemon=True, name="hardware-refresh").start()
+
+    def summary(self) -> str:
+        """Línea para el prompt del sistema (OS, CPU, RAM, disco, GPU).
+
+        Solo datos fijos: la línea va en el prefijo cacheado del LLM. El espacio
+        libre, que cambia, lo da `inventory()` ("qué lleva mi PC").
+        """
+        p = self.profile()
+        parts = [f"OS: {p['os']}", f"CPU: {p['cpu']} ({p['threads']} hilos)"]
+        if p.get("ram_gb"):
+            parts.append(f"RAM: {p['ram_gb']} GB")
+        total = sum(d["total_gb"] for d in p["disks"] if d.get("total_gb"))
+        if total:
+            parts.append(f"Disco: {round(total)} GB")
+        if p["gpus"]:
+            parts.append(f"GPU: {', '.join(g['name'] for g in p['gpus'][:3])}")
+        return ", ".join(parts)
+
+    def inventory(self) -> str:
+        """Respuesta hablada a "qué lleva mi PC"."""
+        p = self.profile()
+        lines = []
+        if p.get("machine"):
+            lines.append(f"Equipo: {p['machine']}")
+        cores = f"{p['cores']} núcleos, " if p.get("cores") else ""
+        lines.append(f"Procesador: {p['cpu']} ({cores}{p['threads']} hilos)")
+        if p.get("ram_gb"):
+            dimms = f" en {p['dimms']} módulos" if p.get("dimms") else ""
+            lines.append(f"Memoria: {p['ram_gb']} GB{dimms}")
+        for gpu in p["gpus"]:
+            vram = f" ({gpu['vram_gb']} GB)" if gpu.get("vram_gb") else ""
+            lines.append(f"Gráfica: {gpu['name']}{vram}")
+        for disk in p["disks"]:
+            try:
+                usage = shutil.disk_usage(disk["name"] + ("\\" if disk["name"].endswith(":") else ""))
+                disk = {**disk, "free_gb": _gb(usage.free), "total_gb": _gb(usage.total)}
+            except OSError:
+                pass
+            lines.append(f"Disco {disk['name']}: {disk['free_gb']} GB libres de {disk['total_gb']} GB")
+        lines.append(f"Sistema: {p['os']}")
+        return "Resumen del PC:\n" + "\n".join(lines)
+
+    def _load(self) -> dict | None:
+        try:
+            data = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            return data if isinstance(data.get("profile"), dict) else None
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, profile: dict, key: str):
+        self._profile = profile
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"key": key, "time": time.time(), "profile": profile}, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(self.cache_path)
+        except OSError as e:
+            print(f"[Hardware] No se pudo guardar el perfil: {e}")
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider(config=None) -> HardwareProvider:
+    """Proveedor compartido (pipeline y ActionRouter leen del mismo perfil)."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            app = config.app if config is not None else {}
+            _provider = HardwareProvider(
+                app.get("hardware_cache_path", "cache/hardware.json"),
+                max_age_hours=app.get("hardware_max_age_hours", 24),
+            )
+        return _provider
@@ -0,0 +1,146 @@
+import threading
+import time
+from pathlib import Path
+from src.config import config_path, load_config
+
+# Claves que se pueden cambiar en caliente; el resto necesita reiniciar (rutas de
+# modelos, tamaño de contexto, dispositivos...)
+RUNTIME_KEYS = {
+    "llm": ("system_prompt", "web_search", "search_max_hops", "stream"),
+    "stt": (
+        "beam_size",
+        "silence_threshold",
+        "silence_duration",
+        "max_record_seconds",
+        "cascade_max_seconds",
+        "cascade_min_logprob",
+        "cascade_max_no_speech",
+    ),
+    "actions": ("enable_shutdown", "enable_inventory"),
+}
+
+
+class HotReloader:
+    """Vigila `commands.json` y la configuración (por mtime) y aplica los cambios sin recargar modelos.
+
+    Cada fichero se lee y valida entero antes de tocar nada: si está mal
+    formado se avisa y el asistente sigue con lo que tenía. Lo que no se puede
+    cambiar en marcha se ignora y se indica que requiere reiniciar.
+    """
+
+    def __init__(self, config, pipeline, config_file: str | None = None):
+        self.config = config
+        self.pipeline = pipeline
+        self.config_file = config_path(config_file)
+        self.interval = config.app.get("reload_interval_s", 2.0)
+        self._files: dict[Path, list] = {}
+        commands_path = getattr(pipeline.actions, "commands_path", None)
+        if commands_path is not None:
+            self._watch(Path(commands_path), self._reload_commands)
+        self._watch(self.config_file, self._reload_config)
+
+    def start(self):
+        if not self.interval or self.interval <= 0:
+            return
+        threading.Thread(target=self._loop, daemon=True, name="hot-reload").start()
+        names = ", ".join(str(p) for p in self._files)
+        print(f"[Recarga] Vigilando {names} cada {self.interval:g} s")
+
+    def check(self):
+        """Comprueba una vez si algún fichero ha cambiado y lo aplica."""
+        for path, entry in self._files.items():
+            stamp = _stamp(path)
+            if stamp is None or stamp == entry[0]:
+                continue
+            # Se guarda ya: si el fichero está mal, no se reintenta hasta el próximo cambio
+            entry[0] = stamp
+            started = time.perf_counter()
+            try:
+                summary = entry[1]()
+            except Exception as e:
+                print(f"[Recarga] {path} rechazado, se mantiene la versión anterior: {e}")
+                continue
+            if summary:
+                print(f"[Recarga] {path}: {summary} ({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+    def _watch(self, path: Path, handler):
+        self._files[path] = [_stamp(path), handler]
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[Recarga] Error vigilando ficheros: {e}")
+
+    def _reload_commands(self) -> str:
+        actions = self.pipeline.actions
+        if not actions.reload_commands():
+            return ""
+        # Las confirmaciones de los comandos nuevos se pre-renderizan como al arrancar
+        self.pipeline._prerender_phrases()
+        return f"{len(actions.commands)} comandos, {len(actions.aliases)} alias"
+
+    def _reload_config(self) -> str:
+        fresh = load_config(str(self.config_file))
+        changes = []
+        for section, keys in RUNTIME_KEYS.items():
+            current = self.config.get(section, {})
+            incoming = fresh.get(section, {})
+            if not isinstance(incoming, dict):
+                raise ValueError(f"la sección '{section}' debe ser un objeto")
+            for key in keys:
+                if key not in incoming or incoming[key] == current.get(key):
+                    continue
+                if not _same_kind(current.get(key), incoming[key]):
+                    raise ValueError(f"{section}.{key} tiene un tipo no válido ({incoming[key]!r})")
+                changes.append((section, key, incoming[key]))
+        restart = [name for name in _diff_keys(self.config, fresh) if not _reloadable(name)]
+        if restart:
+            print(f"[Recarga] Requieren reiniciar (se ignoran): {', '.join(restart)}")
+        if not changes:
+            return ""
+
+        for section, key, value in changes:
+            self.config[section][key] = value
+        for component in (self.pipeline, self.pipeline.stt, self.pipeline.llm):
+            refresh = getattr(component, "refresh_settings", None)
+            if refresh is not None:
+                refresh()
+        return "aplicado " + ", ".join(f"{section}.{key}" for section, key, _ in changes)
+
+
+def _stamp(path: Path):
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _reloadable(name: str) -> bool:
+    section, _, key = name.partition(".")
+    return key in RUNTIME_KEYS.get(section, ())
+
+
+def _same_kind(old, new) -> bool:
+    if old is None:
+        return True
+    if isinstance(old, bool):
+        return isinstance(new, bool)
+    if isinstance(old, (int, float)):
+        return isinstance(new, (int, float)) and not isinstance(new, bool)
+    return isinstance(new, type(old))
+
+
+def _diff_keys(old: dict, new: dict) -> list[str]:
+    """Claves `seccion.clave` con distinto valor entre dos configuraciones."""
+    names = []
+    for section in sorted(set(old) | set(new)):
+        a, b = old.get(section), new.get(section)
+        if isinstance(a, dict) and isinstance(b, dict):
+            names += [f"{section}.{key}" for key in sorted(set(a) | set(b)) if a.get(key) != b.get(key)]
+        elif a != b:
+            names.append(section)
+    return names
@@ -1,10 +1,19 @@
 from pathlib import Path
-import pynvml
 import re
+import threading
+import time
+from src import tracing
+from src.cancellation import check
+from src.residency import ModelSlot
+from src.text_stream import SearchTagFilter
+
+_STOP = ["Usuario:", "Pregunta:", "\nHola", "modelo de", "asistente de IA"]
 
 
 def _free_vram_gb() -> float:
     try:
+        import pynvml
+
         pynvml.nvmlInit()
         handle = pynvml.nvmlDeviceGetHandleByIndex(0)
         info = pynvml.nvmlDeviceGetMemoryInfo(handle)
@@ -19,16 +28,25 @@ class LlmEngine:
         self.config = cfg
         self.provider = cfg.get("provider", "local")
         self.web_search_enabled = cfg.get("web_search", False)
+        self.search_max_hops = cfg.get("search_max_hops", 2)
         self.searcher = None
+        self.prompt_cache = None
+        self.llm = None
+        self.residency = None
+        # Un solo hilo usa el contexto de llama.cpp a la vez (turnos y resumen en segundo plano)
+        self._lock = threading.Lock()
         
         if self.web_search_enabled:
             from src.web_search import WebSearch
-            self.searcher = WebSearch()
+            self.searcher = WebSearch(cfg)
         
         if self.provider == "gemini":
             self._init_gemini(cfg)
         else:
-            self._init_local(cfg)
+            self.residency = ModelSlot(
+                "LLM", lambda: self._init_local(cfg), self._unload_local, self._warm_up, config
+            )
+            self.residency.load()
     
     def _init_local(self, cfg):
         from llama_cpp import Llama
@@ -46,6 +64,21 @@ class LlmEngine:
             n_gpu_layers=n_gpu_layers,
             verbose=False,
         )
+        if cfg.get("prompt_cache", True):
+            from src.prompt_cache import PromptCache
+            self.prompt_cache = PromptCache(self.llm, cfg)
+
+    def _unload_local(self):
+        llm, self.llm, self.prompt_cache = self.llm, None, None
+        close = getattr(llm, "close", None)
+        if close is not None:
+            close()
+
+    def _warm_up(self):
+        # Un pase completo por el modelo: las páginas del GGUF mapeado pasan a RAM
+        self.llm.create_completion("Hola", max_tokens=1)
+        if self.prompt_cache is not None:
+            self.prompt_cache.forget_current()
     
     def _init_gemini(self, cfg):
         import google.generativeai as genai
@@ -66,72 +99,223 @@ class LlmEngine:
             },
         )
 
-    def generate(self, prompt: str, system_prompt: str = None) -> str:
-        max_tokens = self.config.get("max_tokens", 256)
-        temperature = self.config.get("temperature", 0.7)
-        top_p = self.config.get("top_p", 0.9)
-        
+    def refresh_settings(self):
+        """Relee los ajustes que se pueden cambiar en caliente (ver `hot_reload.RUNTIME_KEYS`)."""
+        self.web_search_enabled = self.config.get("web_search", False)
+        self.search_max_hops = self.config.get("search_max_hops", 2)
+        if self.web_search_enabled and self.searcher is None:
+            from src.web_search import WebSearch
+            self.searcher = WebSearch(self.config)
+
+    def generate(self, prompt: str, system_prompt: str = None, context: str = "", cancel=None, searches=None) -> str:
+        """`system_prompt` es el prefijo estable (se cachea); `context` va detrás y cambia cada turno.
+
+        Con `cancel` (CancelToken) lanza `Cancelled` entre pasos si el turno se cancela.
+        Si se pasa la lista `searches`, se le añaden las consultas web hechas para responder.
+        """
+        prefix = self._with_search_hint(system_prompt)
+        messages = self._messages(self._join_context(prefix, context), prompt)
+
+        reply = self._complete(messages, prefix=prefix)
+        for _ in range(self.search_max_hops):
+            found = re.findall(r'\[SEARCH:(.*?)\]', reply, re.IGNORECASE)
+            if not found or not (self.web_search_enabled and self.searcher):
+                break
+            # Se sigue la misma conversación: el KV de lo ya evaluado se reutiliza
+            check(cancel)
+            self._add_search_turn(messages, reply, found, cancel, searches)
+            reply = self._complete(messages)
+
+        check(cancel)
+        return reply
+
+    def generate_stream(self, prompt: str, system_prompt: str = None, context: str = "", cancel=None, searches=None):
+        """Igual que generate() pero va devolviendo el texto según se decodifica.
+
+        Las etiquetas [SEARCH:...] nunca salen del generador: se resuelven aquí y
+        la respuesta con resultados se emite a continuación. Las [CMD:...] se
+        dejan pasar para que el pipeline las ejecute. Si `cancel` se activa, la
+        decodificación se corta en el siguiente token.
+        """
+        prefix = self._with_search_hint(system_prompt)
+        messages = self._messages(self._join_context(prefix, context), prompt)
+
+        for hop in range(self.search_max_hops + 1):
+            tags = SearchTagFilter()
+            raw = []
+            for delta in self._complete_stream(messages, prefix=prefix if hop == 0 else None, cancel=cancel):
+                raw.append(delta)
+                text = tags.feed(delta)
+                if text:
+                    yield text
+            rest = tags.flush()
+            if rest:
+                yield rest
+            if not tags.searches or not (self.web_search_enabled and self.searcher):
+                return
+            if hop == self.search_max_hops:
+                print(f"[LLM] Límite de {self.search_max_hops} rondas de búsqueda alcanzado")
+                return
+            self._add_search_turn(messages, "".join(raw), tags.searches, cancel, searches)
+
+    def _with_search_hint(self, system_prompt: str | None) -> str:
         if system_prompt is None:
             system_prompt = self.config.get("system_prompt", "")
-        
+
         # Añadir capacidad de búsqueda al system prompt
         if self.web_search_enabled and self.searcher:
             system_prompt += "\n\nSi no conoces información actual o necesitas datos específicos, escribe [SEARCH:tu consulta aquí] y recibirás resultados de búsqueda."
-        
-        # Primera generación: detectar si pide búsqueda
+        return system_prompt
+
+    def count_tokens(self, text: str) -> int:
+        """Tokens de `text` con el tokenizador del modelo (estimación si no está cargado)."""
+        llm = self.llm
+        if llm is not None:
+            try:
+                return len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+            except Exception:
+                pass
+        return max(1, len(text) // 3)  # Español: ~3 caracteres por token
+
+    def summarize(self, text: str, max_tokens: int = 128) -> str:
+        """Resume una conversación en pocas frases (para el historial antiguo)."""
+        system_prompt = (
+            "Resume la conversación en 2 o 3 frases en español. Conserva nombres, datos y "
+            "peticiones pendientes; omite saludos."
+        )
+        return self._complete(self._messages(system_prompt, text), max_tokens=max_tokens, keep_prefix=True)
+
+    def cache_stats(self) -> dict:
+        if self.prompt_cache is None:
+            return {}
+        return self.prompt_cache.stats()
+
+    @staticmethod
+    def _join_context(prefix: str, context: str) -> str:
+        return f"{prefix}\n\n{context}" if context else prefix
+
+    def _prepare_prefix(self, prefix: str | None):
+        if self.prompt_cache is None:
+            return
+        if prefix is None:
+            self.prompt_cache.forget_current()
+            return
+        try:
+            with tracing.span("llm.prefix_cache") as record:
+                hits = self.prompt_cache.hits + self.prompt_cache.disk_hits
+                self.prompt_cache.prepare(prefix)
+                record["hit"] = self.prompt_cache.hits + self.prompt_cache.disk_hits > hits
+        except Exception as e:
+            self.prompt_cache.forget_current()
+            print(f"[LLM] Caché de prefijo no disponible: {e}")
+
+    def _add_search_turn(self, messages: list[dict], reply: str, searches: list[str], cancel=None, used=None):
+        """Añade la respuesta con [SEARCH:...] y un turno con los resultados.
+
+        La conversación anterior queda intacta, así llama.cpp solo evalúa los
+        mensajes nuevos (reutiliza el prefijo común ya presente en el KV).
+        """
+        print(f"[LLM] Búsquedas detectadas: {searches}")
+        queries = list(dict.fromkeys(q.strip() for q in searches if q.strip()))
+        if used is not None:
+            used.extend(queries)
+        search_results = []
+        with tracing.span("search", queries=len(queries)):
+            results = self.searcher.search_many(queries, cancel=cancel)
+        for query, result in zip(queries, results):
+            search_results.append(f"Búsqueda '{query}':\n{result}")
+
+        context = "\n\n".join(search_results)
+        messages.append({"role": "assistant", "content": reply.strip()})
+        messages.append({
+            "role": "user",
+            "content": f"Resultados de búsqueda:\n{context}\n\nResponde a mi pregunta anterior basándote en esta información:",
+        })
+
+    @staticmethod
+    def _messages(system_prompt: str, prompt: str) -> list[dict]:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ]
+
+    @staticmethod
+    def _gemini_prompt(messages: list[dict]) -> str:
+        if len(messages) == 2:
+            return f"{messages[0]['content']} {messages[1]['content']}".strip()
+        names = {"system": "", "user": "Usuario: ", "assistant": "Asistente: "}
+        return "\n\n".join(f"{names[m['role']]}{m['content']}" for m in messages)
+
+    def _chat_kwargs(self, messages: list[dict], max_tokens: int | None = None) -> dict:
+        return {
+            "messages": messages,
+            "max_tokens": max_tokens or self.config.get("max_tokens", 256),
+            "temperature": 0.3,
+            "top_p": 0.5,
+            "stop": _STOP,
+            "repeat_penalty": 1.2,
+        }
+
+    def _complete(
+        self, messages: list[dict], prefix: str | None = None, max_tokens: int | None = None, keep_prefix=False
+    ) -> str:
+        """Una pasada del modelo. Sin `prefix` no se toca el estado del KV (continuación).
+
+        Con `keep_prefix` (tareas sueltas como el resumen) el prefijo del turno
+        se vuelve a cargar al terminar, así el siguiente turno no lo recalcula.
+        """
         if self.provider == "gemini":
-            full_prompt = f"{system_prompt} {prompt}" if system_prompt else prompt
-            response = self.gemini_model.generate_content(full_prompt)
-            reply = response.text.strip()
-        else:
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ]
-            
-            out = self.llm.create_chat_completion(
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=0.3,
-                top_p=0.5,
-                stop=["Usuario:", "Pregunta:", "\nHola", "modelo de", "asistente de IA"],
-                repeat_penalty=1.2,
-            )
-            reply = out["choices"][0]["message"]["content"].strip()
-        
-        # Detectar y procesar búsquedas
-        if self.web_search_enabled and self.searcher:
-            search_pattern = r'\[SEARCH:(.*?)\]'
-            searches = re.findall(search_pattern, reply, re.IGNORECASE)
-            
-            if searches:
-                print(f"[LLM] Búsquedas detectadas: {searches}")
-                search_results = []
-                for query in searches:
-                    query = query.strip()
-                    result = self.searcher.search(query)
-                    search_results.append(f"Búsqueda '{query}':\n{result}")
-                
-                # Segunda generación con contexto de búsqueda
-                context = "\n\n".join(search_results)
-                enhanced_prompt = f"Pregunta original: {prompt}\n\nResultados de búsqueda:\n{context}\n\nResponde basándote en esta información:"
-                
-                if self.provider == "gemini":
-                    response = self.gemini_model.generate_content(enhanced_prompt)
-                    reply = response.text.strip()
-                else:
-                    messages = [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": enhanced_prompt}
-                    ]
-                    out = self.llm.create_chat_completion(
-                        messages=messages,
-                        max_tokens=max_tokens,
-                        temperature=0.3,
-                        top_p=0.5,
-                        stop=["Usuario:", "Pregunta:", "\nHola", "modelo de", "asistente de IA"],
-                        repeat_penalty=1.2,
-                    )
-                    reply = out["choices"][0]["message"]["content"].strip()
-        
-        return reply
+            response = self.gemini_model.generate_content(self._gemini_prompt(messages))
+            return response.text.strip()
+
+        with self.residency.use(), self._lock:
+            if not keep_prefix and (prefix is not None or len(messages) <= 2):
+                self._prepare_prefix(prefix)
+            with tracing.span("llm.completion", stream=False, messages=len(messages)) as record:
+                out = self.llm.create_chat_completion(**self._chat_kwargs(messages, max_tokens))
+                usage = out.get("usage") or {}
+                record["prompt_tokens"] = usage.get("prompt_tokens")
+                record["tokens"] = usage.get("completion_tokens")
+            if keep_prefix and self.prompt_cache is not None:
+                self.prompt_cache.reload_current()
+        return out["choices"][0]["message"]["content"].strip()
+
+    def _complete_stream(self, messages: list[dict], prefix: str | None = None, cancel=None):
+        if self.provider == "gemini":
+            for chunk in self.gemini_model.generate_content(self._gemini_prompt(messages), stream=True):
+                check(cancel)
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue  # Fragmento sin texto (p. ej. bloqueado por seguridad)
+                if text:
+                    yield text
+            return
+
+        with self.residency.use(), self._lock:
+            # Puede haber esperado al lock (otro turno o el resumen): no se hace el prefill en balde
+            check(cancel)
+            if prefix is not None or len(messages) <= 2:
+                self._prepare_prefix(prefix)
+            check(cancel)
+            with tracing.span("llm.completion", stream=True, messages=len(messages)) as record:
+                started = time.monotonic()
+                first = None
+                tokens = 0
+                stream = self.llm.create_chat_completion(stream=True, **self._chat_kwargs(messages))
+                for chunk in stream:
+                    if cancel is not None and cancel.cancelled:
+                        stream.close()  # llama.cpp deja de decodificar
+                        record["cancelled"] = True
+                        check(cancel)
+                    delta = chunk["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        tokens += 1  # llama.cpp emite ~1 token por fragmento
+                        if first is None:
+                            first = time.monotonic()
+                            record["prefill_ms"] = round((first - started) * 1000, 2)
+                            tracing.mark("llm.first_token")
+                        yield delta
+                record["tokens"] = tokens
+                if first is not None and tokens > 1:
+                    record["decode_tokens_per_s"] = round((tokens - 1) / max(time.monotonic() - first, 1e-6), 2)
@@ -0,0 +1,198 @@
+"""Persistencia en segundo plano para `UserMemory`.
+
+Las mutaciones se aplican en memoria y se encolan; un hilo escritor las
+vuelca cada `flush_interval` segundos con un solo fsync por tanda. Un fallo
+pierde como mucho el último intervalo.
+
+- `JournalStore`: diario de mutaciones (una línea JSON por cambio) que se
+  compacta periódicamente en el snapshot `data.json` (escritura atómica con
+  os.replace). Al cargar: snapshot + diario.
+- `SqliteStore`: una fila por campo en SQLite (WAL), una transacción por tanda.
+
+Las mutaciones son asignaciones absolutas (`path` → `value`), así que
+reaplicar el diario sobre un snapshot que ya las contiene no cambia nada.
+"""
+import atexit
+import copy
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+def _assign(data: dict, path, value):
+    node = data
+    for key in path[:-1]:
+        node = node.setdefault(key, {})
+    node[path[-1]] = value
+
+
+class _WriteBehind:
+    """Cola de mutaciones y el hilo que las escribe por tandas."""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, daemon=True, name=type(self).__name__)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, path, value):
+        """Encola `path = value` (coste: un append en memoria)."""
+        with self._lock:
+            self._pending.append((list(path), copy.deepcopy(value)))
+
+    def flush(self):
+        """Escribe ya lo pendiente (bloquea hasta el fsync)."""
+        with self._io_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._write(batch)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def _loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Memory] Error guardando memoria: {e}")
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+
+class JournalStore(_WriteBehind):
+    def __init__(self, snapshot_path, flush_interval: float = 1.0, compact_every: int = 200):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = self.snapshot_path.with_suffix(".journal")
+        self.compact_every = compact_every
+        self._journal_lines = 0
+        self._state = None
+        super().__init__(flush_interval)
+
+    def load(self, default: dict) -> dict:
+        data = default
+        if self.snapshot_path.exists():
+            try:
+                data = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"[Memory] Snapshot ilegible, se parte de cero: {e}")
+        replayed = 0
+        if self.journal_path.exists():
+            good = 0
+            with self.journal_path.open("rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Última línea a medio escribir en un corte
+                    _assign(data, entry["path"], entry["value"])
+                    replayed += 1
+                    good += len(line)
+            if good < self.journal_path.stat().st_size:
+                # Se corta el resto para que lo nuevo no quede pegado a la línea rota
+                with self.journal_path.open("r+b") as f:
+                    f.truncate(good)
+        self._journal_lines = replayed
+        self._state = copy.deepcopy(data)
+        if replayed:
+            print(f"[Memory] Reaplicados {replayed} cambios del diario")
+        return data
+
+    def _write(self, batch):
+        lines = "".join(
+            json.dumps({"path": path, "value": value}, ensure_ascii=False) + "\n" for path, value in batch
+        )
+        with self.journal_path.open("a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        # Copia propia del estado para compactar sin tocar el dict del pipeline
+        if self._state is not None:
+            for path, value in batch:
+                _assign(self._state, path, value)
+        self._journal_lines += len(batch)
+        if self._journal_lines >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        if self._state is None:
+            return
+        tmp = self.snapshot_path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self._state, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        # El snapshot ya contiene todo lo del diario
+        with self.journal_path.open("w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_lines = 0
+
+    def close(self):
+        super().close()
+        with self._io_lock:
+            if self._journal_lines:
+                self._compact()
+
+
+class SqliteStore(_WriteBehind):
+    def __init__(self, path, flush_interval: float = 1.0):
+        self.path = Path(path)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS memory (path TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.commit()
+        super().__init__(flush_interval)
+
+    def load(self, default: dict) -> dict:
+        data = default
+        with self._io_lock:
+            rows = self._db.execute("SELECT path, value FROM memory").fetchall()
+        if not rows:
+            # Primera vez: se importa el data.json existente si lo hay
+            legacy = self.path.with_suffix(".json")
+            if legacy.exists():
+                try:
+                    data = json.loads(legacy.read_text(encoding="utf-8"))
+                    for section, fields in data.items():
+                        for key, value in fields.items():
+                            self.record([section, key], value)
+                except Exception as e:
+                    print(f"[Memory] No se pudo importar {legacy}: {e}")
+        for path, value in rows:
+            _assign(data, json.loads(path), json.loads(value))
+        return data
+
+    def _write(self, batch):
+        latest = {json.dumps(path): value for path, value in batch}
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO memory (path, value) VALUES (?, ?)",
+                [(path, json.dumps(value, ensure_ascii=False)) for path, value in latest.items()],
+            )
+
+
+def create_store(cfg: dict, data_path):
+    backend = cfg.get("backend", "journal")
+    interval = cfg.get("flush_interval_s", 1.0)
+    if backend == "sqlite":
+        return SqliteStore(Path(data_path).with_suffix(".sqlite3"), flush_interval=interval)
+    return JournalStore(data_path, flush_interval=interval, compact_every=cfg.get("compact_every", 200))
@@ -8,6 +8,7 @@ def ensure_models(config) -> None:
     _ensure_llm(config)
     _ensure_tts(config)
     _ensure_stt(config)
+    _ensure_stt_fast(config)
 
 
 def _ensure_llm(config):
@@ -56,6 +57,17 @@ def _ensure_stt(config):
         )
 
 
+def _ensure_stt_fast(config):
+    # Opcional: sin modelo rápido la cascada se desactiva y se usa solo el grande
+    if not config.stt.get("cascade"):
+        return
+    path = Path(config.stt.get("fast_model_path", ""))
+    repo = config.stt.get("fast_hf_repo", "").strip()
+    if path.exists() or not repo:
+        return
+    _hf_snapshot(repo, path, revision=None, label="STT rápido")
+
+
 def _hf_download_file(repo_id: str, filename: str, dest: Path, revision: Optional[str], label: str = ""):
     try:
         from huggingface_hub import hf_hub_download
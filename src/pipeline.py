@@ -1,85 +1,179 @@
-from queue import Queue
-import platform
-import os
-import shutil
-import subprocess
+from queue import Empty, Queue
+import contextvars
+import threading
+import time
 from collections import deque
-from datetime import datetime, timedelta
+from datetime import datetime
 from src.user_memory import UserMemory
+from src.text_stream import SentenceSegmenter
+from src.command_index import normalize, tokenize
+from src import hardware, tracing
+from src.cancellation import CancelToken, Cancelled, check
+from src.context_packer import ContextPacker
+from src.response_cache import ResponseCache
 
 
 class Pipeline:
-    def __init__(self, config, events: Queue, stt, llm, tts, actions, sound_player):
+    WELCOME_MESSAGE = "Hola. Voy a hacerte unas preguntas para conocerte mejor. Sé breve y conciso."
+    ONBOARDING_DONE_MESSAGE = "Perfecto. Ya te conozco mejor."
+    DIRECT_COMMAND_FALLBACK = "Hecho."
+
+    def __init__(
+        self, config, events: Queue, stt, llm, tts, actions, sound_player, residency=None, response_cache=None
+    ):
+        self.config = config
         self.events = events
         self.stt = stt
         self.llm = llm
         self.tts = tts
         self.actions = actions
         self.sound_player = sound_player
+        self.residency = residency
+        self._turn_token = None
+        self._worker = None
         self.intent_hints = getattr(actions, "hints", lambda: [])
+        # Solo si nadie lo ha fijado ya (en modo servidor hay un pipeline por sesión)
+        if hasattr(stt, "command_lookup") and stt.command_lookup is None:
+            stt.command_lookup = self._is_command_utterance
+        self.stream_replies = config.llm.get("stream", True)
         self.system_context = self._system_summary()
-        self.conversation_history = deque(maxlen=20)  # Últimos 20 turnos (10 min aprox)
-        self.user_memory = UserMemory()
+        self.conversation_history = deque(maxlen=config.llm.get("history_max_turns", 50))
+        self.context_packer = ContextPacker(config, llm)
+        self.response_cache = response_cache or ResponseCache(config)
+        memory_cfg = config.get("memory", {})
+        self.user_memory = UserMemory(memory_cfg.get("path", "data.json"), memory_cfg)
         self.onboarding_mode = not self.user_memory.is_complete()
         self.waiting_for_field = None
         self.onboarding_started = False
+        self._prerender_phrases()
+
+    def refresh_settings(self):
+        self.stream_replies = self.config.llm.get("stream", True)
+
+    def _prerender_phrases(self):
+        """Deja en la caché del TTS las frases fijas para que suenen sin sintetizar."""
+        prerender = getattr(self.tts, "prerender", None)
+        if prerender is None:
+            return
+        phrases = [self.WELCOME_MESSAGE, self.ONBOARDING_DONE_MESSAGE, self.DIRECT_COMMAND_FALLBACK]
+        phrases += [question for _, question in self.user_memory.onboarding_questions]
+        phrases += getattr(self.actions, "confirmations", list)()
+        prerender(phrases)
 
     def run(self):
+        """Despachador: cada wake cancela el turno en curso y lanza uno nuevo en otro hilo."""
         while True:
             event = self.events.get()
-            if event.get("type") == "wake":
-                # Onboarding en la primera llamada
-                if self.onboarding_mode and not self.onboarding_started:
-                    self._run_onboarding()
-                else:
-                    self._handle_wake()
-
-    def _handle_wake(self):
+            if event.get("type") != "wake":
+                continue
+            if self._turn_token is not None:
+                self._turn_token.cancel("nuevo wake")
+            if self._worker is not None:
+                # Un paso que no se puede cortar (decodificar, prefill) no retrasa el turno
+                # nuevo: pasado el margen se arranca igual y el anterior termina por su cuenta
+                self._worker.join(self.config.app.get("barge_in_wait_s", 0.3))
+                if self._worker.is_alive():
+                    print("[Pipeline] El turno anterior sigue terminando; se atiende el nuevo wake ya")
+            # Los wakes acumulados mientras acababa el turno anterior cuentan como uno
+            event = self._latest_wake(event)
+            token = CancelToken()
+            self._turn_token = token
+            self._worker = threading.Thread(target=self._run_turn, args=(event, token), daemon=True, name="turn")
+            self._worker.start()
+
+    def _latest_wake(self, event: dict) -> dict:
+        coalesced = 0
+        while True:
+            try:
+                newer = self.events.get_nowait()
+            except Empty:
+                break
+            if newer.get("type") == "wake":
+                event = newer
+                coalesced += 1
+        if coalesced:
+            print(f"[Pipeline] {coalesced} wakes en cola agrupados en uno")
+        return event
+
+    def _run_turn(self, event: dict, cancel: CancelToken):
+        turn = tracing.start_turn(event.get("time"))
+        tracing.mark("wake")
+        if self.residency is not None:
+            # Lo descargado por inactividad se recarga mientras el usuario habla
+            self.residency.prefetch()
+        try:
+            # Onboarding en la primera llamada
+            if self.onboarding_mode and not self.onboarding_started:
+                self._run_onboarding(cancel)
+            else:
+                self._handle_wake(event.get("position"), cancel)
+        except Cancelled:
+            print(f"[Pipeline] Turno cancelado ({cancel.reason})")
+        finally:
+            if turn is not None and cancel.cancelled:
+                turn.attrs["cancelled"] = True
+            tracing.end_turn(turn)
+            # Fuera del camino crítico: la respuesta ya se ha dado
+            self.context_packer.refresh_summary_async()
+
+    def _handle_wake(self, position=None, cancel: CancelToken | None = None):
         try:
             print("[Pipeline] Grabando audio...")
-            text = self.stt.transcribe()
+            text = self.stt.transcribe(start_position=position, cancel=cancel)
             print(f"[Pipeline] Transcrito: {text}")
             
             if not text:
                 print("[Pipeline] Sin texto, finalizando")
                 return
 
+            # Órdenes directas ("abre spotify"): se ejecutan sin pasar por el LLM
+            started = time.perf_counter()
+            command = self._classify_intent(text)
+            if command:
+                check(cancel)
+                with tracing.span("action", command=command, direct=True):
+                    reply = self.actions.handle(command) or self.DIRECT_COMMAND_FALLBACK
+                print(f"[Pipeline] Comando directo: {command} ({(time.perf_counter() - started) * 1000:.1f} ms, sin LLM)")
+                self._add_to_history(text, reply)
+                self.user_memory.increment_interactions()
+                self.tts.speak(reply, cancel=cancel)
+                print("[Pipeline] Ciclo completado")
+                return
+
             # LLM decide TODO (sin clasificación previa)
             print("[Pipeline] Generando respuesta LLM...")
-            system_prompt = self.llm.config.get("system_prompt", "Responde breve.")
-            hints = getattr(self.actions, "hints", lambda: [])()
-            
-            if self.system_context:
-                system_prompt = f"{system_prompt}\nDatos del equipo: {self.system_context}"
-            
-            # Instrucciones claras para comandos
-            if hints:
-                system_prompt += f"\n\nPuedes ejecutar estos comandos: {', '.join(hints)}."
-                system_prompt += "\n\nPara ABRIR/EJECUTAR una aplicación: escribe [CMD:nombre_exacto]."
-                system_prompt += "\nEjemplo: 'Abre Discord' → '[CMD:discord] Abriendo Discord'"
-                system_prompt += "\nEjemplo: 'Necesito el administrador de tareas' → '[CMD:administrador tareas] Aquí está'"
-            
-            # Instrucciones para búsquedas web
-            web_enabled = self.llm.config.get("web_search", False)
-            if web_enabled:
-                system_prompt += "\n\nPara BUSCAR EN INTERNET: escribe [SEARCH:consulta]."
-                system_prompt += "\nEjemplo: 'Busca qué es GitHub' → '[SEARCH:qué es GitHub]'"
-                system_prompt += "\nEjemplo: '¿Quién ganó el mundial?' → '[SEARCH:mundial fútbol ganador 2022]'"
-                system_prompt += "\n\nDISTINGUE: 'Abre Epic Games' = [CMD:epic games] | 'Busca qué es Epic Games' = [SEARCH:qué es Epic Games]"
-            
-            system_prompt += "\n\nNUNCA inventes comandos que no estén en la lista."
-            
-            # Añadir memoria del usuario
-            user_context = self.user_memory.get_context()
-            if user_context:
-                system_prompt += f"\n\nDatos del usuario:\n{user_context}"
-            
-            # Añadir historial de conversación
-            history_context = self._get_recent_history()
-            if history_context:
-                system_prompt += f"\n\nHistorial reciente:\n{history_context}"
-            
-            reply = self.llm.generate(text, system_prompt=system_prompt)
+            system_prompt, context = self._build_system_prompt(text)
+
+            cached = self.response_cache.lookup(text, system_prompt, context)
+            if cached is not None:
+                check(cancel)
+                self._add_to_history(text, cached.reply)
+                self.user_memory.increment_interactions()
+                cleaned_reply, embedded_cmds = self._extract_commands(cached.reply)
+                self._run_embedded_commands(embedded_cmds, cancel)
+                self.tts.speak(cleaned_reply, cancel=cancel)
+                print("[Pipeline] Ciclo completado")
+                return
+
+            searches = []
+            started = time.perf_counter()
+            if self.stream_replies:
+                reply, generation_ms = self._speak_streamed(text, system_prompt, context, cancel, searches)
+                self._add_to_history(text, reply)
+                self.user_memory.increment_interactions()
+                self._log_prompt_cache()
+                check(cancel)
+                self.response_cache.store(
+                    text, system_prompt, context, reply, generation_ms, bool(searches)
+                )
+                print("[Pipeline] Ciclo completado")
+                return
+
+            reply = self.llm.generate(
+                text, system_prompt=system_prompt, context=context, cancel=cancel, searches=searches
+            )
+            self._log_prompt_cache()
+            generation_ms = (time.perf_counter() - started) * 1000
             
             # Guardar en historial e incrementar interacciones
             self._add_to_history(text, reply)
@@ -88,186 +182,236 @@ class Pipeline:
             # Clean up if model continues dialogue
             if "Usuario:" in reply or "Pregunta:" in reply:
                 reply = reply.split("Usuario:")[0].split("Pregunta:")[0].strip()
+            self.response_cache.store(
+                text, system_prompt, context, reply, generation_ms, bool(searches)
+            )
             
             print(f"[Pipeline] LLM respondió: {reply}")
             # Parsear comandos embebidos [CMD:...] y validar que existan
             cleaned_reply, embedded_cmds = self._extract_commands(reply)
-            valid_hints = set(self.intent_hints())
-            for cmd_name in embedded_cmds:
-                if cmd_name in valid_hints:
-                    executed = self.actions.handle(cmd_name)
-                    if executed:
-                        print(f"[Pipeline] Comando embebido ejecutado: {cmd_name}")
-                else:
-                    print(f"[Pipeline] Comando embebido ignorado (no existe): {cmd_name}")
-            self.tts.speak(cleaned_reply)
+            self._run_embedded_commands(embedded_cmds, cancel)
+            self.tts.speak(cleaned_reply, cancel=cancel)
             print("[Pipeline] Ciclo completado")
+        except Cancelled:
+            raise
         except Exception as e:
             import traceback
             print(f"[Pipeline] Error: {e}")
             traceback.print_exc()
 
+    def _build_system_prompt(self, text: str = "") -> tuple[str, str]:
+        """Devuelve (prefijo estable, contexto volátil).
+
+        El prefijo solo cambia si cambian comandos, config o memoria del usuario,
+        así el LLM puede reutilizar su estado evaluado entre turnos. Memoria e
+        historial se recortan al presupuesto de tokens de `ContextPacker`.
+        """
+        system_prompt = self.llm.config.get("system_prompt", "Responde breve.")
+        hints = getattr(self.actions, "hints", lambda: [])()
+        
+        if self.system_context:
+            system_prompt = f"{system_prompt}\nDatos del equipo: {self.system_context}"
+        
+        # Instrucciones claras para comandos
+        if hints:
+            system_prompt += f"\n\nPuedes ejecutar estos comandos: {', '.join(hints)}."
+            system_prompt += "\n\nPara ABRIR/EJECUTAR una aplicación: escribe [CMD:nombre_exacto]."
+            system_prompt += "\nEjemplo: 'Abre Discord' → '[CMD:discord] Abriendo Discord'"
+            system_prompt += "\nEjemplo: 'Necesito el administrador de tareas' → '[CMD:administrador tareas] Aquí está'"
+        
+        # Instrucciones para búsquedas web
+        web_enabled = self.llm.config.get("web_search", False)
+        if web_enabled:
+            system_prompt += "\n\nPara BUSCAR EN INTERNET: escribe [SEARCH:consulta]."
+            system_prompt += "\nEjemplo: 'Busca qué es GitHub' → '[SEARCH:qué es GitHub]'"
+            system_prompt += "\nEjemplo: '¿Quién ganó el mundial?' → '[SEARCH:mundial fútbol ganador 2022]'"
+            system_prompt += "\n\nDISTINGUE: 'Abre Epic Games' = [CMD:epic games] | 'Busca qué es Epic Games' = [SEARCH:qué es Epic Games]"
+        
+        system_prompt += "\n\nNUNCA inventes comandos que no estén en la lista."
+        
+        # Memoria del usuario en el prefijo; historial y resumen fuera del prefijo cacheado
+        prefix, context = self.context_packer.pack(
+            system_prompt, self.user_memory.get_context(), self.conversation_history, prompt=text
+        )
+        stats = self.context_packer.last_stats
+        print(f"[Pipeline] Contexto: {stats['used']}/{stats['budget']} tokens, {stats['turns']} turnos")
+        return prefix, context
+
+    def _log_prompt_cache(self):
+        stats = getattr(self.llm, "cache_stats", dict)()
+        if stats:
+            print(
+                f"[Pipeline] Caché de prefijo: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['saved_prefill_tokens']} tokens de prefill ahorrados"
+            )
+
+    def _speak_streamed(
+        self, text: str, system_prompt: str, context: str = "", cancel=None, searches=None
+    ) -> tuple[str, float | None]:
+        """Habla la respuesta frase a frase mientras el LLM sigue decodificando.
+
+        Devuelve la respuesta completa (con etiquetas [CMD:...]) para el historial
+        (si el turno se cancela, lo generado hasta ese momento) y lo que tardó el
+        LLM en terminar de generar, o None si no terminó.
+        """
+        sentences: Queue = Queue()
+        started = time.perf_counter()
+        generation_ms = []  # Solo se rellena si el LLM termina sin error
+
+        def produce():
+            segmenter = SentenceSegmenter()
+            try:
+                stream = self.llm.generate_stream(
+                    text, system_prompt=system_prompt, context=context, cancel=cancel, searches=searches
+                )
+                for delta in stream:
+                    for sentence in segmenter.feed(delta):
+                        sentences.put(sentence)
+                for sentence in segmenter.flush():
+                    sentences.put(sentence)
+                generation_ms.append((time.perf_counter() - started) * 1000)
+            except Cancelled:
+                pass
+            except Exception as e:
+                print(f"[Pipeline] Error en streaming LLM: {e}")
+            finally:
+                sentences.put(None)
+
+        first_audio = []
+
+        def mark_first_audio():
+            if not first_audio:
+                first_audio.append(time.perf_counter())
+
+        # El hilo del LLM mide en el turno de este hilo (contextvars de tracing)
+        threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True).start()
+        reply_parts = []
+        utterances = []
+        while True:
+            sentence = sentences.get()
+            if sentence is None:
+                break
+            reply_parts.append(sentence)
+            interrupted = (cancel is not None and cancel.cancelled) or (utterances and utterances[-1].dropped)
+            if interrupted:
+                continue  # Barge-in: se sigue vaciando la cola para el historial
+            print(f"[Pipeline] LLM frase: {sentence}")
+            cleaned, embedded_cmds = self._extract_commands(sentence)
+            self._run_embedded_commands(embedded_cmds, cancel)
+            if cleaned:
+                # Se encola sin esperar: esta frase se sintetiza mientras suena la anterior
+                utterances.append(self.tts.enqueue(cleaned, on_start=mark_first_audio, cancel=cancel))
+        for utterance in utterances:
+            utterance.wait()
+
+        reply = " ".join(reply_parts).strip()
+        if first_audio:
+            print(f"[Pipeline] Primer audio en {(first_audio[0] - started) * 1000:.0f} ms")
+        print(f"[Pipeline] LLM respondió: {reply}")
+        return reply, (generation_ms[0] if generation_ms else None)
+
+    def _run_embedded_commands(self, embedded_cmds, cancel=None):
+        valid_hints = set(self.intent_hints())
+        for cmd_name in embedded_cmds:
+            if cancel is not None and cancel.cancelled:
+                print(f"[Pipeline] Comando embebido no ejecutado (turno cancelado): {cmd_name}")
+                continue
+            if cmd_name in valid_hints:
+                with tracing.span("action", command=cmd_name):
+                    executed = self.actions.handle(cmd_name)
+                if executed:
+                    print(f"[Pipeline] Comando embebido ejecutado: {cmd_name}")
+            else:
+                print(f"[Pipeline] Comando embebido ignorado (no existe): {cmd_name}")
+
     def _classify_intent(self, text: str) -> str | None:
-        hints = self.intent_hints()
-        if not hints:
+        """Devuelve el comando si `text` es una orden directa e inequívoca.
+
+        Solo usa el índice de comandos (sin LLM): si hay dudas devuelve None y
+        la frase sigue el camino normal del LLM.
+        """
+        match_all = getattr(self.actions, "match_all", None)
+        if match_all is None:
             return None
 
-        norm_text = self._norm(text)
         lower_text = text.lower()
+        tokens = set(tokenize(text))
         
         # Detectar búsquedas web y preguntas (no ejecutar comandos)
         search_words = ["busca", "búsqueda", "investiga", "consulta en", "mira en internet", "en internet", "en la web"]
         question_words = ["qué es", "quién", "cómo", "cuándo", "dónde", "por qué", "cuál", "explica", "dime sobre", "qué significa", "para qué"]
         
         is_search = any(sw in lower_text for sw in search_words)
-        is_question = any(qw in lower_text for qw in question_words)
+        is_question = "?" in text or any(qw in lower_text for qw in question_words)
         
         if is_search or is_question:
             return None
 
-        # Filtra hints que aparezcan en el texto normalizado; si no hay ninguno, no clasifica
-        candidate_hints = [h for h in hints if self._norm(h) in norm_text]
-        if not candidate_hints:
+        # Coincidencia directa solo si es orden explícita de abrir: los comandos de
+        # commands.json solo abren, así que "cierra spotify" lo resuelve el LLM
+        open_words = {"abre", "abreme", "abrir", "inicia", "ejecuta", "lanza"}
+        other_words = {"cierra", "cierrame", "cerrar", "activa", "desactiva", "apaga", "para", "deten", "quita", "mata"}
+        if tokens & other_words:
             return None
 
-        # Coincidencia directa solo si es comando explícito
-        action_words = ["abre", "abrir", "inicia", "ejecuta", "lanza", "cierra", "activa"]
-        has_action = any(aw in lower_text for aw in action_words)
-        
-        if has_action:
-            for hint in candidate_hints:
-                norm_hint = self._norm(hint)
-                if norm_hint in norm_text:
-                    return hint
-
-        options = ", ".join(candidate_hints)
-        prompt = (
-            "Opciones: "
-            + options
-            + ". Usuario: "
-            + text
-            + ". Si es pregunta, responde 'none'. Si es comando para ejecutar, responde la opción exacta."
-        )
-        try:
-            prediction = self.llm.generate(
-                prompt,
-                system_prompt="Si es pregunta sobre algo, devuelve 'none'. Si es comando para ejecutar, devuelve la opción exacta de la lista.",
-            )
-            norm_pred = self._norm(prediction)
-            if norm_pred in ("none", "ninguna"):
-                return None
-
-            # Empareja por igualdad normalizada
-            for hint in candidate_hints:
-                if self._norm(hint) == norm_pred:
-                    return hint
-        except Exception:
+        # El verbo tiene que ir justo delante del comando: "inicia sesión en discord" no abre Discord
+        if not match_all(text, after=open_words):
+            return None
+        matches = match_all(text)
+        if len({m.intent for m in matches}) != 1:
             return None
-        return None
+        return max(matches, key=lambda m: m.length).label
+
+    def _is_command_utterance(self, text: str) -> bool:
+        """La frase es exactamente una orden conocida (la cascada de STT la da por buena)."""
+        if self._classify_intent(text):
+            return True
+        exact_match = getattr(self.actions, "exact_match", None)
+        return exact_match is not None and exact_match(text) is not None
 
     def _norm(self, text: str) -> str:
-        clean = text.lower().strip()
-        for art in ("el ", "la ", "los ", "las ", "al ", "del "):
-            if clean.startswith(art):
-                clean = clean[len(art):]
-                break
-        return clean.strip(".,!? ")
+        return normalize(text)
 
     def _system_summary(self) -> str:
         try:
-            uname = platform.uname()
-            os_name = f"{uname.system} {uname.release}".strip()
-            cpu, cores = self._cpu_info()
-
-            # RAM y disco (best-effort, sin deps externas)
-            total_ram_gb = None
-            try:
-                import psutil  # type: ignore
-
-                total_ram_gb = round(psutil.virtual_memory().total / (1024 ** 3), 1)
-            except Exception:
-                total_ram_gb = None
-
-            disk_total = None
-            disk_free = None
-            try:
-                drive = os.path.splitdrive(os.getcwd())[0] or "/"
-                usage = shutil.disk_usage(drive)
-                disk_total = round(usage.total / (1024 ** 3), 1)
-                disk_free = round(usage.free / (1024 ** 3), 1)
-            except Exception:
-                pass
-
-            gpus = self._gpu_names()
-
-            parts = [f"OS: {os_name}", f"CPU: {cpu} ({cores} hilos)"]
-            if total_ram_gb:
-                parts.append(f"RAM: {total_ram_gb} GB")
-            if disk_total and disk_free is not None:
-                parts.append(f"Disco: {disk_free} GB libres de {disk_total} GB")
-            if gpus:
-                parts.append(f"GPU: {', '.join(gpus)}")
-            return ", ".join(parts)
+            return hardware.get_provider(self.config).summary()
         except Exception:
             return ""
-
-    def _gpu_names(self):
-        try:
-            cmd = [
-                "powershell",
-                "-Command",
-                "Get-CimInstance Win32_VideoController | Select-Object -ExpandProperty Name"
-            ]
-            out = subprocess.check_output(cmd, text=True, timeout=5)
-            names = [line.strip() for line in out.splitlines() if line.strip()]
-            return names[:3]  # limitar para no alargar el prompt
-        except Exception:
-            return []
-
-    def _cpu_info(self):
-        # Intento 1: PowerShell para obtener el nombre amigable
-        try:
-            cmd = [
-                "powershell",
-                "-Command",
-                "Get-CimInstance Win32_Processor | Select-Object -First 1 -ExpandProperty Name"
-            ]
-            out = subprocess.check_output(cmd, text=True, timeout=5).strip()
-            name = out if out else "cpu-desconocido"
-        except Exception:
-            name = platform.uname().processor or "cpu-desconocido"
-
-        cores = os.cpu_count() or 0
-        return name, cores
     
-    def _run_onboarding(self):
+    def _run_onboarding(self, cancel=None):
         """Ejecuta proceso de onboarding completo al inicio"""
         self.onboarding_started = True
         print("[Memory] Iniciando onboarding...")
-        
+        try:
+            self._ask_onboarding_questions(cancel)
+        except Cancelled:
+            # Se vuelve a empezar en el siguiente wake
+            self.onboarding_started = False
+            raise
+
+        # Completar onboarding
+        self.onboarding_mode = False
+        print("[Memory] Onboarding completo")
+        self.tts.speak(self.ONBOARDING_DONE_MESSAGE, cancel=cancel)
+
+    def _ask_onboarding_questions(self, cancel=None):
         # Mensaje de bienvenida
-        welcome = "Hola. Voy a hacerte unas preguntas para conocerte mejor. Sé breve y conciso."
-        self.tts.speak(welcome)
+        self.tts.speak(self.WELCOME_MESSAGE, cancel=cancel)
         
         # Iterar por cada pregunta
         for field, question in self.user_memory.onboarding_questions:
+            check(cancel)
             print(f"[Memory] Pregunta: {question}")
-            self.tts.speak(question)
+            self.tts.speak(question, cancel=cancel)
             
             # Escuchar respuesta (sin sonido de listening)
-            answer = self.stt.transcribe()
+            answer = self.stt.transcribe(cancel=cancel)
             
             if answer:
                 self.user_memory.update_field(field, answer)
                 print(f"[Memory] Guardado: {field} = {answer}")
             else:
                 print(f"[Memory] Sin respuesta para: {field}")
-        
-        # Completar onboarding
-        self.onboarding_mode = False
-        completion_msg = "Perfecto. Ya te conozco mejor."
-        print("[Memory] Onboarding completo")
-        self.tts.speak(completion_msg)
     
     def _add_to_history(self, user_text: str, assistant_reply: str):
         """Añade una interacción al historial con timestamp"""
@@ -278,24 +422,6 @@ class Pipeline:
             "assistant": assistant_reply
         })
     
-    def _get_recent_history(self) -> str:
-        """Obtiene historial de los últimos 10 minutos"""
-        if not self.conversation_history:
-            return ""
-        
-        cutoff_time = datetime.now() - timedelta(minutes=10)
-        recent = [entry for entry in self.conversation_history if entry["time"] > cutoff_time]
-        
-        if not recent:
-            return ""
-        
-        history_lines = []
-        for entry in recent[-10:]:  # Máximo 10 interacciones
-            history_lines.append(f"Usuario: {entry['user']}")
-            history_lines.append(f"Tú: {entry['assistant']}")
-        
-        return "\n".join(history_lines)
-
     def _extract_commands(self, text: str):
         """Extrae comandos embebidos [CMD:nombre] y devuelve texto limpio + lista de comandos."""
         import re
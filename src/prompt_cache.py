@@ -0,0 +1,188 @@
+import hashlib
+import inspect
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+
+
+class PromptCache:
+    """Reutiliza el estado KV de llama.cpp para el prefijo estable del system prompt.
+
+    El prefijo (persona, equipo, comandos, búsquedas, memoria del usuario) se
+    evalúa una vez, se guarda con `Llama.save_state` en memoria y en disco, y
+    en los turnos siguientes llama.cpp solo tiene que evaluar lo que viene
+    detrás (historial y frase del usuario).
+
+    Del `LlamaState` solo se guarda lo imprescindible (datos del contexto,
+    tokens y su número): la matriz de logits (n_batch x n_vocab) pesa cientos
+    de MB con vocabularios grandes y se reconstruye vacía al cargar.
+    """
+
+    def __init__(self, llm, cfg):
+        self.llm = llm
+        self.n_ctx = cfg.get("context_length", 4096)
+        self.cache_dir = Path(cfg.get("prompt_cache_dir", "cache/llm_state"))
+        self.max_files = cfg.get("prompt_cache_max_files", 2)
+        self.max_disk_bytes = cfg.get("prompt_cache_max_mb", 512) * 1024 * 1024
+        self.max_memory = 2
+        model_path = Path(cfg["model_path"])
+        stat = model_path.stat()
+        self.model_id = f"{model_path.name}:{stat.st_size}:{int(stat.st_mtime)}"
+        self._states = OrderedDict()  # key -> (estado compacto, tokens del prefijo)
+        self._current = None  # clave del prefijo que ya está en el KV de llama
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+    def key(self, prefix: str) -> str:
+        digest = hashlib.sha256(f"v2|{self.model_id}|{self.n_ctx}|{prefix}".encode("utf-8"))
+        return digest.hexdigest()[:32]
+
+    def prepare(self, prefix: str):
+        """Deja el KV de llama con `prefix` evaluado antes de una completion."""
+        key = self.key(prefix)
+        if key == self._current and key in self._states:
+            # llama.cpp ya reutiliza el prefijo común con la llamada anterior
+            self._hit(key)
+            return
+
+        entry = self._states.get(key)
+        if entry is None:
+            entry = self._load_from_disk(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+
+        if entry is not None:
+            self.llm.load_state(self._restore(entry[0]))
+            self._current = key
+            self._hit(key)
+            return
+
+        self.misses += 1
+        start = time.perf_counter()
+        # Evalúa el system prompt con la plantilla de chat; el siguiente turno
+        # comparte esos tokens y llama.cpp solo evalúa el resto.
+        self.llm.create_chat_completion(
+            messages=[{"role": "system", "content": prefix}],
+            max_tokens=1,
+            temperature=0.0,
+        )
+        n_tokens = len(self.llm.tokenize(prefix.encode("utf-8"), add_bos=False))
+        entry = (_compact(self.llm.save_state()), n_tokens)
+        self._remember(key, entry)
+        self._current = key
+        print(f"[LLM] Prefijo evaluado y guardado ({n_tokens} tokens, {(time.perf_counter() - start) * 1000:.0f} ms)")
+        threading.Thread(target=self._save_to_disk, args=(key, entry), daemon=True).start()
+
+    def reload_current(self):
+        """Vuelve a dejar el prefijo actual en el KV tras usar el modelo con otro prompt.
+
+        Cargar el estado guardado es una copia de memoria; evaluar el prefijo de
+        nuevo en el siguiente turno sería un prefill completo.
+        """
+        entry = self._states.get(self._current) if self._current is not None else None
+        if entry is None:
+            self._current = None
+            return
+        try:
+            self.llm.load_state(self._restore(entry[0]))
+        except Exception as e:
+            self._current = None
+            print(f"[LLM] No se pudo restaurar el prefijo: {e}")
+
+    def forget_current(self):
+        """Llamar cuando se usa el modelo con otro prompt (el KV deja de tener el prefijo)."""
+        self._current = None
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "saved_prefill_tokens": self.saved_tokens,
+        }
+
+    def _hit(self, key):
+        self.hits += 1
+        self.saved_tokens += self._states[key][1]
+        self._states.move_to_end(key)
+
+    def _remember(self, key, entry):
+        self._states[key] = entry
+        self._states.move_to_end(key)
+        while len(self._states) > self.max_memory:
+            self._states.popitem(last=False)
+
+    def _restore(self, state: dict):
+        """`LlamaState` a partir del estado compacto, con logits a cero (se recalculan al decodificar)."""
+        from llama_cpp import LlamaState
+
+        n_tokens = state["n_tokens"]
+        # load_state sustituye el array entero de tokens: tiene que medir n_ctx
+        input_ids = np.zeros_like(self.llm.input_ids)
+        input_ids[:n_tokens] = state["input_ids"]
+        scores = self.llm.scores
+        rows = min(n_tokens, scores.shape[0])
+        fields = {
+            "input_ids": input_ids,
+            # Vista de ceros sin reservar memoria; load_state la copia a su búfer
+            "scores": np.broadcast_to(np.zeros(scores.shape[1], dtype=np.float32), (rows, scores.shape[1])),
+            "n_tokens": n_tokens,
+            "llama_state": state["llama_state"],
+            "llama_state_size": state["llama_state_size"],
+        }
+        if "seed" in inspect.signature(LlamaState).parameters:
+            fields["seed"] = state.get("seed", 0)
+        return LlamaState(**fields)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.state"
+
+    def _load_from_disk(self, key):
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with path.open("rb") as f:
+                entry = pickle.load(f)
+            if not isinstance(entry[0], dict):
+                raise ValueError("formato antiguo")
+            return entry
+        except Exception as e:
+            path.unlink(missing_ok=True)
+            print(f"[LLM] Estado en disco inválido ({path.name}): {e}")
+            return None
+
+    def _save_to_disk(self, key, entry):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._path(key)
+            tmp = path.with_suffix(".tmp")
+            with tmp.open("wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp.replace(path)
+            # Conserva solo los estados más recientes, dentro del límite de tamaño
+            files = sorted(self.cache_dir.glob("*.state"), key=lambda p: p.stat().st_mtime, reverse=True)
+            used = 0
+            for index, old in enumerate(files):
+                used += old.stat().st_size
+                if index >= self.max_files or used > self.max_disk_bytes:
+                    old.unlink(missing_ok=True)
+        except Exception as e:
+            print(f"[LLM] No se pudo guardar el estado del prefijo: {e}")
+
+
+def _compact(state) -> dict:
+    n_tokens = state.n_tokens
+    return {
+        "llama_state": bytes(state.llama_state),
+        "llama_state_size": state.llama_state_size,
+        "input_ids": np.asarray(state.input_ids)[:n_tokens].copy(),
+        "n_tokens": n_tokens,
+        "seed": getattr(state, "seed", 0),
+    }
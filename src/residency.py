@@ -0,0 +1,248 @@
+"""Residencia de modelos: calentamiento al cargar y descarga por inactividad.
+
+Cada motor (STT, LLM, TTS) envuelve su modelo en un `ModelSlot`: el slot sabe
+cargarlo, calentarlo con una inferencia de prueba y liberarlo. Los motores
+usan el modelo dentro de `with slot.use():`, que lo recarga si hacía falta y
+apunta la hora del último uso. `ResidencyManager` revisa periódicamente los
+slots y descarga los que llevan demasiado tiempo sin usarse o, si el proceso
+supera el presupuesto de memoria, los menos usados recientemente.
+"""
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src import tracing
+
+
+def _rss_bytes() -> int | None:
+    """Memoria residente del proceso (psutil si está; si no, /proc en Linux)."""
+    try:
+        import psutil  # type: ignore
+
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ModelSlot:
+    """Modelo descargable de un motor: `load()` y `unload()` son idempotentes."""
+
+    def __init__(self, name: str, load, unload, warm_up=None, config=None):
+        cfg = config.get("residency", {}) if config is not None else {}
+        self.name = name
+        self._load = load
+        self._unload = unload
+        self._warm_up = warm_up if cfg.get("warm_up", True) else None
+        self._cond = threading.Condition()
+        self.loaded = False
+        self.loading = False
+        self.busy = 0
+        self.last_used = time.monotonic()
+        self.loads = 0
+        self.unloads = 0
+        self.last_load_ms = 0.0
+        self.last_warmup_ms = 0.0
+        self.reload_ms_total = 0.0
+
+    def load(self):
+        """Carga (y calienta) el modelo; si otro hilo lo está cargando, espera."""
+        with self._cond:
+            while self.loading:
+                self._cond.wait()
+            if self.loaded:
+                return
+            self.loading = True
+        reload = self.loads > 0
+        started = time.perf_counter()
+        try:
+            self._load()
+            loaded_at = time.perf_counter()
+            warmup_ms = 0.0
+            if self._warm_up is not None:
+                try:
+                    self._warm_up()
+                except Exception as e:
+                    print(f"[Residencia] Calentamiento de {self.name} fallido: {e}")
+                warmup_ms = (time.perf_counter() - loaded_at) * 1000
+        except Exception:
+            with self._cond:
+                self.loading = False
+                self._cond.notify_all()
+            raise
+        total_ms = (time.perf_counter() - started) * 1000
+        with self._cond:
+            self.loaded = True
+            self.loading = False
+            self.loads += 1
+            self.last_load_ms = total_ms
+            self.last_warmup_ms = warmup_ms
+            if reload:
+                self.reload_ms_total += total_ms
+            self.last_used = time.monotonic()
+            self._cond.notify_all()
+        action = "recargado" if reload else "cargado"
+        print(f"[Residencia] {self.name} {action} en {total_ms:.0f} ms (calentamiento {warmup_ms:.0f} ms)")
+
+    def load_async(self):
+        if self.loaded or self.loading:
+            return
+
+        def work():
+            try:
+                self.load()
+            except Exception as e:
+                print(f"[Residencia] No se pudo recargar {self.name}: {e}")
+
+        threading.Thread(target=work, daemon=True, name=f"reload-{self.name}").start()
+
+    def unload(self, reason: str = "") -> bool:
+        """Libera el modelo si está cargado y nadie lo está usando."""
+        with self._cond:
+            if not self.loaded or self.loading or self.busy:
+                return False
+            self.loaded = False
+            self.loading = True  # Quien quiera usarlo espera a que acabe la descarga
+        try:
+            self._unload()
+            gc.collect()
+        finally:
+            with self._cond:
+                self.loading = False
+                self.unloads += 1
+                self._cond.notify_all()
+        print(f"[Residencia] {self.name} descargado{f' ({reason})' if reason else ''}")
+        return True
+
+    @contextmanager
+    def use(self):
+        """Marca el modelo en uso (no se descarga mientras tanto) y lo recarga si hace falta."""
+        with self._cond:
+            self.busy += 1
+        try:
+            if not self.loaded:
+                with tracing.span("reload", engine=self.name):
+                    self.load()
+            yield
+        finally:
+            with self._cond:
+                self.busy -= 1
+                self.last_used = time.monotonic()
+
+    def idle_seconds(self) -> float:
+        return 0.0 if self.busy else time.monotonic() - self.last_used
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "busy": self.busy,
+            "idle_s": round(self.idle_seconds(), 1),
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "last_load_ms": round(self.last_load_ms, 1),
+            "last_warmup_ms": round(self.last_warmup_ms, 1),
+            "reload_ms_total": round(self.reload_ms_total, 1),
+        }
+
+
+class ResidencyManager:
+    """Descarga los modelos inactivos y los recarga en segundo plano al siguiente wake."""
+
+    def __init__(self, config):
+        cfg = config.get("residency", {})
+        self.idle_unload = cfg.get("idle_unload_minutes", 30) * 60
+        self.memory_budget = cfg.get("memory_budget_mb", 0) * 1024 * 1024
+        self.interval = cfg.get("check_interval_s", 30)
+        self.keep_loaded = set(cfg.get("keep_loaded", []))
+        self.slots: dict[str, ModelSlot] = {}
+        self._stop = threading.Event()
+        tracing.add_metrics_source(self.prometheus_lines)
+
+    def register(self, slot: ModelSlot | None):
+        if slot is not None:
+            self.slots[slot.name] = slot
+
+    def start(self):
+        if not self.idle_unload and not self.memory_budget:
+            return
+        if self.memory_budget and _rss_bytes() is None:
+            print("[Residencia] No se puede medir la memoria del proceso; presupuesto desactivado")
+            self.memory_budget = 0
+        threading.Thread(target=self._monitor, daemon=True, name="residency").start()
+
+    def stop(self):
+        self._stop.set()
+
+    def prefetch(self):
+        """Empieza a recargar lo descargado; se llama al recibir un wake."""
+        for slot in self.slots.values():
+            slot.load_async()
+
+    def stats(self) -> dict:
+        stats = {name: slot.stats() for name, slot in self.slots.items()}
+        rss = _rss_bytes()
+        if rss is not None:
+            stats["rss_mb"] = round(rss / (1024 * 1024), 1)
+        return stats
+
+    def prometheus_lines(self) -> list[str]:
+        lines = [
+            "# HELP assistant_model_loaded Modelo residente en memoria (1) o descargado (0)",
+            "# TYPE assistant_model_loaded gauge",
+        ]
+        slots = sorted(self.slots.items())
+        lines += [f'assistant_model_loaded{{engine="{n}"}} {int(s.loaded)}' for n, s in slots]
+        lines += [
+            "# HELP assistant_model_idle_seconds Segundos desde el último uso",
+            "# TYPE assistant_model_idle_seconds gauge",
+        ]
+        lines += [f'assistant_model_idle_seconds{{engine="{n}"}} {s.idle_seconds():.1f}' for n, s in slots]
+        lines += [
+            "# HELP assistant_model_unloads_total Descargas por inactividad o memoria",
+            "# TYPE assistant_model_unloads_total counter",
+        ]
+        lines += [f'assistant_model_unloads_total{{engine="{n}"}} {s.unloads}' for n, s in slots]
+        lines += [
+            "# HELP assistant_model_reload_ms_total Tiempo total gastado en recargas",
+            "# TYPE assistant_model_reload_ms_total counter",
+        ]
+        lines += [f'assistant_model_reload_ms_total{{engine="{n}"}} {s.reload_ms_total:.1f}' for n, s in slots]
+        rss = _rss_bytes()
+        if rss is not None:
+            lines += [
+                "# HELP assistant_resident_bytes Memoria residente del proceso",
+                "# TYPE assistant_resident_bytes gauge",
+                f"assistant_resident_bytes {rss}",
+            ]
+        return lines
+
+    def _monitor(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self._check():
+                    tracing.write_metrics()
+            except Exception as e:
+                print(f"[Residencia] Error revisando modelos: {e}")
+
+    def _check(self) -> bool:
+        changed = False
+        candidates = [s for n, s in self.slots.items() if n not in self.keep_loaded]
+        if self.idle_unload:
+            for slot in candidates:
+                if slot.loaded and slot.idle_seconds() >= self.idle_unload:
+                    changed |= slot.unload(f"inactivo {slot.idle_seconds() / 60:.0f} min")
+        if self.memory_budget:
+            # Por encima del presupuesto: fuera el menos usado recientemente, de uno en uno
+            for slot in sorted(candidates, key=lambda s: -s.idle_seconds()):
+                rss = _rss_bytes()
+                if rss is None or rss <= self.memory_budget:
+                    break
+                if slot.loaded:
+                    changed |= slot.unload(f"memoria {rss / (1024 * 1024):.0f} MB")
+        return changed
@@ -0,0 +1,179 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from src import tracing
+from src.command_index import normalize, tokenize
+
+# Preguntas cuya respuesta cambia con el tiempo: nunca se cachean
+_VOLATILE_WORDS = {
+    "hora", "horas", "hoy", "ahora", "fecha", "dia", "manana", "ayer", "semana", "mes", "ano",
+    "tiempo", "clima", "temperatura", "llueve", "lloviendo", "noticias", "ultimo", "ultima",
+    "ultimos", "ultimas", "actual", "actualmente", "precio", "cotizacion", "resultado", "partido",
+}
+_NEGATIONS = {"no", "nunca", "sin", "ni"}
+
+
+@dataclass
+class _Entry:
+    question: str
+    reply: str
+    state: str
+    created: float
+    generation_ms: float
+    grams: frozenset = field(default_factory=frozenset)
+    hits: int = 0
+
+
+class ResponseCache:
+    """Respuestas del LLM ya dadas, para no volver a generarlas si se repite la pregunta.
+
+    La clave es la frase normalizada (como `Pipeline._norm`) más un hash de
+    todo lo que influye en la respuesta: modelo, prefijo del prompt (persona,
+    comandos, memoria del usuario) y contexto volátil (resumen y turnos
+    recientes). Así "sí" o "dime más" nunca reciben la respuesta de otra
+    conversación; a cambio, dentro de una charla en curso casi no hay
+    aciertos, que llegan sobre todo al empezar conversaciones. Opcionalmente, una
+    frase casi igual (n-gramas de caracteres por encima de `similarity`)
+    también acierta. Las preguntas sobre la hora, el tiempo o la actualidad y
+    las respuestas que han usado búsqueda web no se guardan.
+    """
+
+    def __init__(self, config):
+        cfg = config.get("response_cache", {})
+        self.enabled = cfg.get("enabled", True)
+        self.ttl = cfg.get("ttl_s", 3600)
+        self.max_entries = cfg.get("max_entries", 256)
+        self.similarity = cfg.get("similarity", 0.85)
+        self.ngram = cfg.get("ngram", 3)
+        self.max_reply_chars = cfg.get("max_reply_chars", 600)
+        llm = config.llm
+        self.model_id = f"{llm.get('provider', 'local')}:{llm.get('model_path', llm.get('gemini_model', ''))}"
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.saved_ms = 0.0
+        if self.enabled:
+            tracing.add_metrics_source(self.prometheus_lines)
+
+    def cacheable(self, text: str) -> bool:
+        """False si la pregunta depende del momento en que se hace."""
+        return bool(normalize(text)) and not (set(tokenize(text)) & _VOLATILE_WORDS)
+
+    def lookup(self, text: str, prefix: str, context: str = "") -> _Entry | None:
+        """Respuesta guardada para `text` con este prefijo y contexto, o None."""
+        if not self.enabled:
+            return None
+        if not self.cacheable(text):
+            self.skipped += 1
+            return None
+        started = time.perf_counter()
+        state = self._state(prefix, context)
+        key = (normalize(text), state)
+        with tracing.span("llm.response_cache") as record, self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            score = None
+            if entry is None and self.similarity:
+                entry, score = self._nearest(text, state)
+            record["hit"] = entry is not None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((entry.question, entry.state))
+            entry.hits += 1
+            saved = max(0.0, entry.generation_ms - (time.perf_counter() - started) * 1000)
+            self.saved_ms += saved
+            if score is not None:
+                self.near_hits += 1
+                record["similarity"] = round(score, 3)
+            else:
+                self.hits += 1
+            record["saved_ms"] = round(saved, 1)
+        kind = "exacta" if score is None else f"similar a '{entry.question}' ({score:.2f})"
+        print(f"[Caché] Respuesta {kind}: sin LLM, ~{saved:.0f} ms ahorrados")
+        return entry
+
+    def store(
+        self, text: str, prefix: str, context: str, reply: str, generation_ms: float | None, searched: bool = False
+    ):
+        """Guarda una respuesta completa (`generation_ms` None: no terminó) si no usó búsqueda web."""
+        if not self.enabled or searched or generation_ms is None or not reply:
+            return
+        if len(reply) > self.max_reply_chars or not self.cacheable(text):
+            return
+        question = normalize(text)
+        state = self._state(prefix, context)
+        entry = _Entry(question, reply, state, time.monotonic(), generation_ms, self._grams(text))
+        with self._lock:
+            self._entries[(question, entry.state)] = entry
+            self._entries.move_to_end((question, entry.state))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "saved_ms": round(self.saved_ms, 1),
+        }
+
+    def prometheus_lines(self) -> list[str]:
+        stats = self.stats()
+        return [
+            "# HELP assistant_response_cache_hits_total Respuestas servidas sin LLM",
+            "# TYPE assistant_response_cache_hits_total counter",
+            f'assistant_response_cache_hits_total{{tier="exact"}} {stats["hits"]}',
+            f'assistant_response_cache_hits_total{{tier="similar"}} {stats["near_hits"]}',
+            f"assistant_response_cache_misses_total {stats['misses']}",
+            f"assistant_response_cache_saved_ms_total {stats['saved_ms']}",
+            f"assistant_response_cache_entries {stats['entries']}",
+        ]
+
+    def _state(self, prefix: str, context: str) -> str:
+        return hashlib.sha256(f"{self.model_id}|{prefix}|{context}".encode("utf-8")).hexdigest()[:16]
+
+    def _grams(self, text: str) -> frozenset:
+        flat = f" {' '.join(tokenize(text))} "
+        n = self.ngram
+        return frozenset(flat[i:i + n] for i in range(max(1, len(flat) - n + 1)))
+
+    def _nearest(self, text: str, state: str) -> tuple[_Entry | None, float]:
+        grams = self._grams(text)
+        tokens = set(tokenize(text))
+        best, best_score = None, 0.0
+        for entry in self._entries.values():
+            if entry.state != state or not _compatible(tokens, set(tokenize(entry.question))):
+                continue
+            score = len(grams & entry.grams) / len(grams | entry.grams)
+            if score > best_score:
+                best, best_score = entry, score
+        if best is None or best_score < self.similarity:
+            return None, 0.0
+        return best, best_score
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        limit = time.monotonic() - self.ttl
+        for key in [key for key, entry in self._entries.items() if entry.created < limit]:
+            del self._entries[key]
+
+
+def _compatible(a: set[str], b: set[str]) -> bool:
+    """Dos frases parecidas solo comparten respuesta si no difieren en números ni negaciones."""
+    numbers = re.compile(r"\d")
+    differing = a ^ b
+    return not any(numbers.search(tok) or tok in _NEGATIONS for tok in differing)
@@ -0,0 +1,98 @@
+import threading
+import numpy as np
+
+
+class RingBuffer:
+    """Búfer circular preasignado con un escritor y varios lectores.
+
+    Las posiciones son absolutas (muestras escritas desde el arranque) y cada
+    lector lleva su propio cursor. El escritor nunca espera ni toma locks: si
+    un lector se retrasa más que la capacidad, pierde las muestras antiguas y
+    se contabilizan en `RingReader.lost`.
+    """
+
+    def __init__(self, capacity: int, dtype=np.int16):
+        self.capacity = int(capacity)
+        self._buf = np.zeros(self.capacity, dtype=dtype)
+        self.written = 0
+        self._events: list[threading.Event] = []
+
+    def write(self, samples: np.ndarray):
+        total = len(samples)
+        if total == 0:
+            return
+        if total > self.capacity:
+            samples = samples[-self.capacity:]
+        n = len(samples)
+        start = (self.written + total - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = samples[:first]
+        if n > first:
+            self._buf[: n - first] = samples[first:]
+        self.written += total
+        for event in self._events:
+            event.set()
+
+    def reader(self, position: int | None = None) -> "RingReader":
+        return RingReader(self, position)
+
+    def copy(self, position: int, n: int) -> np.ndarray:
+        start = position % self.capacity
+        first = min(n, self.capacity - start)
+        out = np.empty(n, dtype=self._buf.dtype)
+        out[:first] = self._buf[start:start + first]
+        if n > first:
+            out[first:] = self._buf[: n - first]
+        return out
+
+
+class RingReader:
+    def __init__(self, ring: RingBuffer, position: int | None = None):
+        self.ring = ring
+        self.position = ring.written if position is None else max(0, position)
+        self.lost = 0
+        self._event = threading.Event()
+        ring._events.append(self._event)
+
+    def available(self) -> int:
+        return self.ring.written - self.position
+
+    def read(self, n: int, timeout: float | None = None) -> np.ndarray | None:
+        """Devuelve exactamente `n` muestras, o None si no llegan antes de `timeout`."""
+        while True:
+            self._event.clear()
+            self._skip_overwritten()
+            if self.available() >= n:
+                data = self.ring.copy(self.position, n)
+                # Si el escritor ha pisado el tramo mientras copiábamos, se descarta
+                if self.ring.written - self.position > self.ring.capacity:
+                    continue
+                self.position += n
+                return data
+            if not self._event.wait(timeout):
+                return None
+
+    def read_available(self, max_samples: int | None = None) -> np.ndarray:
+        """Devuelve lo que haya disponible sin esperar."""
+        self._skip_overwritten()
+        n = self.available()
+        if max_samples is not None:
+            n = min(n, max_samples)
+        if n <= 0:
+            return self.ring.copy(self.position, 0)
+        data = self.ring.copy(self.position, n)
+        self.position += n
+        return data
+
+    def close(self):
+        try:
+            self.ring._events.remove(self._event)
+        except ValueError:
+            pass
+
+    def _skip_overwritten(self):
+        behind = self.ring.written - self.position
+        if behind > self.ring.capacity:
+            skipped = behind - self.ring.capacity
+            self.lost += skipped
+            self.position += skipped
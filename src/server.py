@@ -0,0 +1,440 @@
+"""Modo servidor: varios clientes ligeros (uno por habitación) comparten los modelos de esta máquina.
+
+Protocolo (WebSocket, una conexión = una sesión):
+- Cliente → servidor: primero {"type": "hello", "session": "salon"}; después audio PCM
+  int16 mono a `app.sample_rate` en mensajes binarios. El fin de frase lo detecta el VAD
+  del servidor o lo marca el cliente con {"type": "end"}; {"type": "stop"} corta la respuesta.
+- Servidor → cliente: {"type": "ready"}, {"type": "transcript", "text"}, {"type": "reply",
+  "text"} por frase, {"type": "audio", "sample_rate", "samples"} seguido del PCM int16 en
+  binario, {"type": "done", "timings", "cached"} al acabar ("cached": respuesta de la caché,
+  sin LLM) y {"type": "busy"} si la cola está llena.
+
+Cada sesión tiene su historial y su memoria (`server.sessions_dir/<sesión>.json`). El LLM
+atiende como mucho `server.llm_concurrency` turnos a la vez (con llama.cpp local, 1: todas
+las sesiones comparten un `LlmEngine` y su contexto); los turnos esperan en una cola
+de `server.max_queue` y, si se llena, se rechazan. Las frases que terminan a la vez en
+varias sesiones se transcriben en un mismo lote.
+
+Uso: python -m src.server [--host 0.0.0.0] [--port 8765]
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from pathlib import Path
+import numpy as np
+
+from src import tracing
+from src.cancellation import CancelToken, Cancelled
+from src.config import AppConfig, load_config
+from src.response_cache import ResponseCache
+from src.text_stream import SentenceSegmenter
+from src.vad import create_vad
+
+
+class Endpointer:
+    """Detecta el fin de cada frase en el audio que llega de un cliente (como `SpeechToText.record`)."""
+
+    def __init__(self, config):
+        cfg = config.stt
+        self.sample_rate = config.app.get("sample_rate", 16000)
+        self.vad = create_vad(config)
+        self.pad = int(cfg.get("vad_pad_ms", 200) * self.sample_rate / 1000)
+        silence_ms = cfg.get("silence_duration", 1.5) * 1000 - self.vad.hangover_frames * self.vad.frame_ms
+        self.silence_limit = max(1, int(round(silence_ms / self.vad.frame_ms)))
+        self.max_samples = int(cfg.get("max_record_seconds", 15) * self.sample_rate)
+        self._reset()
+
+    def _reset(self):
+        self.vad.reset()
+        self._chunks = []
+        self._samples = 0
+        self._frame = 0
+        self._silence = 0
+        self._start = None
+        self._end = None
+
+    def feed(self, pcm: np.ndarray) -> np.ndarray | None:
+        """Añade audio int16; devuelve la frase (float32, sin silencio) cuando termina."""
+        audio = pcm.astype(np.float32) / 32768.0
+        self._chunks.append(audio)
+        self._samples += len(audio)
+        for is_speech in self.vad.process(audio):
+            if is_speech:
+                if self._start is None:
+                    self._start = max(0, self._frame - self.vad.onset_frames + 1)
+                self._end = self._frame + 1
+                self._silence = 0
+            elif self._start is not None:
+                self._silence += 1
+            self._frame += 1
+        if self._start is not None and self._silence >= self.silence_limit:
+            return self.flush()
+        if self._samples >= self.max_samples:
+            return self.flush()
+        if self._start is None and self._samples > self.sample_rate * 2:
+            # Silencio sin habla: se descarta lo antiguo salvo un margen para el inicio
+            keep = np.concatenate(self._chunks)[-self.pad:]
+            self._reset()
+            self._chunks, self._samples = [keep], len(keep)
+            self._frame = 0
+        return None
+
+    def flush(self) -> np.ndarray | None:
+        """Cierra la frase en curso (p. ej. el cliente ha enviado "end")."""
+        start, end = self._start, self._end
+        audio = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.float32)
+        self._reset()
+        if start is None:
+            return None
+        frame_len = self.vad.frame_len
+        return audio[max(0, start * frame_len - self.pad):min(len(audio), end * frame_len + self.pad)]
+
+
+class SttBatcher:
+    """Junta las frases que terminan casi a la vez en varias sesiones y las transcribe en un lote."""
+
+    def __init__(self, stt, max_batch: int = 4, window_ms: float = 50):
+        self.stt = stt
+        self.max_batch = max(1, max_batch)
+        self.window = window_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.batches = 0
+        self.utterances = 0
+
+    async def transcribe(self, audio: np.ndarray) -> str:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((audio, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            audios = [audio for audio, _ in batch]
+            try:
+                texts = await asyncio.to_thread(self.stt.transcribe_audio, audios)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.utterances += len(batch)
+            if len(batch) > 1:
+                print(f"[Servidor] STT: {len(batch)} frases en un lote")
+            for (_, future), text in zip(batch, texts):
+                if not future.done():
+                    future.set_result(text)
+
+
+class Session:
+    def __init__(self, session_id: str, pipeline, config):
+        self.id = session_id
+        self.pipeline = pipeline
+        self.endpointer = Endpointer(config)
+        self.ws = None
+        self.token: CancelToken | None = None
+        self.send_lock = asyncio.Lock()
+
+    def _socket(self):
+        ws = self.ws
+        if ws is None:
+            raise Cancelled("cliente desconectado")
+        return ws
+
+    async def send_json(self, message: dict):
+        async with self.send_lock:
+            await self._socket().send(json.dumps(message, ensure_ascii=False))
+
+    async def send_audio(self, pcm: np.ndarray, sample_rate: int):
+        # Cabecera y PCM juntos: otra tarea de la sesión no puede colarse en medio
+        async with self.send_lock:
+            ws = self._socket()
+            await ws.send(json.dumps({"type": "audio", "sample_rate": sample_rate, "samples": len(pcm)}))
+            await ws.send(pcm.astype(np.int16).tobytes())
+
+
+class AssistantServer:
+    def __init__(self, config, stt, llm, tts, actions=None):
+        cfg = config.get("server", {})
+        self.config = config
+        self.cfg = cfg
+        self.stt = stt
+        self.llm = llm
+        self.tts = tts
+        # Sin permiso, los clientes no pueden abrir programas en esta máquina
+        self.actions = actions if cfg.get("allow_actions", False) else None
+        self.sessions_dir = Path(cfg.get("sessions_dir", "data/sessions"))
+        self.sessions: dict[str, Session] = {}
+        # Una sola caché para todas las sesiones: la clave incluye el prefijo (y la memoria) de cada una
+        self.response_cache = ResponseCache(config)
+        self.sample_rate = config.app.get("sample_rate", 16000)
+        self.workers = cfg.get("workers", 4)
+        self.llm_concurrency = max(1, cfg.get("llm_concurrency", 1))
+        if self.llm_concurrency > 1 and getattr(llm, "provider", "local") == "local":
+            # Un solo contexto de llama.cpp: el lock del motor serializaría el resto igualmente
+            print(f"[Servidor] server.llm_concurrency={self.llm_concurrency} no aplica al LLM local; se usa 1")
+            self.llm_concurrency = 1
+        # Una sola vez para todas las sesiones (cada Pipeline lo fijaría con el suyo)
+        if hasattr(stt, "command_lookup"):
+            stt.command_lookup = self._is_command_utterance
+        self.stats = {"turns": 0, "rejected": 0, "cancelled": 0}
+
+    async def serve(self, host: str, port: int):
+        try:
+            import websockets
+        except ImportError as e:
+            raise RuntimeError("El modo servidor necesita el paquete 'websockets' (pip install websockets)") from e
+
+        self.turns: asyncio.Queue = asyncio.Queue(maxsize=self.cfg.get("max_queue", 8))
+        self.llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        self.batcher = SttBatcher(self.stt, self.cfg.get("stt_batch_size", 4), self.cfg.get("stt_batch_window_ms", 50))
+        tasks = [asyncio.create_task(self.batcher.run())]
+        tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        async with websockets.serve(self._handle, host, port, max_size=1 << 20):
+            print(
+                f"[Servidor] Escuchando en ws://{host}:{port} ({self.workers} turnos en paralelo, "
+                f"LLM x{self.llm_concurrency}, acciones {'sí' if self.actions else 'no'})"
+            )
+            await asyncio.Future()
+
+    def _is_command_utterance(self, text: str) -> bool:
+        """Para la cascada de STT: sin acciones permitidas ninguna frase es una orden."""
+        exact_match = getattr(self.actions, "exact_match", None)
+        return exact_match is not None and exact_match(text) is not None
+
+    def _session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            from src.pipeline import Pipeline
+
+            # Misma configuración salvo la memoria, que es propia de cada sesión
+            memory = {**self.config.get("memory", {}), "path": str(self.sessions_dir / f"{session_id}.json")}
+            config = AppConfig({**self.config, "memory": memory})
+            self.sessions_dir.mkdir(parents=True, exist_ok=True)
+            pipeline = Pipeline(
+                config, None, self.stt, self.llm, self.tts, self.actions, None, response_cache=self.response_cache
+            )
+            session = Session(session_id, pipeline, config)
+            self.sessions[session_id] = session
+        return session
+
+    async def _handle(self, ws, path=None):
+        session = None
+        try:
+            hello = json.loads(await ws.recv())
+            session_id = re.sub(r"[^\w-]", "_", str(hello.get("session") or id(ws)))[:64]
+            session = self._session(session_id)
+            session.ws = ws
+            await session.send_json({"type": "ready", "session": session_id, "sample_rate": self.sample_rate})
+            print(f"[Servidor] Sesión {session_id} conectada")
+            async for message in ws:
+                if isinstance(message, bytes):
+                    utterance = session.endpointer.feed(np.frombuffer(message, dtype=np.int16))
+                else:
+                    kind = json.loads(message).get("type")
+                    utterance = session.endpointer.flush() if kind == "end" else None
+                    if kind == "stop" and session.token is not None:
+                        session.token.cancel("stop del cliente")
+                if utterance is not None and len(utterance):
+                    await self._submit(session, utterance)
+        except Exception as e:
+            if type(e).__name__ not in ("ConnectionClosedOK", "ConnectionClosedError"):
+                print(f"[Servidor] Error en la sesión: {e}")
+        finally:
+            # Si el cliente ya se ha reconectado con el mismo id, la sesión es de la conexión nueva
+            if session is not None and session.ws is ws:
+                if session.token is not None:
+                    session.token.cancel("cliente desconectado")
+                session.ws = None
+                self.sessions.pop(session.id, None)
+                # La memoria queda en disco; se vuelve a cargar si el cliente vuelve
+                await asyncio.to_thread(session.pipeline.user_memory.store.close)
+                print(f"[Servidor] Sesión {session.id} desconectada")
+
+    async def _submit(self, session: Session, audio: np.ndarray):
+        # Una frase nueva corta la respuesta anterior de la misma sesión
+        if session.token is not None:
+            session.token.cancel("nueva frase")
+        token = CancelToken()
+        session.token = token
+        try:
+            self.turns.put_nowait((session, audio, token, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            await session.send_json({"type": "busy", "queued": self.turns.qsize()})
+
+    async def _worker(self):
+        while True:
+            session, audio, token, ended = await self.turns.get()
+            if token.cancelled or session.ws is None:
+                continue
+            try:
+                await self._run_turn(session, audio, token, ended)
+                self.stats["turns"] += 1
+            except Cancelled:
+                self.stats["cancelled"] += 1
+            except Exception as e:
+                if type(e).__name__.startswith("ConnectionClosed"):
+                    continue  # El cliente se fue a mitad de respuesta
+                print(f"[Servidor] Error en el turno de {session.id}: {e}")
+
+    async def _run_turn(self, session: Session, audio: np.ndarray, cancel: CancelToken, ended: float):
+        pipeline = session.pipeline
+        timings = {"queue_ms": round((time.perf_counter() - ended) * 1000, 1)}
+        text = await self.batcher.transcribe(audio)
+        timings["stt_ms"] = round((time.perf_counter() - ended) * 1000, 1)
+        cancel.raise_if_cancelled()
+        await session.send_json({"type": "transcript", "text": text})
+        if not text:
+            await session.send_json({"type": "done", "timings": timings, "cached": False})
+            return
+
+        cached = None
+        command = pipeline._classify_intent(text) if self.actions is not None else None
+        if command:
+            reply = await asyncio.to_thread(self.actions.handle, command) or pipeline.DIRECT_COMMAND_FALLBACK
+            await self._say(session, reply, timings, ended, cancel)
+        else:
+            system_prompt, context = await asyncio.to_thread(pipeline._build_system_prompt, text)
+            cached = self.response_cache.lookup(text, system_prompt, context)
+            if cached is not None:
+                reply = cached.reply
+                segmenter = SentenceSegmenter()
+                for sentence in segmenter.feed(reply) + segmenter.flush():
+                    await self._say(session, sentence, timings, ended, cancel)
+            else:
+                searches = []
+                reply = await self._stream_reply(
+                    session, text, system_prompt, context, timings, ended, cancel, searches
+                )
+                self.response_cache.store(
+                    text, system_prompt, context, reply, timings.get("llm_ms"), bool(searches)
+                )
+        pipeline._add_to_history(text, reply)
+        pipeline.user_memory.increment_interactions()
+        pipeline.context_packer.refresh_summary_async()
+        timings["total_ms"] = round((time.perf_counter() - ended) * 1000, 1)
+        await session.send_json({"type": "done", "timings": timings, "cached": cached is not None})
+
+    async def _stream_reply(self, session, text, system_prompt, context, timings, ended, cancel, searches) -> str:
+        loop = asyncio.get_running_loop()
+        deltas: asyncio.Queue = asyncio.Queue()
+
+        def produce():
+            started = time.perf_counter()
+            try:
+                stream = self.llm.generate_stream(
+                    text, system_prompt=system_prompt, context=context, cancel=cancel, searches=searches
+                )
+                for delta in stream:
+                    loop.call_soon_threadsafe(deltas.put_nowait, delta)
+                # Solo si termina: una respuesta a medias no se guarda en la caché
+                timings["llm_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            except Cancelled:
+                pass
+            except Exception as e:
+                print(f"[Servidor] Error en el LLM: {e}")
+            finally:
+                # El hueco del LLM se libera al acabar de generar, no al acabar de hablar
+                loop.call_soon_threadsafe(self.llm_slots.release)
+                loop.call_soon_threadsafe(deltas.put_nowait, None)
+
+        await self.llm_slots.acquire()
+        timings["llm_wait_ms"] = round((time.perf_counter() - ended) * 1000, 1)
+        loop.run_in_executor(None, produce)
+        segmenter = SentenceSegmenter()
+        parts = []
+        while True:
+            delta = await deltas.get()
+            sentences = segmenter.feed(delta) if delta is not None else segmenter.flush()
+            for sentence in sentences:
+                parts.append(sentence)
+                if not cancel.cancelled:
+                    await self._say(session, sentence, timings, ended, cancel)
+            if delta is None:
+                break
+        cancel.raise_if_cancelled()
+        return " ".join(parts).strip()
+
+    async def _say(self, session: Session, sentence: str, timings: dict, ended: float, cancel: CancelToken):
+        cleaned, commands = session.pipeline._extract_commands(sentence)
+        if commands and self.actions is not None:
+            await asyncio.to_thread(session.pipeline._run_embedded_commands, commands, cancel)
+        if not cleaned:
+            return
+        timings.setdefault("first_reply_ms", round((time.perf_counter() - ended) * 1000, 1))
+        await session.send_json({"type": "reply", "text": cleaned})
+        pcm = await self._synthesize(cleaned)
+        cancel.raise_if_cancelled()
+        if len(pcm):
+            timings.setdefault("first_audio_ms", round((time.perf_counter() - ended) * 1000, 1))
+            await session.send_audio(pcm, self.tts.output_rate)
+
+    async def _synthesize(self, text: str) -> np.ndarray:
+        pool = self.tts.pool
+        if pool is not None and not self.tts._in_cache(text):
+            # Con pool de voces, las frases de varias sesiones se sintetizan en paralelo
+            try:
+                return await asyncio.wrap_future(pool.submit(text))
+            except Exception as e:
+                print(f"[Servidor] Error en el pool de síntesis: {e}")
+        return await asyncio.to_thread(self.tts.synthesize, text)
+
+
+def main(argv=None) -> int:
+    from src.model_downloader import ensure_models
+    from src.startup import EngineLoader
+    from src.residency import ResidencyManager
+    from src.stt import SpeechToText
+    from src.llm import LlmEngine
+    from src.tts import TextToSpeech
+    from src.actions import ActionRouter
+
+    parser = argparse.ArgumentParser(prog="python -m src.server", description="Asistente en red para varios clientes")
+    parser.add_argument("--config", default=None)
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    cfg = config.get("server", {})
+    ensure_models(config)
+    tracing.configure(config)
+
+    loader = EngineLoader()
+    loader.add("STT", lambda: SpeechToText(config))
+    loader.add("LLM", lambda: LlmEngine(config))
+    loader.add("TTS", lambda: TextToSpeech(config, playback=False))
+    if cfg.get("allow_actions", False):
+        loader.add("Acciones", lambda: ActionRouter(config))
+    loader.start()
+    stt, llm, tts = loader.get("STT"), loader.get("LLM"), loader.get("TTS")
+    actions = loader.get("Acciones") if cfg.get("allow_actions", False) else None
+
+    residency = ResidencyManager(config)
+    for engine in (stt, llm, tts):
+        residency.register(engine.residency)
+    residency.start()
+
+    server = AssistantServer(config, stt, llm, tts, actions)
+    try:
+        asyncio.run(server.serve(args.host or cfg.get("host", "0.0.0.0"), args.port or cfg.get("port", 8765)))
+    except KeyboardInterrupt:
+        print(f"\n[Servidor] Cerrando ({server.stats})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,6 +6,7 @@ class SoundPlayer:
     def __init__(self, config):
         self.listening = Path(config.app.get("listening_sound", ""))
         self.stopped = Path(config.app.get("stopped_sound", ""))
+        self.loading = Path(config.app.get("loading_sound", ""))
 
     def play_listening(self):
         self._play(self.listening)
@@ -13,6 +14,10 @@ class SoundPlayer:
     def play_stopped(self):
         self._play(self.stopped)
 
+    def play_loading(self):
+        """Aviso de "cargando": wake recibido antes de que los modelos estén listos."""
+        self._play(self.loading if self.loading.exists() else self.listening)
+
     def _play(self, path: Path):
         if not path or not path.exists():
             return
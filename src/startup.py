@@ -0,0 +1,64 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EngineLoader:
+    """Carga los motores (STT, LLM, TTS...) en paralelo en un pool de hilos.
+
+    Los modelos se cargan sobre todo en código nativo (CTranslate2, llama.cpp,
+    ONNX Runtime) que suelta el GIL, así que el arranque pasa de la suma de
+    las cargas a la más lenta de ellas. `ready` se activa cuando han terminado
+    todas; mientras tanto el wake-word ya puede estar escuchando.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        self.ready = threading.Event()
+        self.timings: dict[str, float] = {}
+        self._factories: dict[str, callable] = {}
+        self._futures = {}
+        self._max_workers = max_workers
+        self._started = None
+
+    def add(self, name: str, factory):
+        """Registra `factory()` como constructor del motor `name`."""
+        self._factories[name] = factory
+
+    def start(self):
+        self._started = time.perf_counter()
+        executor = ThreadPoolExecutor(
+            max_workers=self._max_workers or len(self._factories),
+            thread_name_prefix="engine-load",
+        )
+        for name, factory in self._factories.items():
+            self._futures[name] = executor.submit(self._load, name, factory)
+        executor.shutdown(wait=False)
+        threading.Thread(target=self._wait_all, daemon=True, name="engine-ready").start()
+        return self
+
+    def get(self, name: str, timeout: float | None = None):
+        """Motor ya construido (espera a que acabe su carga; relanza su error si falló)."""
+        return self._futures[name].result(timeout)
+
+    def _load(self, name, factory):
+        started = time.perf_counter()
+        try:
+            engine = factory()
+        except Exception as e:
+            self.timings[name] = time.perf_counter() - started
+            print(f"[Inicio] Error cargando {name} ({self.timings[name]:.2f} s): {e}")
+            raise
+        self.timings[name] = time.perf_counter() - started
+        print(f"[Inicio] {name} cargado en {self.timings[name]:.2f} s")
+        return engine
+
+    def _wait_all(self):
+        for future in self._futures.values():
+            try:
+                future.result()
+            except Exception:
+                pass  # El error se relanza en get()
+        total = time.perf_counter() - self._started
+        serial = sum(self.timings.values())
+        print(f"[Inicio] Motores listos en {total:.2f} s (uno tras otro habrían sido {serial:.2f} s)")
+        self.ready.set()
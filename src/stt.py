@@ -1,76 +1,139 @@
-import sounddevice as sd
 import numpy as np
-from faster_whisper import WhisperModel
-import torch
 from pathlib import Path
 import queue
 import threading
+import time
+from contextlib import contextmanager
+from src.vad import create_vad
+from src.cancellation import Cancelled, check
+from src.residency import ModelSlot
+from src import tracing
 
 
 class SpeechToText:
-    def __init__(self, config, sound_player=None):
+    def __init__(self, config, sound_player=None, bus=None):
+        self.config = config
         self.cfg = config.stt
         self.sound_player = sound_player
+        self.bus = bus
         self.language = self.cfg.get("language", "es")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        model_path = Path(self.cfg["model_path"])
-        if not model_path.exists():
+        self.model_path = Path(self.cfg["model_path"])
+        if not self.model_path.exists():
             raise FileNotFoundError(
-                f"STT model not found at {model_path}. Descarga el modelo CTranslate2 y colócalo ahí."
+                f"STT model not found at {self.model_path}. Descarga el modelo CTranslate2 y colócalo ahí."
             )
-        self.model = WhisperModel(
-            str(model_path),
-            device=device,
-            local_files_only=True,
-            compute_type="int8" if device == "cpu" else "float16",
-        )
+        self.model = None
         self.sample_rate = config.app.get("sample_rate", 16000)
         self.silence_threshold = self.cfg.get("silence_threshold", 0.01)
         self.silence_duration = self.cfg.get("silence_duration", 1.5)
         self.max_record_seconds = self.cfg.get("max_record_seconds", 15)
+        self.streaming = self.cfg.get("streaming", True)
+        self.vad = create_vad(config)
+        self.vad_pad = int(self.cfg.get("vad_pad_ms", 200) * self.sample_rate / 1000)
+        # Cascada: un modelo pequeño en greedy primero; el grande solo si no convence
+        self.fast_model = None
+        fast_path = self.cfg.get("fast_model_path")
+        self.fast_model_path = Path(fast_path) if fast_path else None
+        self.cascade = None
+        if self.cfg.get("cascade", False):
+            if self.fast_model_path is not None and self.fast_model_path.is_dir():
+                self.cascade = CascadeStats(self.cfg)
+                tracing.add_metrics_source(self.cascade.prometheus_lines)
+            else:
+                print(f"[STT] Cascada desactivada: no hay modelo rápido en {self.fast_model_path}")
+        # La frase es una orden directa del índice de comandos (lo asigna el Pipeline)
+        self.command_lookup = None
+        self.residency = ModelSlot("STT", self._load_model, self._unload_model, self._warm_up, config)
+        self.residency.load()
 
-    def record(self):
-        audio_queue = queue.Queue()
-        audio_chunks = []
-        silence_samples = 0
-        silence_limit = int(self.silence_duration * self.sample_rate)
-        speech_detected = False
-        speech_threshold = self.silence_threshold * 2  # Umbral más alto para detectar habla real
-        
-        def callback(indata, frames, time, status):
-            if status:
-                print(f"[STT] Audio status: {status}")
-            audio_queue.put(indata.copy())
-        
-        stream = sd.InputStream(
-            samplerate=self.sample_rate,
-            channels=1,
-            dtype="float32",
-            callback=callback,
-            blocksize=int(0.5 * self.sample_rate)
+    def refresh_settings(self):
+        """Relee los ajustes que se pueden cambiar en caliente; vale desde la próxima grabación."""
+        self.silence_threshold = self.cfg.get("silence_threshold", 0.01)
+        self.silence_duration = self.cfg.get("silence_duration", 1.5)
+        self.max_record_seconds = self.cfg.get("max_record_seconds", 15)
+        self.vad = create_vad(self.config)
+        if self.cascade is not None:
+            self.cascade.configure(self.cfg)
+
+    def _load_model(self):
+        # faster-whisper y CTranslate2 se importan aquí: el arranque no paga su carga
+        # hasta que se construye el motor (en paralelo con LLM y TTS)
+        import ctranslate2
+        from faster_whisper import WhisperModel
+
+        device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+        self.model = WhisperModel(
+            str(self.model_path),
+            device=device,
+            local_files_only=True,
+            compute_type=self.cfg.get("compute_type") or ("int8" if device == "cpu" else "float16"),
         )
-        
-        import time
-        with stream:
+        if self.cascade is not None:
+            # Ambos modelos se cargan y descargan juntos: el rápido no sirve sin el grande
+            self.fast_model = WhisperModel(
+                str(self.fast_model_path),
+                device=device,
+                local_files_only=True,
+                compute_type=self.cfg.get("fast_compute_type") or ("int8" if device == "cpu" else "float16"),
+            )
+
+    def _unload_model(self):
+        self.model = None
+        self.fast_model = None
+
+    def _warm_up(self):
+        # Un segundo de silencio: reserva buffers y trae los pesos a memoria
+        silence = np.zeros(self.sample_rate, dtype=np.float32)
+        for model in (self.model, self.fast_model):
+            if model is not None:
+                segments, _ = model.transcribe(silence, language=self.language, beam_size=1)
+                list(segments)
+
+    def record(self, on_audio=None, start_position=None, cancel=None) -> tuple[np.ndarray, tuple[int, int]]:
+        """Graba hasta fin de habla y devuelve el audio sin el silencio de los extremos.
+
+        Las decisiones se toman por tramas de `app.chunk_ms`. Devuelve también el
+        tramo de voz (inicio, fin) en muestras del audio capturado: tras un
+        barge-in dos turnos pueden estar grabando y decodificando a la vez. Con bus de
+        captura compartido, la grabación empieza en `start_position` menos el
+        pre-roll configurado. Si `cancel` se activa, lanza `Cancelled`.
+        """
+        audio_chunks = []
+        vad = self.vad
+        vad.reset()
+        # El hangover del VAD ya cuenta como parte del silencio final
+        silence_ms = self.silence_duration * 1000 - vad.hangover_frames * vad.frame_ms
+        silence_limit = max(1, int(round(silence_ms / vad.frame_ms)))
+        silence_frames = 0
+        frame_index = 0
+        speech_start = None
+        speech_end = None
+
+        with tracing.span("stt.record"), self._capture(vad.frame_len, start_position) as read:
             start_time = time.time()
             while True:
+                check(cancel)
                 try:
-                    chunk = audio_queue.get(timeout=0.1)
-                    audio_chunks.append(chunk[:, 0])
+                    mono = read()
+                    audio_chunks.append(mono)
+                    if on_audio is not None:
+                        on_audio(mono)
                     
-                    # Check if silence
-                    rms = np.sqrt(np.mean(chunk ** 2))
-                    
-                    # Detectar si hay habla real
-                    if rms >= speech_threshold:
-                        speech_detected = True
-                        silence_samples = 0
-                    elif speech_detected:
-                        silence_samples += len(chunk)
+                    for is_speech in vad.process(mono):
+                        if is_speech:
+                            if speech_start is None:
+                                speech_start = max(0, frame_index - vad.onset_frames + 1)
+                                tracing.mark("stt.speech_start")
+                            speech_end = frame_index + 1
+                            silence_frames = 0
+                        elif speech_start is not None:
+                            silence_frames += 1
+                        frame_index += 1
                     
                     # Stop if silence detected (después de haber detectado habla) o max time
                     elapsed = time.time() - start_time
-                    if speech_detected and silence_samples >= silence_limit and len(audio_chunks) > 3:
+                    if speech_start is not None and silence_frames >= silence_limit:
+                        tracing.mark("stt.speech_end")
                         print("[STT] Silencio detectado, finalizando grabación")
                         if self.sound_player:
                             self.sound_player.play_stopped()
@@ -82,25 +145,119 @@ class SpeechToText:
                 except queue.Empty:
                     continue
         
-        if not audio_chunks or not speech_detected:
+        if not audio_chunks or speech_start is None:
             print("[STT] Sin habla detectada")
-            return np.array([])
+            return np.array([]), (0, 0)
         
-        return np.concatenate(audio_chunks)
+        audio = np.concatenate(audio_chunks)
+        start = max(0, speech_start * vad.frame_len - self.vad_pad)
+        end = min(len(audio), speech_end * vad.frame_len + self.vad_pad)
+        trimmed = len(audio) - (end - start)
+        if trimmed > 0:
+            print(f"[STT] Recortados {trimmed / self.sample_rate:.2f}s de silencio")
+        return audio[start:end], (start, end)
+
+    @contextmanager
+    def _capture(self, blocksize, start_position=None):
+        """Fuente de audio: devuelve una función que da el siguiente bloque float32 mono.
+
+        La función lanza queue.Empty si no llega audio en 100 ms.
+        """
+        if self.bus is not None:
+            reader = self.bus.subscribe_with_preroll(start_position)
+            try:
+                def read_bus():
+                    block = reader.read(blocksize, timeout=0.1)
+                    if block is None:
+                        raise queue.Empty
+                    return block.astype(np.float32) / 32768.0
+
+                yield read_bus
+            finally:
+                reader.close()
+            return
+
+        audio_queue = queue.Queue()
+
+        def callback(indata, frames, time, status):
+            if status:
+                print(f"[STT] Audio status: {status}")
+            audio_queue.put(indata.copy())
+
+        # Solo aquí hace falta PortAudio: lotes y modo servidor funcionan sin tarjeta de sonido
+        import sounddevice as sd
+
+        stream = sd.InputStream(
+            samplerate=self.sample_rate,
+            channels=1,
+            dtype="float32",
+            callback=callback,
+            blocksize=blocksize,
+        )
+        with stream:
+            yield lambda: audio_queue.get(timeout=0.1)[:, 0]
+
+    def transcribe(self, start_position=None, cancel=None):
+        with self.residency.use():
+            return self._transcribe(start_position, cancel)
 
-    def transcribe(self):
-        audio = self.record()
+    def _transcribe(self, start_position=None, cancel=None):
+        streamer = None
+        if self.streaming:
+            streamer = StreamingTranscriber(
+                self.model,
+                self.sample_rate,
+                self.language,
+                beam_size=self.cfg.get("beam_size", 5),
+                interval=self.cfg.get("stream_interval", 1.0),
+                stream_beam_size=self.cfg.get("stream_beam_size", 1),
+                # Con cascada, las frases cortas las resuelve el modelo rápido: el
+                # grande solo decodifica en paralelo cuando la frase ya es larga
+                start_after=self.cascade.max_seconds if self.fast_model is not None else 0.0,
+            )
+
+        try:
+            audio, bounds = self.record(
+                on_audio=streamer.feed if streamer else None, start_position=start_position, cancel=cancel
+            )
+            check(cancel)
+        except Cancelled:
+            if streamer:
+                streamer.cancel()
+            raise
         if len(audio) == 0:
+            if streamer:
+                streamer.cancel()
             print("[STT] Audio vacío, no enviando")
             return ""
         
-        segments, _ = self.model.transcribe(
-            audio,
-            beam_size=self.cfg.get("beam_size", 5),
-            language=self.language,
-            task="transcribe",
-        )
-        text = " ".join(seg.text for seg in segments).strip()
+        audio_s = len(audio) / self.sample_rate
+        with tracing.span("stt.transcribe", audio_s=round(audio_s, 2)):
+            text = self._transcribe_fast(audio, streamer) if self.fast_model is not None else None
+            if text is not None or (cancel is not None and cancel.cancelled):
+                if streamer:
+                    streamer.cancel()
+                check(cancel)
+            else:
+                started = time.perf_counter()
+                if streamer:
+                    text = streamer.finish(*bounds)
+                else:
+                    segments, _ = self.model.transcribe(
+                        audio,
+                        beam_size=self.cfg.get("beam_size", 5),
+                        language=self.language,
+                        task="transcribe",
+                    )
+                    # Los segmentos se decodifican al iterar: se puede cortar entre uno y otro
+                    parts = []
+                    for seg in segments:
+                        check(cancel)
+                        parts.append(seg.text)
+                    text = " ".join(parts).strip()
+                check(cancel)
+                if self.cascade is not None:
+                    self.cascade.record_full(audio_s, time.perf_counter() - started)
         if not text:
             print("[STT] Texto vacío después de transcribir")
             return ""
@@ -109,6 +266,89 @@ class SpeechToText:
         text = self._detect_spelling(text)
         return text
     
+    def transcribe_audio(self, audios: list) -> list[str]:
+        """Transcribe audios ya grabados (float32, hasta 30 s cada uno) de varias sesiones a la vez.
+
+        Con más de uno, todos pasan juntos por el encoder y el decoder de
+        CTranslate2; si esta versión de faster-whisper no lo permite, uno a uno.
+        """
+        with self.residency.use():
+            texts = None
+            if len(audios) > 1:
+                try:
+                    texts = self._generate_batch(audios)
+                except Exception as e:
+                    print(f"[STT] Lote no disponible ({e}); se transcribe uno a uno")
+            if texts is None:
+                texts = []
+                for audio in audios:
+                    segments, _ = self.model.transcribe(
+                        audio, beam_size=self.cfg.get("beam_size", 5), language=self.language, task="transcribe"
+                    )
+                    texts.append(" ".join(seg.text for seg in segments).strip())
+        return [self._detect_spelling(text) if text else "" for text in texts]
+
+    def _generate_batch(self, audios: list) -> list[str]:
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        model = self.model
+        features = np.stack([pad_or_trim(model.feature_extractor(audio)) for audio in audios])
+        encoder_output = model.encode(features)
+        tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=self.language)
+        prompt = list(tokenizer.sot_sequence) + [tokenizer.no_timestamps]
+        results = model.model.generate(
+            encoder_output,
+            [prompt] * len(audios),
+            beam_size=self.cfg.get("beam_size", 5),
+            max_length=224,
+            suppress_blank=True,
+        )
+        return [tokenizer.decode(result.sequences_ids[0]).strip() for result in results]
+
+    def _transcribe_fast(self, audio, streamer=None) -> str | None:
+        """Primera pasada con el modelo rápido; devuelve None si hay que escalar al grande.
+
+        Si acepta, para el streaming del modelo grande (sin esperarlo) antes de
+        medir: el ahorro contado es el que de verdad ve el usuario.
+        """
+        cascade = self.cascade
+        audio_s = len(audio) / self.sample_rate
+        if audio_s > cascade.max_seconds:
+            cascade.record_skip()
+            return None
+        started = time.perf_counter()
+        with tracing.span("stt.fast") as span:
+            segments, _ = self.fast_model.transcribe(
+                audio,
+                beam_size=1,
+                language=self.language,
+                task="transcribe",
+                condition_on_previous_text=False,
+                without_timestamps=True,
+            )
+            segments = list(segments)
+            text = " ".join(seg.text for seg in segments).strip()
+            tokens = sum(len(seg.tokens) for seg in segments)
+            logprob = (
+                sum(seg.avg_logprob * len(seg.tokens) for seg in segments) / tokens if tokens else float("-inf")
+            )
+            no_speech = max((seg.no_speech_prob for seg in segments), default=1.0)
+            command = bool(text) and self.command_lookup is not None and self.command_lookup(text)
+            confident = logprob >= cascade.min_logprob and no_speech <= cascade.max_no_speech
+            accepted = bool(text) and (command or confident)
+            span.update(accepted=accepted, logprob=round(logprob, 3), no_speech=round(no_speech, 3))
+            if accepted and streamer is not None:
+                streamer.cancel()
+        elapsed = time.perf_counter() - started
+        cascade.record_fast(audio_s, elapsed, accepted)
+        if accepted:
+            reason = "comando" if command else f"logprob {logprob:.2f}"
+            print(f"[STT] Cascada: modelo rápido aceptado ({reason}, {elapsed:.2f} s); {cascade.summary()}")
+            return text
+        print(f"[STT] Cascada: escalando al modelo grande (logprob {logprob:.2f}, no_speech {no_speech:.2f})")
+        return None
+
     def _detect_spelling(self, text: str) -> str:
         """Detecta deletreos letra por letra y los convierte en palabras"""
         words = text.split()
@@ -143,3 +383,200 @@ class SpeechToText:
             result_words.extend(single_letters)
         
         return " ".join(result_words)
+
+
+class CascadeStats:
+    """Umbrales y contadores de la cascada de STT.
+
+    El ahorro se estima con el tiempo real por segundo de audio que tarda el
+    modelo grande en las frases que sí escalan (media móvil).
+    """
+
+    def __init__(self, cfg: dict):
+        self.configure(cfg)
+        self.attempts = 0
+        self.hits = 0
+        self.skipped = 0
+        self.fast_s = 0.0
+        self.saved_s = 0.0
+        self.wasted_s = 0.0  # pasadas rápidas rechazadas: latencia añadida
+        self._full_rtf = None
+
+    def configure(self, cfg: dict):
+        self.max_seconds = cfg.get("cascade_max_seconds", 4.0)
+        self.min_logprob = cfg.get("cascade_min_logprob", -0.6)
+        self.max_no_speech = cfg.get("cascade_max_no_speech", 0.5)
+
+    def record_skip(self):
+        self.skipped += 1
+
+    def record_fast(self, audio_s: float, elapsed: float, accepted: bool):
+        self.attempts += 1
+        self.fast_s += elapsed
+        if accepted:
+            self.hits += 1
+            if self._full_rtf is not None:
+                self.saved_s += max(0.0, self._full_rtf * audio_s - elapsed)
+        else:
+            self.wasted_s += elapsed
+
+    def record_full(self, audio_s: float, elapsed: float):
+        if audio_s > 0:
+            rtf = elapsed / audio_s
+            self._full_rtf = rtf if self._full_rtf is None else 0.8 * self._full_rtf + 0.2 * rtf
+
+    def summary(self) -> str:
+        rate = self.hits / self.attempts if self.attempts else 0.0
+        return f"aciertos {self.hits}/{self.attempts} ({rate:.0%}), ahorro estimado {self.saved_s:.1f} s"
+
+    def prometheus_lines(self) -> list[str]:
+        return [
+            "# HELP assistant_stt_cascade_total Frases por resultado de la cascada de STT",
+            "# TYPE assistant_stt_cascade_total counter",
+            f'assistant_stt_cascade_total{{result="fast"}} {self.hits}',
+            f'assistant_stt_cascade_total{{result="escalated"}} {self.attempts - self.hits}',
+            f'assistant_stt_cascade_total{{result="skipped"}} {self.skipped}',
+            "# HELP assistant_stt_cascade_seconds Segundos ahorrados (estimados) y añadidos por la cascada",
+            "# TYPE assistant_stt_cascade_seconds counter",
+            f'assistant_stt_cascade_seconds{{kind="saved"}} {self.saved_s:.3f}',
+            f'assistant_stt_cascade_seconds{{kind="wasted"}} {self.wasted_s:.3f}',
+        ]
+
+
+class StreamingTranscriber:
+    """Transcribe en segundo plano mientras se graba.
+
+    Cada `interval` segundos decodifica el audio aún no confirmado y confirma
+    las palabras en las que coinciden dos hipótesis seguidas (local agreement).
+    Al terminar la grabación solo queda por decodificar la cola sin confirmar.
+    """
+
+    def __init__(self, model, sample_rate, language, beam_size=5, interval=1.0, stream_beam_size=1, start_after=0.0):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.language = language
+        self.beam_size = beam_size
+        self.stream_beam_size = stream_beam_size
+        self.interval = interval
+        self.min_window = int(1.0 * sample_rate)
+        self.start_after = int(start_after * sample_rate)
+        self._chunks = []
+        self._total = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._committed = []  # palabras confirmadas
+        self._commit_sample = 0  # fin (en muestras) de la última palabra confirmada
+        self._previous = []  # hipótesis anterior sin confirmar: [(palabra, fin)]
+        self._decoded_until = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def feed(self, chunk):
+        with self._lock:
+            self._chunks.append(chunk)
+            self._total += len(chunk)
+            total = self._total
+        # El hilo arranca cuando hay `start_after` de audio (0: con el primer bloque)
+        if self._thread is None and total >= self.start_after and not self._stop.is_set():
+            self.start()
+
+    def cancel(self):
+        """Descarta el resultado sin esperar: el hilo acaba solo tras la pasada en curso."""
+        self._stop.set()
+
+    def finish(self, start: int = 0, end: int | None = None) -> str:
+        """Para el hilo y decodifica solo la cola sin confirmar.
+
+        `start`/`end` delimitan la voz detectada por el VAD en el audio grabado.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        audio = self._audio()
+        tail = audio[max(self._commit_sample, start):end]
+        tail_text = ""
+        if len(tail) > 0:
+            segments, _ = self.model.transcribe(
+                tail,
+                beam_size=self.beam_size,
+                language=self.language,
+                task="transcribe",
+                initial_prompt=self._prompt(),
+            )
+            tail_text = " ".join(seg.text for seg in segments).strip()
+        if self._committed:
+            print(f"[STT] Streaming: {len(self._committed)} palabras confirmadas, cola de {len(tail) / self.sample_rate:.1f}s")
+        return " ".join(self._committed + ([tail_text] if tail_text else [])).strip()
+
+    def _audio(self):
+        with self._lock:
+            if not self._chunks:
+                return np.zeros(0, dtype=np.float32)
+            if len(self._chunks) > 1:
+                self._chunks = [np.concatenate(self._chunks)]
+            return self._chunks[0]
+
+    def _prompt(self):
+        if not self._committed:
+            return None
+        return " ".join(self._committed)[-200:]
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._step()
+            except Exception as e:
+                print(f"[STT] Error en transcripción incremental: {e}")
+                return
+
+    def _step(self):
+        audio = self._audio()
+        if len(audio) - self._commit_sample < self.min_window or len(audio) == self._decoded_until:
+            return
+        self._decoded_until = len(audio)
+        offset = self._commit_sample
+        segments, _ = self.model.transcribe(
+            audio[offset:],
+            beam_size=self.stream_beam_size,
+            language=self.language,
+            task="transcribe",
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            initial_prompt=self._prompt(),
+        )
+        words = [
+            (w.word.strip(), offset + int(w.end * self.sample_rate))
+            for seg in segments
+            for w in (seg.words or [])
+            if w.word.strip()
+        ]
+
+        agreed = 0
+        for (word, _), (prev, _) in zip(words, self._previous):
+            if _norm_word(word) != _norm_word(prev):
+                break
+            agreed += 1
+        # La última palabra puede estar cortada por el borde de la ventana
+        agreed = min(agreed, len(words) - 1)
+
+        if agreed > 0:
+            self._committed.extend(word for word, _ in words[:agreed])
+            self._commit_sample = words[agreed - 1][1]
+            self._previous = words[agreed:]
+        else:
+            self._previous = words
+
+
+def _norm_word(word: str) -> str:
+    return word.lower().strip(".,;:!?¡¿\"'")
+
+
+if __name__ == "__main__":
+    import sys
+
+    from src.stt_batch import main
+
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,217 @@
+"""Transcripción por lotes de grabaciones (WAV/FLAC) con un pool de procesos.
+
+Uso:
+    python -m src.stt batch grabaciones/ --out transcripts.jsonl
+    python -m src.stt batch grabaciones/ --beam-size 1 --silence-threshold 0.02 --workers 4 --threads 2
+
+Cada proceso carga su propio WhisperModel con `--threads` hilos de CPU; con
+faster-whisper >= 1.1 se usa `BatchedInferencePipeline`. El silencio se
+recorta con el mismo VAD que el modo en vivo, así `silence_threshold` se
+puede ajustar aquí. Cada resultado se añade al JSONL en cuanto termina; si se
+vuelve a lanzar con la misma salida, se saltan los ficheros ya hechos.
+"""
+import argparse
+import copy
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from src.config import AppConfig, load_config
+
+AUDIO_SUFFIXES = {".wav", ".flac"}
+
+# Estado de cada proceso del pool (se crea una vez en _init_worker)
+_worker = {}
+
+
+def iter_audio_files(root: Path):
+    for path in sorted(root.rglob("*")):
+        if path.suffix.lower() in AUDIO_SUFFIXES and path.is_file():
+            yield path
+
+
+def completed_paths(out_path: Path) -> set[str]:
+    """Ficheros ya transcritos sin error en una ejecución anterior."""
+    done = set()
+    if not out_path.exists():
+        return done
+    with out_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Línea cortada por una interrupción
+            if "error" not in record:
+                done.add(record["path"])
+    return done
+
+
+def trim_silence(audio, vad, pad: int):
+    """Recorta el silencio de los extremos con el VAD por tramas (como `SpeechToText.record`)."""
+    vad.reset()
+    flags = vad.process(audio)
+    speech = [i for i, is_speech in enumerate(flags) if is_speech]
+    if not speech:
+        return audio[:0]
+    start = max(0, (speech[0] - vad.onset_frames + 1) * vad.frame_len - pad)
+    end = min(len(audio), (speech[-1] + 1) * vad.frame_len + pad)
+    return audio[start:end]
+
+
+def _init_worker(config: dict, threads: int, batch_size: int):
+    import ctranslate2
+    from faster_whisper import WhisperModel
+    from src.vad import create_vad
+
+    config = AppConfig(config)
+    cfg = config.stt
+    device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    model = WhisperModel(
+        cfg["model_path"],
+        device=device,
+        local_files_only=True,
+        compute_type=cfg.get("compute_type") or ("int8" if device == "cpu" else "float16"),
+        cpu_threads=threads,
+        num_workers=1,
+    )
+    pipeline = None
+    if batch_size > 1:
+        try:
+            from faster_whisper import BatchedInferencePipeline
+
+            pipeline = BatchedInferencePipeline(model=model)
+        except ImportError:
+            pass  # faster-whisper < 1.1: inferencia secuencial
+    sample_rate = config.app.get("sample_rate", 16000)
+    _worker.update(
+        model=model,
+        pipeline=pipeline,
+        batch_size=batch_size,
+        vad=create_vad(config),
+        pad=int(cfg.get("vad_pad_ms", 200) * sample_rate / 1000),
+        sample_rate=sample_rate,
+        language=cfg.get("language", "es"),
+        beam_size=cfg.get("beam_size", 5),
+    )
+
+
+def _transcribe_file(path: str) -> dict:
+    from faster_whisper import decode_audio
+
+    w = _worker
+    record = {"path": path, "pid": os.getpid()}
+    try:
+        started = time.perf_counter()
+        audio = decode_audio(path, sampling_rate=w["sample_rate"])
+        record["duration_s"] = round(len(audio) / w["sample_rate"], 3)
+        speech = trim_silence(audio, w["vad"], w["pad"])
+        record["speech_s"] = round(len(speech) / w["sample_rate"], 3)
+        record["load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        started = time.perf_counter()
+        if len(speech) == 0:
+            text = ""
+        else:
+            kwargs = {"beam_size": w["beam_size"], "language": w["language"], "task": "transcribe"}
+            if w["pipeline"] is not None:
+                segments, _ = w["pipeline"].transcribe(speech, batch_size=w["batch_size"], **kwargs)
+            else:
+                segments, _ = w["model"].transcribe(speech, **kwargs)
+            text = " ".join(seg.text.strip() for seg in segments).strip()
+        decode_s = time.perf_counter() - started
+        record["text"] = text
+        record["decode_ms"] = round(decode_s * 1000, 1)
+        record["rtf"] = round(decode_s / record["duration_s"], 4) if record["duration_s"] else None
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def run_batch(root: Path, out_path: Path, config: AppConfig, workers: int, threads: int,
+              batch_size: int = 8, resume: bool = True) -> dict:
+    files = [str(p) for p in iter_audio_files(root)]
+    done = completed_paths(out_path) if resume else set()
+    todo = [p for p in files if p not in done]
+    print(f"[STT batch] {len(files)} ficheros, {len(files) - len(todo)} ya hechos, {len(todo)} pendientes")
+    if not todo:
+        return {"files": 0}
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    audio_s = 0.0
+    errors = 0
+    with out_path.open("a" if resume else "w", encoding="utf-8") as out, ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(dict(config), threads, batch_size)
+    ) as pool:
+        # Como mucho dos ficheros en vuelo por proceso: el audio no se acumula en memoria
+        pending = set()
+        queue = iter(todo)
+        finished = 0
+        while True:
+            while len(pending) < workers * 2:
+                path = next(queue, None)
+                if path is None:
+                    break
+                pending.add(pool.submit(_transcribe_file, path))
+            if not pending:
+                break
+            ready, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in ready:
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                finished += 1
+                if "error" in record:
+                    errors += 1
+                    print(f"[STT batch] Error en {record['path']}: {record['error']}")
+                else:
+                    audio_s += record["duration_s"]
+                if finished % 25 == 0 or finished == len(todo):
+                    print(f"[STT batch] {finished}/{len(todo)}")
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "files": len(todo),
+        "errors": errors,
+        "audio_s": round(audio_s, 1),
+        "elapsed_s": round(elapsed, 1),
+        "speedup": round(audio_s / elapsed, 2) if elapsed else None,
+    }
+    print(
+        f"[STT batch] {len(todo)} ficheros ({audio_s:.0f} s de audio) en {elapsed:.1f} s: "
+        f"{summary['speedup']}x tiempo real, {errors} errores"
+    )
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.stt", description="Herramientas del STT")
+    sub = parser.add_subparsers(dest="command", required=True)
+    batch = sub.add_parser("batch", help="transcribe una carpeta de WAV/FLAC a JSONL")
+    batch.add_argument("dir", type=Path)
+    batch.add_argument("--out", type=Path, default=Path("transcripts.jsonl"))
+    batch.add_argument("--config", default=None)
+    cpus = os.cpu_count() or 1
+    batch.add_argument("--threads", type=int, default=2, help="hilos de CPU por proceso")
+    batch.add_argument("--workers", type=int, default=None, help="procesos (por defecto, núcleos / hilos)")
+    batch.add_argument("--batch-size", type=int, default=8, help="segmentos por lote en la inferencia por lotes")
+    batch.add_argument("--beam-size", type=int, default=None)
+    batch.add_argument("--compute-type", default=None)
+    batch.add_argument("--silence-threshold", type=float, default=None)
+    batch.add_argument("--no-resume", action="store_true", help="reescribe la salida desde cero")
+    args = parser.parse_args(argv)
+
+    config = AppConfig(copy.deepcopy(dict(load_config(args.config))))
+    overrides = {
+        "beam_size": args.beam_size,
+        "compute_type": args.compute_type,
+        "silence_threshold": args.silence_threshold,
+    }
+    config.stt.update({k: v for k, v in overrides.items() if v is not None})
+    workers = args.workers or max(1, cpus // max(1, args.threads))
+    summary = run_batch(
+        args.dir, args.out, config, workers, args.threads, batch_size=args.batch_size, resume=not args.no_resume
+    )
+    return 1 if summary.get("errors") else 0
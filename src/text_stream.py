@@ -0,0 +1,93 @@
+import re
+
+
+class SentenceSegmenter:
+    """Corta el texto que llega por tokens en frases completas para el TTS."""
+
+    _END = re.compile(r"[.!?…]+[\"')»]*\s+|\n+")
+    _ABBREVIATIONS = ("sr.", "sra.", "dr.", "dra.", "etc.", "ej.", "p.ej.", "aprox.", "núm.", "pág.")
+
+    def __init__(self, min_chars: int = 12, max_chars: int = 220):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        self.buffer += text
+        sentences = []
+        search_from = 0
+        while True:
+            match = self._END.search(self.buffer, search_from)
+            if not match:
+                break
+            end = match.end()
+            candidate = self.buffer[:end].strip()
+            # No cortar dentro de un [CMD:...] / [SEARCH:...] ni tras abreviaturas
+            if (
+                self._inside_tag(self.buffer[:match.start()])
+                or len(candidate) < self.min_chars
+                or candidate.lower().endswith(self._ABBREVIATIONS)
+            ):
+                search_from = end
+                continue
+            sentences.append(candidate)
+            self.buffer = self.buffer[end:]
+            search_from = 0
+
+        # Frases muy largas sin puntuación: cortar en la última coma
+        if len(self.buffer) > self.max_chars and not self._inside_tag(self.buffer):
+            cut = self.buffer.rfind(", ")
+            if cut > self.min_chars:
+                sentences.append(self.buffer[:cut + 1].strip())
+                self.buffer = self.buffer[cut + 2:]
+        return sentences
+
+    def flush(self) -> list[str]:
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+    @staticmethod
+    def _inside_tag(text: str) -> bool:
+        return text.rfind("[") > text.rfind("]")
+
+
+class SearchTagFilter:
+    """Retira las etiquetas [SEARCH:...] de un flujo de texto y guarda las consultas."""
+
+    OPEN = "[search:"
+
+    def __init__(self):
+        self.buffer = ""
+        self.searches: list[str] = []
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        out = []
+        while True:
+            start = self.buffer.find("[")
+            if start < 0:
+                out.append(self.buffer)
+                self.buffer = ""
+                break
+            out.append(self.buffer[:start])
+            self.buffer = self.buffer[start:]
+            head = self.buffer[:len(self.OPEN)].lower()
+            if not self.OPEN.startswith(head):
+                # Otro tipo de etiqueta ([CMD:...]) o texto normal: se deja pasar
+                out.append("[")
+                self.buffer = self.buffer[1:]
+                continue
+            end = self.buffer.find("]")
+            if len(self.buffer) < len(self.OPEN) or end < 0:
+                break  # Puede ser una etiqueta incompleta, esperar más texto
+            query = self.buffer[len(self.OPEN):end].strip()
+            if query:
+                self.searches.append(query)
+            self.buffer = self.buffer[end + 1:]
+        return "".join(out)
+
+    def flush(self) -> str:
+        rest, self.buffer = self.buffer, ""
+        if rest.lower().startswith(self.OPEN):
+            return ""  # Etiqueta sin cerrar: nunca se lee en voz alta
+        return rest
@@ -0,0 +1,214 @@
+"""Trazas por turno (wake → STT → LLM → TTS) con tiempos monotónicos.
+
+Cada turno tiene un identificador de correlación. Los componentes llaman a
+`span()` y `mark()` sin saber en qué turno están: se asocian al turno del
+contexto (`contextvars`) desde el que se llaman. Tras un barge-in el turno
+anterior puede seguir terminando en su hilo mientras empieza el nuevo, así
+que cada hilo de turno tiene el suyo; los hilos auxiliares lo heredan con
+`contextvars.copy_context()` o `activate()`. Sin tracer configurado, no-ops.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+_tracer = None
+_current: contextvars.ContextVar = contextvars.ContextVar("trace_turn", default=None)
+_metrics_sources = []
+
+
+class Turn:
+    def __init__(self, started_at: float | None = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.start = started_at if started_at is not None else time.monotonic()
+        self.wall_start = datetime.now().isoformat(timespec="milliseconds")
+        self.spans = []
+        self.marks = {}
+        self.attrs = {}
+
+    def elapsed_ms(self, at: float | None = None) -> float:
+        return ((at if at is not None else time.monotonic()) - self.start) * 1000
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        started = time.monotonic()
+        record = {"name": name, "start_ms": round(self.elapsed_ms(started), 2), **attrs}
+        try:
+            yield record
+        finally:
+            record["duration_ms"] = round((time.monotonic() - started) * 1000, 2)
+            self.spans.append(record)
+
+    def mark(self, name: str, last: bool = False, **attrs):
+        # Por defecto cuenta la primera vez (primer audio); `last` guarda la última (fin de audio)
+        if last or name not in self.marks:
+            self.marks[name] = {"at_ms": round(self.elapsed_ms(), 2), **attrs}
+
+    def to_dict(self) -> dict:
+        return {
+            "turn": self.id,
+            "time": self.wall_start,
+            "duration_ms": round(self.elapsed_ms(), 2),
+            "spans": self.spans,
+            "marks": self.marks,
+            **self.attrs,
+        }
+
+
+class Tracer:
+    def __init__(self, config):
+        cfg = config.get("tracing", {})
+        self.metrics_path = Path(cfg.get("metrics_path", "logs/metrics.prom"))
+        trace_path = Path(cfg.get("path", "logs/traces.jsonl"))
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        self._log = logging.getLogger("assistant.traces")
+        self._log.propagate = False
+        self._log.setLevel(logging.INFO)
+        if not self._log.handlers:
+            handler = RotatingFileHandler(
+                trace_path,
+                maxBytes=cfg.get("max_bytes", 5 * 1024 * 1024),
+                backupCount=cfg.get("backup_count", 3),
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._log.addHandler(handler)
+        window = cfg.get("window", 500)
+        self._turns = deque(maxlen=window)
+        self._stages = defaultdict(lambda: deque(maxlen=window))
+        self._first_audio = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def finish(self, turn: Turn):
+        record = turn.to_dict()
+        self._log.info(json.dumps(record, ensure_ascii=False))
+        with self._lock:
+            self._turns.append(record["duration_ms"])
+            for span in turn.spans:
+                self._stages[span["name"]].append(span["duration_ms"])
+            if "tts.first_audio" in turn.marks:
+                self._first_audio.append(turn.marks["tts.first_audio"]["at_ms"])
+        self._write_metrics()
+        stages = ", ".join(f"{s['name']} {s['duration_ms']:.0f}" for s in turn.spans)
+        print(f"[Trace] Turno {turn.id}: {record['duration_ms']:.0f} ms ({stages})")
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            lines += _summary("assistant_turn_latency_ms", "Duración total del turno (wake → fin de audio)", self._turns, {})
+            lines += _summary("assistant_first_audio_ms", "Tiempo desde el wake hasta el primer audio", self._first_audio, {})
+            lines.append("# HELP assistant_stage_latency_ms Duración de cada etapa del turno")
+            lines.append("# TYPE assistant_stage_latency_ms summary")
+            for stage, values in sorted(self._stages.items()):
+                lines += _summary("assistant_stage_latency_ms", None, values, {"stage": stage})
+        for source in list(_metrics_sources):
+            try:
+                lines += source()
+            except Exception as e:
+                print(f"[Trace] Error en fuente de métricas: {e}")
+        return "\n".join(lines) + "\n"
+
+    def _write_metrics(self):
+        try:
+            self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.metrics_path.with_suffix(".tmp")
+            tmp.write_text(self.prometheus_text(), encoding="utf-8")
+            tmp.replace(self.metrics_path)
+        except Exception as e:
+            print(f"[Trace] No se pudieron escribir métricas: {e}")
+
+
+def _summary(name, help_text, values, labels):
+    """Líneas de un summary de Prometheus (p50/p95 sobre la ventana reciente)."""
+    lines = []
+    if help_text:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} summary")
+    ordered = sorted(values)
+    for q in (0.5, 0.95):
+        value = ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+        label = ",".join([f'{k}="{v}"' for k, v in labels.items()] + [f'quantile="{q}"'])
+        lines.append(f"{name}{{{label}}} {value:.2f}")
+    suffix = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {sum(values):.2f}")
+    lines.append(f"{name}_count{suffix} {len(values)}")
+    return lines
+
+
+def configure(config):
+    global _tracer
+    if not config.get("tracing", {}).get("enabled", True):
+        _tracer = None
+        return None
+    _tracer = Tracer(config)
+    return _tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def add_metrics_source(source):
+    """`source()` devuelve líneas Prometheus extra que se añaden a `metrics.prom`."""
+    _metrics_sources.append(source)
+
+
+def write_metrics():
+    """Reescribe `metrics.prom` fuera de un turno (p. ej. al descargar un modelo)."""
+    if _tracer is not None:
+        _tracer._write_metrics()
+
+
+def start_turn(started_at: float | None = None) -> Turn | None:
+    """Abre un turno nuevo en este contexto; `started_at` (time.monotonic) permite fecharlo en el wake."""
+    turn = Turn(started_at) if _tracer is not None else None
+    _current.set(turn)
+    return turn
+
+
+def end_turn(turn: Turn | None = None):
+    current = _current.get()
+    turn = turn or current
+    if turn is None:
+        return
+    if current is turn:
+        _current.set(None)
+    if _tracer is not None:
+        _tracer.finish(turn)
+
+
+def current_turn() -> Turn | None:
+    return _current.get()
+
+
+@contextmanager
+def activate(turn: Turn | None):
+    """Asocia a `turn` lo que se mida dentro (p. ej. en un hilo que atiende varios turnos)."""
+    token = _current.set(turn)
+    try:
+        yield turn
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    turn = _current.get()
+    if turn is None:
+        yield {}
+        return
+    with turn.span(name, **attrs) as record:
+        yield record
+
+
+def mark(name: str, last: bool = False, **attrs):
+    turn = _current.get()
+    if turn is not None:
+        turn.mark(name, last=last, **attrs)
@@ -1,50 +1,440 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout
+from pathlib import Path
+from queue import Queue
 import numpy as np
 import sounddevice as sd
-from piper.voice import PiperVoice
-import threading
+from src import tracing
+from src.audio_out import AudioOutput
+from src.tts_pool import SynthesisPool
+from src.residency import ModelSlot
+
+
+class PcmCache:
+    """Caché de audio ya sintetizado: LRU en memoria y ficheros .npy en disco.
+
+    La clave depende del modelo de voz, el hablante y el texto exacto, así que
+    cambiar de voz invalida todo sin tener que borrar nada. En disco, el orden
+    LRU es la fecha de modificación de cada fichero, que se renueva en cada
+    acierto (el atime no es fiable con `noatime`/`relatime`).
+    """
+
+    def __init__(self, cache_dir, max_memory_mb: int = 32, max_chars: int = 160, max_files: int = 2000):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_memory_mb * 1024 * 1024
+        self.max_chars = max_chars
+        self.max_files = max_files
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, text: str) -> bool:
+        return 0 < len(text) <= self.max_chars
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            pcm = self._memory.get(key)
+            if pcm is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+        path = self.cache_dir / f"{key}.npy"
+        if pcm is not None:
+            self._touch(path)
+            return pcm
+        if path.exists():
+            try:
+                pcm = np.load(path)
+                self._remember(key, pcm)
+                self._touch(path)
+                self.hits += 1
+                return pcm
+            except Exception:
+                path.unlink(missing_ok=True)
+        self.misses += 1
+        return None
+
+    def contains(self, key: str) -> bool:
+        return key in self._memory or (self.cache_dir / f"{key}.npy").exists()
+
+    def put(self, key: str, pcm: np.ndarray):
+        self._remember(key, pcm)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_dir / f"{key}.tmp.npy"
+            np.save(tmp, pcm)
+            tmp.replace(self.cache_dir / f"{key}.npy")
+            self._puts += 1
+            if self._puts % 50 == 0:
+                self._prune_disk()
+        except Exception as e:
+            print(f"[TTS] No se pudo guardar audio en caché: {e}")
+
+    def _remember(self, key, pcm):
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = pcm
+            self._bytes += pcm.nbytes
+            while self._bytes > self.max_bytes and len(self._memory) > 1:
+                _, old = self._memory.popitem(last=False)
+                self._bytes -= old.nbytes
+
+    @staticmethod
+    def _touch(path: Path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # Solo está en memoria (o se ha podado): nada que renovar
+
+    def _prune_disk(self):
+        files = sorted(self.cache_dir.glob("*.npy"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in files[self.max_files:]:
+            old.unlink(missing_ok=True)
+
+
+class Utterance:
+    """Una frase encolada en el TTS. `wait()` bloquea hasta que termina de sonar."""
+
+    def __init__(self, text: str, on_start=None, cancel=None, generation: int = 0):
+        self.text = text
+        self.on_start = on_start
+        self.cancel = cancel
+        self.generation = generation
+        self.cached = False
+        self.future = None  # síntesis en el pool de procesos, si la hay
+        self.samples = 0
+        self.start_pos = None  # posición absoluta de su primera muestra en la salida
+        self.end_pos = None  # fin, cuando ya se ha escrito entera
+        self.started_at = None
+        self.finished = threading.Event()
+        # Los hilos del TTS atienden frases de varios turnos: cada una mide en el suyo
+        self.turn = tracing.current_turn()
+
+    @property
+    def dropped(self) -> bool:
+        """Cortada por barge-in (`request_stop`) o por cancelación del turno."""
+        cancel = self.cancel
+        return self.generation != TextToSpeech._generation or (cancel is not None and cancel.cancelled)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.finished.wait(timeout)
 
 
 class TextToSpeech:
     stop_event = threading.Event()
+    # Cada request_stop() invalida todo lo encolado antes
+    _generation = 0
+    _instances = []
 
-    def __init__(self, config):
+    def __init__(self, config, sink=None, playback: bool = True):
+        """`sink(sample_rate, blocksize, callback)` crea el stream de salida; por defecto, la tarjeta de sonido.
+
+        Con `playback=False` (modo servidor) no se abre la salida al arrancar; solo se usa `synthesize`.
+        """
         cfg = config.tts
-        self.voice = PiperVoice.load(cfg["voice_path"])
+        self.sink = sink or _sound_card
+        self.voice_path = cfg["voice_path"]
+        self.voice = None
+        self.output_rate = None
         self.sample_rate = cfg.get("sample_rate", 22050)
         self.speaker = cfg.get("speaker")
+        self.cache = None
+        if cfg.get("cache", True):
+            self.voice_id = _file_digest(Path(cfg["voice_path"]))
+            self.cache = PcmCache(
+                Path(cfg.get("cache_dir", "cache/tts")) / self.voice_id[:16],
+                max_memory_mb=cfg.get("cache_memory_mb", 32),
+                max_chars=cfg.get("cache_max_chars", 160),
+            )
+        self.buffer_seconds = cfg.get("output_buffer_seconds", 10)
+        self.block_ms = cfg.get("output_block_ms", 20)
+        self.workers = max(1, int(cfg.get("workers", 1)))
+        self.worker_threads = cfg.get("worker_threads", 1)
+        self.pool = None
+        self.output = None
+        self._output_lock = threading.Lock()
+        self._queue: Queue = Queue()
+        self._playing: list[Utterance] = []
+        self._playing_lock = threading.Lock()
+        self._wake_watcher = threading.Event()
+        self.residency = ModelSlot("TTS", self._load_voice, self._unload_voice, self._warm_up, config)
+        self.residency.load()
+        TextToSpeech._instances.append(self)
+        tracing.add_metrics_source(self.prometheus_lines)
+        threading.Thread(target=self._synth_loop, daemon=True, name="tts-synth").start()
+        threading.Thread(target=self._watch_loop, daemon=True, name="tts-playback").start()
+        if playback:
+            try:
+                self._ensure_output()
+            except Exception as e:
+                print(f"[TTS] No se pudo abrir la salida de audio (se reintenta al hablar): {e}")
 
-    def speak(self, text: str):
-        self.stop_event.clear()
+    def _load_voice(self):
+        from piper.voice import PiperVoice
+
+        self.voice = PiperVoice.load(self.voice_path)
+        # Se conserva al descargar: el audio cacheado se reproduce sin recargar la voz
+        self.output_rate = self.voice.config.sample_rate
+        if self.workers > 1:
+            self.pool = SynthesisPool(self.voice_path, self.workers, self.worker_threads)
+
+    def _unload_voice(self):
+        self.voice = None
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def _warm_up(self):
+        for _ in self.voice.synthesize("Hola."):
+            pass
+        if self.pool is not None:
+            self.pool.warm_up()
 
-        # Streaming playback to allow interruption
-        def gen_audio():
-            for audio_chunk in self.voice.synthesize(text):
-                if self.stop_event.is_set():
-                    break
-                if audio_chunk is not None:
-                    yield audio_chunk.audio_int16_array
+    def _ensure_output(self) -> AudioOutput:
+        with self._output_lock:
+            if self.output is None:
+                output = AudioOutput(self.output_rate, self.sink, self.buffer_seconds, self.block_ms)
+                output.start()
+                self.output = output
+                print(f"[TTS] Salida de audio abierta ({self.output_rate} Hz, bloques de {self.block_ms} ms)")
+            return self.output
 
-        stream = sd.OutputStream(
-            samplerate=self.voice.config.sample_rate,
-            channels=1,
-            dtype="int16",
-        )
+    def speak(self, text: str, on_start=None, cancel=None):
+        """Reproduce `text` y espera a que termine. `on_start` se llama al empezar a sonar.
 
+        Con `cancel` (CancelToken) la reproducción se corta en un bloque de
+        salida (`tts.output_block_ms`) cuando se cancela el turno.
+        """
+        self.enqueue(text, on_start=on_start, cancel=cancel).wait()
+
+    def enqueue(self, text: str, on_start=None, cancel=None) -> Utterance:
+        """Encola `text` sin esperar: se sintetiza por delante mientras suena lo anterior."""
+        utterance = Utterance(text, on_start, cancel, TextToSpeech._generation)
+        if cancel is not None and cancel.cancelled:
+            utterance.finished.set()
+            return utterance
+        self.stop_event.clear()
         try:
-            with stream:
-                for chunk in gen_audio():
-                    if chunk is None or len(chunk) == 0:
-                        continue
-                    if self.stop_event.is_set():
-                        break
-                    stream.write(chunk.reshape(-1, 1))
+            self._ensure_output()
         except Exception as e:
             print(f"[TTS] Error: {e}")
+            utterance.finished.set()
+            return utterance
+        with self._playing_lock:
+            # La primera frase se sintetiza aquí, a trozos (primer audio antes); las que
+            # esperan detrás de otra se mandan ya al pool y se generan en paralelo
+            if self._playing and self.pool is not None and not self._in_cache(text):
+                utterance.future = self.pool.submit(text)
+            self._playing.append(utterance)
+        self._queue.put(utterance)
+        self._wake_watcher.set()
+        return utterance
+
+    def _synth_loop(self):
+        while True:
+            utterance = self._queue.get()
+            output = self.output
+            try:
+                if not utterance.dropped:
+                    if output.muted:
+                        output.resume()
+                    with tracing.activate(utterance.turn):
+                        self._render(utterance, output)
+            except Exception as e:
+                print(f"[TTS] Error: {e}")
+            finally:
+                output.mid_utterance = False
+                utterance.end_pos = output.ring.written
+
+    def _render(self, utterance: Utterance, output: AudioOutput):
+        text = utterance.text
+        key = self._cache_key(text)
+        cached = self.cache.get(key) if key else None
+        utterance.cached = cached is not None
+
+        def stopped():
+            return utterance.dropped
+
+        def write(pcm):
+            if utterance.start_pos is None:
+                utterance.start_pos = output.ring.written
+            utterance.samples += len(pcm)
+            ok = output.write(pcm, stopped)
+            output.mid_utterance = True
+            return ok
+
+        with tracing.span("tts.synthesize", chars=len(text), cached=cached is not None,
+                          parallel=utterance.future is not None):
+            if cached is not None:
+                write(cached)
+                return
+            pcm = self._pool_result(utterance) if utterance.future is not None else None
+            if pcm is not None:
+                if len(pcm) and write(pcm) and key:
+                    self.cache.put(key, pcm)
+                return
+            if utterance.dropped:
+                return
+            collected = [] if key else None
+            # Solo hace falta la voz si hay que sintetizar
+            with self.residency.use():
+                for audio_chunk in self.voice.synthesize(text):
+                    if audio_chunk is None:
+                        continue
+                    pcm = audio_chunk.audio_int16_array
+                    if len(pcm) == 0:
+                        continue
+                    if not write(pcm):
+                        return
+                    if collected is not None:
+                        collected.append(pcm)
+            if collected:
+                self.cache.put(key, np.concatenate(collected))
+
+    def _pool_result(self, utterance: Utterance) -> np.ndarray | None:
+        """PCM de la frase sintetizada en el pool; None si se cancela o falla (se hace aquí)."""
+        future = utterance.future
+        while True:
+            if utterance.dropped:
+                future.cancel()
+                return None
+            try:
+                return future.result(timeout=self.block_ms / 1000)
+            except FutureTimeout:
+                continue
+            except Exception as e:
+                print(f"[TTS] Error en el pool de síntesis, se sintetiza aquí: {e}")
+                return None
+
+    def _in_cache(self, text: str) -> bool:
+        key = self._cache_key(text)
+        return key is not None and self.cache.contains(key)
+
+    def _watch_loop(self):
+        """Sigue el punto de reproducción: avisa del inicio y del fin de cada frase y aplica los cortes."""
+        while True:
+            with self._playing_lock:
+                playing = list(self._playing)
+            if not playing:
+                self._wake_watcher.wait()
+                self._wake_watcher.clear()
+                continue
+            output = self.output
+            played = output.played
+            done = []
+            for utterance in playing:
+                if utterance.dropped:
+                    output.interrupt()
+                    if utterance.future is not None:
+                        utterance.future.cancel()
+                    done.append(utterance)
+                    continue
+                if utterance.started_at is None and utterance.start_pos is not None and played > utterance.start_pos:
+                    utterance.started_at = time.perf_counter()
+                    if utterance.turn is not None:
+                        utterance.turn.mark("tts.first_audio")
+                    if utterance.on_start is not None:
+                        try:
+                            utterance.on_start()
+                        except Exception as e:
+                            print(f"[TTS] Error en on_start: {e}")
+                if utterance.end_pos is not None and played >= utterance.end_pos:
+                    done.append(utterance)
+            if done:
+                with self._playing_lock:
+                    self._playing = [u for u in self._playing if u not in done]
+                for utterance in done:
+                    if not utterance.dropped and utterance.turn is not None:
+                        utterance.turn.mark("tts.playback_end", last=True)
+                    utterance.finished.set()
+            time.sleep(self.block_ms / 2000)
+
+    def stats(self) -> dict:
+        stats = self.output.stats() if self.output is not None else {}
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def prometheus_lines(self) -> list[str]:
+        if self.output is None:
+            return []
+        stats = self.output.stats()
+        return [
+            "# HELP assistant_tts_underruns_total Veces que la salida se quedó sin audio a mitad de una frase",
+            "# TYPE assistant_tts_underruns_total counter",
+            f"assistant_tts_underruns_total {stats['underruns']}",
+            "# HELP assistant_tts_buffer_ms Audio sintetizado pendiente de reproducir",
+            "# TYPE assistant_tts_buffer_ms gauge",
+            f"assistant_tts_buffer_ms {stats['depth_ms']}",
+            f"assistant_tts_buffer_max_ms {stats['max_depth_ms']}",
+        ]
+
+    def synthesize(self, text: str) -> np.ndarray:
+        """Sintetiza `text` completo a PCM int16 (usando la caché si está)."""
+        key = self._cache_key(text)
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        with self.residency.use():
+            chunks = [c.audio_int16_array for c in self.voice.synthesize(text) if c is not None]
+        pcm = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+        if key and len(pcm):
+            self.cache.put(key, pcm)
+        return pcm
+
+    def prerender(self, phrases):
+        """Sintetiza en segundo plano las frases fijas que aún no estén en caché."""
+        if self.cache is None:
+            return
+
+        def work():
+            rendered = 0
+            for text in dict.fromkeys(phrases):
+                key = self._cache_key(text)
+                if not key or self.cache.contains(key):
+                    continue
+                try:
+                    self.synthesize(text)
+                    rendered += 1
+                except Exception as e:
+                    print(f"[TTS] Error pre-renderizando '{text}': {e}")
+            if rendered:
+                print(f"[TTS] Pre-renderizadas {rendered} frases")
+
+        threading.Thread(target=work, daemon=True, name="tts-prerender").start()
+
+    def _cache_key(self, text: str) -> str | None:
+        if self.cache is None or not self.cache.cacheable(text):
+            return None
+        raw = f"{self.voice_id}|{self.speaker}|{text}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()[:32]
 
     @classmethod
     def request_stop(cls):
         cls.stop_event.set()
-        try:
-            sd.stop()
-        except Exception:
-            pass
+        cls._generation += 1
+        # El stream sigue abierto: solo se descarta lo que quedaba por sonar
+        for tts in cls._instances:
+            if tts.output is not None:
+                tts.output.interrupt()
+
+
+def _sound_card(sample_rate: int, blocksize: int, callback):
+    return sd.OutputStream(samplerate=sample_rate, channels=1, dtype="int16", blocksize=blocksize, callback=callback)
+
+
+def _file_digest(path: Path) -> str:
+    """Identifica la voz por ruta, tamaño y fecha: sin leer el .onnx entero en cada arranque."""
+    digest = hashlib.sha256()
+    for part in (path, path.with_suffix(path.suffix + ".json")):
+        if part.exists():
+            st = part.stat()
+            digest.update(f"{part.resolve()}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Voz cargada en cada proceso del pool (una por proceso, se carga en _init_worker)
+_voice = None
+
+
+def _init_worker(voice_path: str, threads: int):
+    global _voice
+    from piper.voice import PiperVoice
+
+    _voice = PiperVoice.load(voice_path)
+    if threads and hasattr(_voice, "session"):
+        # onnxruntime usa todos los núcleos por sesión: con varios procesos se pisarían
+        try:
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+            _voice.session = onnxruntime.InferenceSession(
+                voice_path, sess_options=options, providers=["CPUExecutionProvider"]
+            )
+        except Exception as e:
+            print(f"[TTS] Proceso {os.getpid()}: sin límite de hilos para la voz ({e})")
+
+
+def _synthesize(text: str) -> np.ndarray:
+    chunks = [c.audio_int16_array for c in _voice.synthesize(text) if c is not None]
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+
+
+class SynthesisPool:
+    """Procesos con su propia voz de Piper para sintetizar varias frases a la vez.
+
+    Piper ejecuta cada frase en un solo núcleo; con el pool, las frases que
+    esperan turno se generan en paralelo mientras suena la actual. Cada
+    resultado es el PCM int16 completo de la frase.
+    """
+
+    def __init__(self, voice_path: str, workers: int, threads: int = 1):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(str(voice_path), threads)
+        )
+
+    def submit(self, text: str):
+        return self._executor.submit(_synthesize, text)
+
+    def warm_up(self):
+        # Una frase por proceso: arranca todos y carga la voz en cada uno
+        for future in [self.submit("Hola.") for _ in range(self.workers)]:
+            future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,11 +1,13 @@
-import json
 from pathlib import Path
 from datetime import datetime
+from src.memory_store import create_store
 
 
 class UserMemory:
-    def __init__(self, data_path="data.json"):
+    def __init__(self, data_path="data.json", store_config: dict | None = None):
+        """Los cambios se guardan en segundo plano (ver `src.memory_store`)."""
         self.data_path = Path(data_path)
+        self.store = create_store(store_config or {}, self.data_path)
         self.data = self._load()
         self.onboarding_questions = [
             ("name", "¿Cómo te llamas?"),
@@ -18,12 +20,10 @@ class UserMemory:
         self.current_question_index = 0
     
     def _load(self):
-        if not self.data_path.exists():
-            return self._default_data()
         try:
-            with open(self.data_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
+            return self.store.load(self._default_data())
+        except Exception as e:
+            print(f"[Memory] No se pudo cargar la memoria: {e}")
             return self._default_data()
     
     def _default_data(self):
@@ -43,9 +43,16 @@ class UserMemory:
         }
     
     def save(self):
-        self.data["system"]["last_updated"] = datetime.now().isoformat()
-        with open(self.data_path, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        """Fuerza la escritura de lo pendiente (normalmente lo hace el hilo escritor)."""
+        self.store.flush()
+
+    def _set(self, section: str, field: str, value):
+        # Solo memoria + cola: el disco lo toca el hilo escritor
+        self.data.setdefault(section, {})[field] = value
+        self.store.record([section, field], value)
+        now = datetime.now().isoformat()
+        self.data["system"]["last_updated"] = now
+        self.store.record(["system", "last_updated"], now)
     
     def is_complete(self):
         """Verifica si los datos básicos están completos"""
@@ -73,8 +80,7 @@ class UserMemory:
             # Para interests, convertir a lista
             if field == "interests" and isinstance(value, str):
                 value = [item.strip() for item in value.split(",") if item.strip()]
-            self.data["user"][field] = value
-            self.save()
+            self._set("user", field, value)
             return True
         return False
     
@@ -96,5 +102,4 @@ class UserMemory:
         return "\n".join(parts) if parts else ""
     
     def increment_interactions(self):
-        self.data["system"]["interaction_count"] = self.data["system"].get("interaction_count", 0) + 1
-        self.save()
+        self._set("system", "interaction_count", self.data["system"].get("interaction_count", 0) + 1)
@@ -0,0 +1,131 @@
+from pathlib import Path
+import numpy as np
+
+
+class FrameVad:
+    """Detector de voz por tramas con histéresis.
+
+    Las subclases solo implementan `_raw(frames)`, que recibe una matriz
+    (n_tramas, frame_len) y devuelve un booleano por trama. Aquí se añade el
+    arranque (onset) y la cola (hangover) para no cortar entre palabras.
+    """
+
+    def __init__(self, sample_rate: int, frame_len: int, hangover_ms: int = 300, onset_ms: int = 60):
+        self.sample_rate = sample_rate
+        self.frame_len = frame_len
+        self.frame_ms = frame_len * 1000 / sample_rate
+        self.hangover_frames = max(0, int(round(hangover_ms / self.frame_ms)))
+        self.onset_frames = max(1, int(round(onset_ms / self.frame_ms)))
+        self.reset()
+
+    def reset(self):
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._triggered = False
+        self._speech_run = 0
+        self._hangover = 0
+
+    def process(self, audio: np.ndarray) -> list[bool]:
+        """Devuelve la decisión suavizada de cada trama completa de `audio`."""
+        audio = np.concatenate([self._pending, audio.astype(np.float32, copy=False)])
+        n_frames = len(audio) // self.frame_len
+        self._pending = audio[n_frames * self.frame_len:]
+        if n_frames == 0:
+            return []
+        frames = audio[: n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        flags = []
+        for is_speech in self._raw(frames):
+            if is_speech:
+                self._speech_run += 1
+                self._hangover = self.hangover_frames
+                if self._speech_run >= self.onset_frames:
+                    self._triggered = True
+            else:
+                self._speech_run = 0
+                if self._triggered:
+                    if self._hangover > 0:
+                        self._hangover -= 1
+                    else:
+                        self._triggered = False
+            flags.append(self._triggered)
+        return flags
+
+    def _raw(self, frames: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class EnergyVad(FrameVad):
+    """Energía RMS + tasa de cruces por cero, calculadas para todas las tramas a la vez."""
+
+    def __init__(self, sample_rate, frame_len, threshold=0.02, zcr_max=0.35, **kwargs):
+        self.threshold = threshold
+        self.zcr_max = zcr_max
+        super().__init__(sample_rate, frame_len, **kwargs)
+
+    def _raw(self, frames):
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        # ZCR alta con poca energía suele ser ruido; con mucha energía es voz (fricativas)
+        return (rms >= self.threshold) & ((zcr <= self.zcr_max) | (rms >= 3 * self.threshold))
+
+
+class SileroVad(FrameVad):
+    """Silero VAD en ONNX Runtime (CPU). Ventanas de 512 muestras a 16 kHz."""
+
+    def __init__(self, model_path, sample_rate, threshold=0.6, **kwargs):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = 1
+        opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(model_path), sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.threshold = threshold
+        self._sr = np.array(sample_rate, dtype=np.int64)
+        super().__init__(sample_rate, 512 if sample_rate == 16000 else 256, **kwargs)
+
+    def reset(self):
+        super().reset()
+        # v5 usa un único tensor "state"; v4 usa "h" y "c"
+        self._state = np.zeros((2, 1, 128), dtype=np.float32)
+        self._h = np.zeros((2, 1, 64), dtype=np.float32)
+        self._c = np.zeros((2, 1, 64), dtype=np.float32)
+
+    def _raw(self, frames):
+        out = np.empty(len(frames), dtype=bool)
+        for i, frame in enumerate(frames):
+            feeds = {"input": frame[np.newaxis, :], "sr": self._sr}
+            if "state" in self.input_names:
+                feeds["state"] = self._state
+                prob, self._state = self.session.run(None, feeds)
+            else:
+                feeds["h"], feeds["c"] = self._h, self._c
+                prob, self._h, self._c = self.session.run(None, feeds)
+            out[i] = float(prob[0][0]) >= self.threshold
+        return out
+
+
+def create_vad(config) -> FrameVad:
+    cfg = config.stt
+    sample_rate = config.app.get("sample_rate", 16000)
+    frame_len = int(sample_rate * config.app.get("chunk_ms", 30) / 1000)
+    if cfg.get("vad", True):
+        smoothing = {"hangover_ms": cfg.get("vad_hangover_ms", 300), "onset_ms": cfg.get("vad_onset_ms", 60)}
+    else:
+        smoothing = {"hangover_ms": 0, "onset_ms": 0}
+
+    if cfg.get("vad", True) and cfg.get("vad_engine", "energy") == "silero":
+        model_path = Path(cfg.get("vad_model_path", "models/vad/silero_vad.onnx"))
+        try:
+            vad = SileroVad(model_path, sample_rate, threshold=cfg.get("vad_threshold", 0.6), **smoothing)
+            print(f"[VAD] Silero ONNX activo ({model_path.name})")
+            return vad
+        except Exception as e:
+            print(f"[VAD] No se pudo cargar Silero ({e}); usando VAD por energía")
+
+    # Umbral más alto que el de silencio para detectar habla real. Es RMS, no una
+    # probabilidad: `stt.vad_threshold` (la de Silero) no se aplica aquí
+    threshold = cfg.get("silence_threshold", 0.01) * 2
+    zcr_max = 0.35 if cfg.get("vad", True) else 1.0
+    print(f"[VAD] Energía activo (umbral RMS {threshold:.3f} = 2 × stt.silence_threshold)")
+    return EnergyVad(sample_rate, frame_len, threshold=threshold, zcr_max=zcr_max, **smoothing)
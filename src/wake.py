@@ -1,22 +1,34 @@
 import threading
-import struct
+import time
 from pathlib import Path
 import keyboard
+import numpy as np
 import sounddevice as sd
 from queue import Queue
+from src.ring_buffer import RingBuffer
 from src.tts import TextToSpeech
 
 
 class WakeController:
-    def __init__(self, config, events: Queue, sound_player):
+    def __init__(self, config, events: Queue, sound_player, bus=None, ready: threading.Event | None = None):
         self.hotkey = config.app.get("hotkey", "F9")
         self.porcupine_key = config.app.get("porcupine_access_key", "")
         self.porcupine_kw = Path(config.app.get("porcupine_keyword_path", ""))
         self.wake_word = config.app.get("wake_word", "").strip().lower()
         self.events = events
         self.sound_player = sound_player
+        self.bus = bus
+        self.ready = ready
         self.stop_event = threading.Event()
         self._porcupine = None
+        self._stats = {
+            "frames": 0,
+            "dropped_frames": 0,
+            "status_errors": 0,
+            "callback_calls": 0,
+            "callback_total_ms": 0.0,
+            "callback_max_ms": 0.0,
+        }
 
         if self.porcupine_key:
             keyword_paths = []
@@ -50,26 +62,60 @@ class WakeController:
             threading.Thread(target=self._run_porcupine, daemon=True).start()
         self.stop_event.wait()
 
-    def _trigger(self):
+    def _trigger(self, position: int | None = None):
         # Si está sonando TTS, solicitar parada
         TextToSpeech.request_stop()
-        self.events.put({"type": "wake"})
+        if position is None and self.bus is not None:
+            position = self.bus.position
+        # `position`: muestra del bus donde acabó el wake; el STT empieza ahí menos el pre-roll
+        self.events.put({"type": "wake", "position": position, "time": time.monotonic()})
+        if self.ready is not None and not self.ready.is_set():
+            # El wake queda en cola; el bus guarda el audio hasta que el pipeline lo procese
+            print("[Wake] Modelos aún cargando; el wake se atenderá en cuanto estén listos")
+            self.sound_player.play_loading()
+            return
         self.sound_player.play_listening()
 
+    def stats(self) -> dict:
+        """Contadores del hilo de audio del wake-word."""
+        if self.bus is not None:
+            stats = self.bus.stats()
+            stats.update(frames=self._stats["frames"], dropped_frames=self._stats["dropped_frames"])
+            return stats
+        stats = dict(self._stats)
+        calls = stats.pop("callback_calls")
+        stats["callback_avg_ms"] = stats.pop("callback_total_ms") / calls if calls else 0.0
+        stats["callbacks"] = calls
+        return stats
+
     def _run_porcupine(self):
         porcupine = self._porcupine
         frame_len = porcupine.frame_length
         sample_rate = porcupine.sample_rate
 
+        if self.bus is not None:
+            if self.bus.sample_rate == sample_rate:
+                self._detect_loop(self.bus.subscribe(), frame_len, shared=True)
+                return
+            print(f"[Wake] El bus captura a {self.bus.sample_rate} Hz y Porcupine necesita {sample_rate} Hz; abriendo stream propio")
+
+        # ~2 s de margen para que el hilo de detección nunca frene al de audio
+        ring = RingBuffer(frame_len * 64)
+        reader = ring.reader()
+        stats = self._stats
+
         def callback(indata, frames, _time, status):
+            started = time.perf_counter()
             if status:
-                return
-            pcm = struct.unpack_from(
-                "h" * frame_len, indata[: frame_len * 2]
-            )
-            result = porcupine.process(pcm)
-            if result >= 0:
-                self._trigger()
+                stats["status_errors"] += 1
+            ring.write(np.frombuffer(indata, dtype=np.int16))
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats["callback_calls"] += 1
+            stats["callback_total_ms"] += elapsed_ms
+            if elapsed_ms > stats["callback_max_ms"]:
+                stats["callback_max_ms"] = elapsed_ms
+
+        threading.Thread(target=self._detect_loop, args=(reader, frame_len), daemon=True).start()
 
         with sd.RawInputStream(
             samplerate=sample_rate,
@@ -79,3 +125,14 @@ class WakeController:
             callback=callback,
         ):
             self.stop_event.wait()
+
+    def _detect_loop(self, reader, frame_len, shared=False):
+        porcupine = self._porcupine
+        while not self.stop_event.is_set():
+            frame = reader.read(frame_len, timeout=0.5)
+            if frame is None:
+                continue
+            self._stats["frames"] += 1
+            self._stats["dropped_frames"] = reader.lost // frame_len
+            if porcupine.process(frame.tolist()) >= 0:
+                self._trigger(reader.position if shared else None)
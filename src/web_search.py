@@ -1,41 +1,178 @@
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+from src.cancellation import check
+
+
+def normalize_query(query: str) -> str:
+    text = unicodedata.normalize("NFKC", query).casefold()
+    text = re.sub(r"[¿?¡!.,;:\"']", " ", text)
+    return " ".join(text.split())
+
+
+class SearchCache:
+    """Caché persistente en SQLite con caducidad (TTL) y expulsión LRU."""
+
+    def __init__(self, path, ttl_seconds: float = 6 * 3600, max_entries: int = 500):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM results WHERE key = ? AND created > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._db.execute("DELETE FROM results WHERE created <= ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
 
 
 class WebSearch:
-    def __init__(self):
+    def __init__(self, cfg=None, url: str | None = None):
+        cfg = cfg or {}
+        self.url = url or cfg.get("search_url", "https://html.duckduckgo.com/html/")
+        self.timeout = cfg.get("search_timeout", 5)
+        self.deadline = cfg.get("search_deadline", 6)
+        workers = cfg.get("search_workers", 4)
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
         }
-    
+        # Sesión con keep-alive: las búsquedas siguientes reutilizan la conexión TLS
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.cache = None
+        if cfg.get("search_cache", True):
+            self.cache = SearchCache(
+                cfg.get("search_cache_path", "cache/search.sqlite3"),
+                ttl_seconds=cfg.get("search_cache_ttl", 6 * 3600),
+                max_entries=cfg.get("search_cache_max", 500),
+            )
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
     def search(self, query: str, max_results: int = 3) -> str:
         """Busca en DuckDuckGo y devuelve resumen de resultados"""
+        key = f"{max_results}|{normalize_query(query)}"
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                print(f"[WebSearch] Caché: '{query}'")
+                return cached
+
+        # Si la misma consulta ya está en vuelo, se espera a su resultado
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            print(f"[WebSearch] Esperando consulta en curso: '{query}'")
+            return future.result()
+
+        result = "No se encontraron resultados relevantes."
+        try:
+            result, ok = self._fetch(query, max_results)
+            if ok and self.cache is not None:
+                self.cache.put(key, result)
+        except Exception as e:
+            print(f"[WebSearch] Error de caché: {e}")
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(result)
+        return result
+
+    def search_many(self, queries: list[str], max_results: int = 3, deadline: float | None = None,
+                    cancel=None) -> list[str]:
+        """Lanza las consultas en paralelo; las que no acaben antes de `deadline` se dan por fallidas.
+
+        Si `cancel` se activa, deja de esperar y lanza `Cancelled`; las
+        peticiones en vuelo terminan en segundo plano y quedan en la caché.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        futures = [self._executor.submit(self.search, q, max_results) for q in queries]
+        if cancel is None:
+            wait(futures, timeout=deadline)
+        else:
+            end = time.monotonic() + deadline
+            pending = set(futures)
+            while pending and not cancel.cancelled and time.monotonic() < end:
+                _, pending = wait(pending, timeout=min(0.05, max(0.0, end - time.monotonic())))
+            check(cancel)
+        results = []
+        for query, future in zip(queries, futures):
+            if future.done():
+                results.append(future.result())
+            else:
+                print(f"[WebSearch] Sin respuesta a tiempo: '{query}'")
+                results.append("No se obtuvieron resultados a tiempo.")
+        return results
+
+    def _fetch(self, query: str, max_results: int) -> tuple[str, bool]:
         print(f"[WebSearch] Buscando: '{query}'")
         try:
-            url = "https://html.duckduckgo.com/html/"
             params = {"q": query}
-            response = requests.post(url, data=params, headers=self.headers, timeout=5)
+            response = self.session.post(self.url, data=params, timeout=self.timeout)
             response.raise_for_status()
-            
+
             soup = BeautifulSoup(response.text, "html.parser")
             results = []
-            
+
             for result in soup.select(".result")[:max_results]:
                 title_elem = result.select_one(".result__title")
                 snippet_elem = result.select_one(".result__snippet")
-                
+
                 if title_elem and snippet_elem:
                     title = title_elem.get_text(strip=True)
                     snippet = snippet_elem.get_text(strip=True)
                     results.append(f"{title}: {snippet}")
-            
+
             if not results:
                 print("[WebSearch] No se encontraron resultados")
-                return "No se encontraron resultados relevantes."
-            
+                return "No se encontraron resultados relevantes.", False
+
             print(f"[WebSearch] Encontrados {len(results)} resultados")
-            return "\n\n".join(results)
-        
+            return "\n\n".join(results), True
+
         except Exception as e:
             print(f"[WebSearch] Error: {e}")
-            return f"Error al buscar: {e}"
+            return f"Error al buscar: {e}", False